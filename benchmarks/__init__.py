@@ -0,0 +1,6 @@
+"""
+Offline benchmarks of the samplers.
+
+Run `python -m benchmarks.run --output result.json` to sweep the parameters of the samplers
+with `BenchmarkChatModel`, and `python -m benchmarks.compare old.json new.json` to compare results.
+"""
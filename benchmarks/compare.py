@@ -0,0 +1,70 @@
+"""
+Compares two results of `benchmarks.run`.
+
+    python -m benchmarks.compare old.json new.json --max-slowdown 0.2
+
+The exit code is 1 if items/sec of any case drops by more than `--max-slowdown`.
+"""
+
+import argparse
+import json
+import sys
+from typing import Any
+
+
+def _case_key(result: dict[str, Any]) -> str:
+    return json.dumps([result["sampler"], result["params"]], sort_keys=True)
+
+
+def _ratio(new: float | None, old: float | None) -> float | None:
+    if new is None or not old:
+        return None
+    return new / old
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("old")
+    parser.add_argument("new")
+    parser.add_argument("--max-slowdown", type=float, default=None)
+    args = parser.parse_args()
+
+    with open(args.old, encoding="utf-8") as f:
+        old_results = {_case_key(r): r for r in json.load(f)["results"]}
+    with open(args.new, encoding="utf-8") as f:
+        new_results = json.load(f)["results"]
+
+    regressed = False
+    for new in new_results:
+        old = old_results.get(_case_key(new))
+        if old is None:
+            continue
+        speed = _ratio(new["items_per_sec"], old["items_per_sec"])
+        calls = _ratio(new["llm_calls_per_item"], old["llm_calls_per_item"])
+        tokens = _ratio(new["tokens_per_item"], old["tokens_per_item"])
+        memory = _ratio(new["peak_memory_bytes"], old["peak_memory_bytes"])
+        print(
+            f"{new['sampler']} {new['params']}: "
+            + ", ".join(
+                f"{name} x{value:.2f}" if value is not None else f"{name} -"
+                for name, value in [
+                    ("items/sec", speed),
+                    ("calls/item", calls),
+                    ("tokens/item", tokens),
+                    ("peak memory", memory),
+                ]
+            )
+        )
+        if (
+            args.max_slowdown is not None
+            and speed is not None
+            and speed < 1 - args.max_slowdown
+        ):
+            regressed = True
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import json
+import random
+from typing import Any
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.pydantic_v1 import PrivateAttr
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+
+class SimulatedProviderError(ConnectionError):
+    """transient error raised by `BenchmarkChatModel` (retried by `RetryPolicy`)"""
+
+
+class BenchmarkChatModel(FakeSamplerChatModel):
+    """
+    `FakeSamplerChatModel` which fails and answers malformed outputs at random.
+
+    A call raises `SimulatedProviderError` with probability `failure_rate`.
+    Otherwise, with probability `malformed_rate`, a numbered list loses a line
+    or is wrapped in a preamble and a code fence with `N)` numbering,
+    and a structured output (or one object of a chunk) loses a required field.
+    With probability `tail_rate`, a call is slower by `tail_latency` seconds
+    (a straggler of the latency distribution).
+    With probability `broken_json_rate`, a structured output is answered as broken JSON
+    (in a code fence, with a trailing comma, without its closing brackets,
+    or cut off in its last string value) which is not parsed as a tool call.
+    The randomness is reproducible by `seed`.
+    """
+
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    tail_rate: float = 0.0
+    tail_latency: float = 0.0
+    broken_json_rate: float = 0.0
+    seed: int = 0
+    _rng: random.Random = PrivateAttr()
+
+    def __init__(self, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._rng = random.Random(self.seed)
+
+    def _call_latency(self) -> float:
+        if self.tail_rate and self._rng.random() < self.tail_rate:
+            return self.latency + self.tail_latency
+        return self.latency
+
+    def _respond(
+        self,
+        messages: list[BaseMessage],
+        tools: list[dict[str, Any]] | None = None,
+        **kwargs: Any,
+    ) -> AIMessage:
+        if self._rng.random() < self.failure_rate:
+            raise SimulatedProviderError("simulated provider error")
+        message = super()._respond(messages, tools=tools, **kwargs)
+        if (
+            self.broken_json_rate
+            and message.tool_calls
+            and self._rng.random() < self.broken_json_rate
+        ):
+            return self._break_json(message)
+        if self._rng.random() >= self.malformed_rate:
+            return message
+        if message.tool_calls:
+            tool_call = message.tool_calls[0]
+            args = json.loads(json.dumps(tool_call["args"]))
+            elements = next(iter(args.values()), None)
+            if isinstance(elements, list) and elements:
+                # a chunk of objects loses a field of one of them
+                target = elements[self._rng.randrange(len(elements))]
+            else:
+                target = args
+            if target:
+                target.pop(next(iter(target)))
+            return AIMessage("", tool_calls=[{**tool_call, "args": args}])
+        lines = str(message.content).splitlines()
+        if len(lines) <= 1:
+            return message
+        if self._rng.random() < 0.5:
+            lines.pop(self._rng.randrange(len(lines)))
+            return AIMessage("\n".join(lines))
+        return AIMessage(
+            "Sure! Here are the examples.\n```\n"
+            + "\n".join(line.replace(".", ")", 1) for line in lines)
+            + "\n```"
+        )
+
+    def _break_json(self, message: AIMessage) -> AIMessage:
+        tool_call = message.tool_calls[0]
+        text = json.dumps(tool_call["args"], ensure_ascii=False)
+        breakage = self._rng.randrange(4)
+        if breakage == 0:
+            text = f"```json\n{text}\n```"
+        elif breakage == 1:
+            text = text[:-1] + ",}"
+        elif breakage == 2:
+            text = text.rstrip("]}")
+        else:
+            # the first two characters of the last string value
+            text = text[: text.rindex('": "') + len('": "') + 2]
+        return AIMessage(
+            "",
+            invalid_tool_calls=[
+                {
+                    "name": tool_call["name"],
+                    "args": text,
+                    "id": tool_call["id"],
+                    "error": None,
+                }
+            ],
+        )
@@ -0,0 +1,154 @@
+"""
+Measures the per-chunk latency of `ChatModelChunkedTextEnumerator` with `BenchmarkChatModel`
+whose calls are sometimes stragglers, without and with hedged requests,
+and the time spent on the LLM parse fallback on the main model and on an auxiliary one
+(without stragglers).
+
+    python -m benchmarks.hedging --latency 0.02 --tail-rate 0.05 --tail-latency 0.5
+"""
+
+import argparse
+import json
+import statistics
+import time
+from typing import Any
+from vm_lcsampler.chatmodel_samplers import (
+    CallbackSink,
+    CallRecord,
+    ChatModelChunkedTextEnumerator,
+    HedgePolicy,
+    RetryPolicy,
+)
+from .fake_model import BenchmarkChatModel
+
+
+def _percentile(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+def run_case(
+    name: str, llm: BenchmarkChatModel, args: argparse.Namespace, **kwargs: Any
+) -> dict[str, Any]:
+    """enumerates with `kwargs` of the enumerator and returns the per-chunk latencies"""
+    latencies: list[float] = []
+
+    def collect(record: CallRecord) -> None:
+        latencies.append(record.llm_seconds)
+
+    enumerator = ChatModelChunkedTextEnumerator(
+        llm, instrumentation=CallbackSink(collect), **kwargs
+    )
+    start = time.perf_counter()
+    num_item = sum(
+        1
+        for _ in enumerator.generate(
+            "cat breeds", None, args.chunk_size, args.num_chunk, None
+        )
+    )
+    seconds = time.perf_counter() - start
+    hedge_policy = kwargs.get("hedge_policy")
+    if hedge_policy is not None:
+        # the losers still running are waited for
+        hedge_policy.close()
+    return {
+        "case": name,
+        "num_item": num_item,
+        "seconds": seconds,
+        "p50_chunk_seconds": _percentile(latencies, 50),
+        "p99_chunk_seconds": _percentile(latencies, 99),
+        "max_chunk_seconds": max(latencies, default=0.0),
+        "num_hedged": hedge_policy.num_hedged if hedge_policy else 0,
+        "num_hedge_won": hedge_policy.num_hedge_won if hedge_policy else 0,
+        "num_llm_fallback": enumerator.parse_metrics.num_llm_fallback,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--chunk-size", type=int, default=5)
+    parser.add_argument("--num-chunk", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--tail-rate", type=float, default=0.05)
+    parser.add_argument("--tail-latency", type=float, default=0.5)
+    parser.add_argument("--hedge-delay", type=float, default=0.05)
+    parser.add_argument("--hedge-quantile", type=float, default=0.9)
+    parser.add_argument(
+        "--malformed-rate",
+        type=float,
+        default=0.3,
+        help="of the answers which need the LLM parse fallback",
+    )
+    parser.add_argument(
+        "--auxiliary-latency", type=float, default=0.005, help="of the auxiliary model"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    def llm(**kwargs: Any) -> BenchmarkChatModel:
+        return BenchmarkChatModel(
+            **{
+                "latency": args.latency,
+                "tail_rate": args.tail_rate,
+                "tail_latency": args.tail_latency,
+                "seed": args.seed,
+                **kwargs,
+            }
+        )
+
+    results = [
+        run_case("baseline", llm(), args),
+        run_case(
+            f"hedge after {args.hedge_delay}s",
+            llm(),
+            args,
+            hedge_policy=HedgePolicy(delay=args.hedge_delay),
+        ),
+        run_case(
+            f"hedge after p{round(args.hedge_quantile * 100)}",
+            llm(),
+            args,
+            hedge_policy=HedgePolicy(
+                delay=args.hedge_delay, quantile=args.hedge_quantile
+            ),
+        ),
+        run_case(
+            "parse fallback on the main model",
+            llm(malformed_rate=args.malformed_rate, tail_rate=0.0),
+            args,
+            llm_parse_fallback=True,
+            recover_missing_indices=True,
+            retry_policy=RetryPolicy(initial_delay=0.0),
+        ),
+        run_case(
+            "parse fallback on an auxiliary model",
+            llm(malformed_rate=args.malformed_rate, tail_rate=0.0),
+            args,
+            llm_parse_fallback=True,
+            recover_missing_indices=True,
+            retry_policy=RetryPolicy(initial_delay=0.0),
+            auxiliary_llm=BenchmarkChatModel(latency=args.auxiliary_latency),
+        ),
+    ]
+    for result in results:
+        print(
+            f"{result['case']}: {result['num_item']} items in {result['seconds']:.2f}s, "
+            f"chunk p50 {result['p50_chunk_seconds'] * 1000:.0f} ms, "
+            f"p99 {result['p99_chunk_seconds'] * 1000:.0f} ms, "
+            f"max {result['max_chunk_seconds'] * 1000:.0f} ms, "
+            f"hedged {result['num_hedged']} (won {result['num_hedge_won']}), "
+            f"parse fallbacks {result['num_llm_fallback']}"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures the time to import the package in fresh interpreters.
+
+    python -m benchmarks.import_time --max-seconds 0.1
+
+The exit code is 1 if importing the package (without a sampler) imports langchain
+or takes longer than `--max-seconds`.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+_STATEMENTS = {
+    "package": "import vm_lcsampler",
+    "samplers package": "import vm_lcsampler.chatmodel_samplers",
+    "RetryPolicy": "from vm_lcsampler.chatmodel_samplers import RetryPolicy",
+    "ChatModelChunkedTextEnumerator": (
+        "from vm_lcsampler.chatmodel_samplers import ChatModelChunkedTextEnumerator"
+    ),
+}
+# these must stay cheap
+_LIGHT = ["package", "samplers package"]
+
+_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+seconds = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": seconds,
+    "langchain": any(m == "langchain" or m.startswith(("langchain.", "langchain_")) for m in sys.modules),
+}}))
+"""
+
+
+def measure(statement: str, repeat: int) -> dict[str, float | bool]:
+    """returns the median seconds of `repeat` fresh imports and whether langchain was imported"""
+    runs = []
+    for _ in range(repeat):
+        output = subprocess.run(
+            [sys.executable, "-c", _SCRIPT.format(statement=statement)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+        runs.append(json.loads(output))
+    return {
+        "seconds": statistics.median(run["seconds"] for run in runs),
+        "langchain": any(run["langchain"] for run in runs),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for name, statement in _STATEMENTS.items():
+        result = measure(statement, args.repeat)
+        print(
+            f"{name}: {result['seconds'] * 1000:.1f} ms"
+            + (", imports langchain" if result["langchain"] else "")
+        )
+        if name in _LIGHT and (
+            result["langchain"]
+            or (args.max_seconds is not None and result["seconds"] > args.max_seconds)
+        ):
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
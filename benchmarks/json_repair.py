@@ -0,0 +1,119 @@
+"""
+Measures the LLM calls and the time per item of `ChatModelStructureSampler`
+with `BenchmarkChatModel` answering broken JSON at random, without and with the local repair,
+and counts the items with a string value cut off by a truncated answer.
+
+    python -m benchmarks.json_repair --broken-json-rate 0.2 --latency 0.02
+"""
+
+import argparse
+import json
+import re
+import time
+from typing import Any
+from langchain_core.exceptions import OutputParserException
+from langchain_core.pydantic_v1 import BaseModel, Field
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelStructureSampler,
+    CounterSink,
+    RetryPolicy,
+)
+from .fake_model import BenchmarkChatModel
+
+
+class Person(BaseModel):
+    name: str = Field(description="The name of the person")  # type: ignore
+    age: int = Field(description="The age of the person")  # type: ignore
+    # the last value is a string, which a truncated answer cuts off
+    job: str = Field(description="The job of the person")  # type: ignore
+
+
+def is_corrupted(person: Person) -> bool:
+    """the fake model answers `<field name> <number>` as a string value"""
+    return not all(
+        re.fullmatch(rf"{name} \d+", getattr(person, name)) for name in ("name", "job")
+    )
+
+
+def run_case(
+    args: argparse.Namespace, chunk_size: int, json_repair: bool
+) -> dict[str, Any]:
+    """samples with the local repair on or off and returns the measurements"""
+    counter = CounterSink()
+    sampler = ChatModelStructureSampler(
+        BenchmarkChatModel(
+            latency=args.latency, broken_json_rate=args.broken_json_rate, seed=args.seed
+        ),
+        chunk_size=chunk_size,
+        history_encoding=args.history_encoding,
+        json_repair=json_repair,
+        # broken outputs of single samples are requested again
+        retry_policy=RetryPolicy(
+            max_retries=args.max_retries,
+            initial_delay=0.0,
+            is_retryable=lambda e: isinstance(e, OutputParserException),
+        ),
+        instrumentation=counter,
+    )
+    start = time.perf_counter()
+    samples = sampler.sample_n("person", None, Person, None, args.num_sample)
+    seconds = time.perf_counter() - start
+    num_item = len(samples)
+    totals: dict[str, float] = {}
+    for key, value in counter.counters.items():
+        name = key.split("{", 1)[0]
+        totals[name] = totals.get(name, 0) + value
+    # a retried call is recorded as one call with retries
+    num_llm_call = totals["vm_lcsampler_llm_calls_total"] + totals[
+        "vm_lcsampler_retries_total"
+    ]
+    return {
+        "chunk_size": chunk_size,
+        "json_repair": json_repair,
+        "num_item": num_item,
+        "seconds": seconds,
+        "ms_per_item": seconds / num_item * 1000 if num_item else None,
+        "num_llm_call": num_llm_call,
+        "num_repaired": sampler.repair_stats.num_repaired,
+        "repair_rate": sampler.repair_stats.repair_rate,
+        "num_corrupted": sum(is_corrupted(sample) for sample in samples),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--num-sample", type=int, default=50)
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--broken-json-rate", type=float, default=0.2)
+    parser.add_argument("--history-encoding", default="raw")
+    parser.add_argument("--max-retries", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    results = [
+        run_case(args, chunk_size, json_repair)
+        for chunk_size in args.chunk_size
+        for json_repair in [False, True]
+    ]
+    for result in results:
+        print(
+            f"chunk_size {result['chunk_size']}, json_repair {result['json_repair']}: "
+            f"{result['num_item']} items in {result['seconds']:.2f}s "
+            f"({result['ms_per_item'] or 0:.1f} ms/item), "
+            f"{result['num_llm_call']:.0f} LLM calls, "
+            f"{result['num_repaired']} repaired ({result['repair_rate']:.0%}), "
+            f"{result['num_corrupted']} corrupted"
+        )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(
+                {"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2
+            )
+
+
+if __name__ == "__main__":
+    main()
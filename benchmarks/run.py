@@ -0,0 +1,245 @@
+"""
+Sweeps `chunk_size`, `num_chunk`, `num_sample`, the history length
+and the history encoding of the samplers with `BenchmarkChatModel`,
+and saves items/sec, LLM calls per item, simulated tokens per item and per call
+and peak memory as JSON.
+
+    python -m benchmarks.run --output result.json
+"""
+
+import argparse
+import itertools
+import json
+import platform
+import subprocess
+import time
+import tracemalloc
+from typing import Any, Iterator
+from langchain_core.exceptions import OutputParserException
+from langchain_core.pydantic_v1 import BaseModel, Field, ValidationError
+from vm_lcsampler import VERSION
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    ChatModelStructureSampler,
+    ChatModelTextSampler,
+    CounterSink,
+    RetryPolicy,
+    SlidingWindowHistoryPolicy,
+)
+from .fake_model import BenchmarkChatModel, SimulatedProviderError
+
+
+class Person(BaseModel):
+    name: str = Field(description="The name of the person")  # type: ignore
+    job: str = Field(description="The job of the person")  # type: ignore
+    age: int = Field(description="The age of the person")  # type: ignore
+
+
+def _is_simulated_error(error: BaseException) -> bool:
+    """simulated provider errors and malformed structured outputs are retried"""
+    return isinstance(
+        error, (SimulatedProviderError, ValidationError, OutputParserException)
+    )
+
+
+def _history_policy(history_max_tokens: int) -> SlidingWindowHistoryPolicy | None:
+    if history_max_tokens <= 0:
+        return None
+    return SlidingWindowHistoryPolicy(
+        max_tokens=history_max_tokens, max_exclusion_tokens=history_max_tokens // 2
+    )
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_case(
+    sampler_name: str,
+    llm: BenchmarkChatModel,
+    params: dict[str, Any],
+    max_retries: int,
+) -> dict[str, Any]:
+    """runs one sampling job and returns its measurements"""
+    counter = CounterSink()
+    kwargs: dict[str, Any] = {
+        "history_policy": _history_policy(params["history_max_tokens"]),
+        "retry_policy": RetryPolicy(
+            max_retries=max_retries,
+            initial_delay=0.0,
+            is_retryable=_is_simulated_error,
+        ),
+        "instrumentation": counter,
+    }
+    error = None
+    items: list[Any] = []
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+        if sampler_name == "ChatModelTextSampler":
+            generator: Iterator[Any] = ChatModelTextSampler(llm, **kwargs).generate(
+                "cat breeds", None, ["Persian"], params["num_sample"]
+            )
+        elif sampler_name == "ChatModelStructureSampler":
+            generator = ChatModelStructureSampler(
+                llm,
+                chunk_size=params["chunk_size"],
+                history_encoding=params["history_encoding"],
+                **kwargs,
+            ).generate("person", None, Person, None, params["num_sample"])
+        else:
+            generator = ChatModelChunkedTextEnumerator(
+                llm, recover_missing_indices=True, **kwargs
+            ).generate(
+                "cat breeds", None, params["chunk_size"], params["num_chunk"], None
+            )
+        # items are collected one by one, so that a failed job reports the items before the error
+        for item in generator:
+            items.append(item)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    seconds = time.perf_counter() - start
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    totals: dict[str, float] = {}
+    for key, value in counter.counters.items():
+        name = key.split("{", 1)[0]
+        totals[name] = totals.get(name, 0) + value
+    num_item = len(items)
+    num_llm_call = totals.get("vm_lcsampler_llm_calls_total", 0)
+    num_tokens = totals.get("vm_lcsampler_prompt_tokens_total", 0) + totals.get(
+        "vm_lcsampler_completion_tokens_total", 0
+    )
+    return {
+        "sampler": sampler_name,
+        "params": params,
+        "num_item": num_item,
+        "seconds": seconds,
+        "items_per_sec": num_item / seconds if seconds > 0 else None,
+        "llm_calls_per_item": num_llm_call / num_item if num_item else None,
+        "tokens_per_item": num_tokens / num_item if num_item else None,
+        "prompt_tokens_per_call": (
+            totals.get("vm_lcsampler_prompt_tokens_total", 0) / num_llm_call
+            if num_llm_call
+            else None
+        ),
+        "num_retry": totals.get("vm_lcsampler_retries_total", 0),
+        "peak_memory_bytes": peak_memory,
+        "error": error,
+    }
+
+
+def iter_cases(args: argparse.Namespace) -> list[tuple[str, dict[str, Any]]]:
+    cases: list[tuple[str, dict[str, Any]]] = []
+    for history_max_tokens in args.history_max_tokens:
+        for num_sample in args.num_sample:
+            cases.append(
+                (
+                    "ChatModelTextSampler",
+                    {"num_sample": num_sample, "history_max_tokens": history_max_tokens},
+                )
+            )
+            for chunk_size, history_encoding in itertools.product(
+                [1, *args.chunk_size], args.history_encoding
+            ):
+                cases.append(
+                    (
+                        "ChatModelStructureSampler",
+                        {
+                            "num_sample": num_sample,
+                            "chunk_size": chunk_size,
+                            "history_max_tokens": history_max_tokens,
+                            "history_encoding": history_encoding,
+                        },
+                    )
+                )
+        for chunk_size, num_chunk in itertools.product(args.chunk_size, args.num_chunk):
+            cases.append(
+                (
+                    "ChatModelChunkedTextEnumerator",
+                    {
+                        "chunk_size": chunk_size,
+                        "num_chunk": num_chunk,
+                        "history_max_tokens": history_max_tokens,
+                    },
+                )
+            )
+    return cases
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("--output", default=None, help="JSON file of the results")
+    parser.add_argument("--num-sample", type=int, nargs="+", default=[10, 30])
+    parser.add_argument("--chunk-size", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--num-chunk", type=int, nargs="+", default=[2, 5])
+    parser.add_argument(
+        "--history-max-tokens",
+        type=int,
+        nargs="+",
+        default=[0, 500],
+        help="token budget of SlidingWindowHistoryPolicy (0: whole history)",
+    )
+    parser.add_argument(
+        "--history-encoding",
+        nargs="+",
+        default=["json"],
+        choices=ChatModelStructureSampler._HISTORY_ENCODINGS,
+        help="history encodings of ChatModelStructureSampler",
+    )
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-latency", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    model_config = {
+        "latency": args.latency,
+        "token_latency": args.token_latency,
+        "failure_rate": args.failure_rate,
+        "malformed_rate": args.malformed_rate,
+        "seed": args.seed,
+    }
+    results = []
+    for sampler_name, params in iter_cases(args):
+        result = run_case(
+            sampler_name, BenchmarkChatModel(**model_config), params, args.max_retries
+        )
+        results.append(result)
+        print(
+            f"{sampler_name} {params}: {result['items_per_sec'] or 0:.1f} items/sec, "
+            f"{result['llm_calls_per_item'] or 0:.2f} calls/item, "
+            f"{result['tokens_per_item'] or 0:.0f} tokens/item, "
+            f"{result['prompt_tokens_per_call'] or 0:.0f} prompt tokens/call, "
+            f"{result['peak_memory_bytes'] / 1024:.0f} KiB"
+            + (f", error: {result['error']}" if result["error"] else "")
+        )
+
+    report = {
+        "metadata": {
+            "version": VERSION,
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "model": model_config,
+            "max_retries": args.max_retries,
+        },
+        "results": results,
+    }
+    if args.output is not None:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+In this script, the async API (`agenerate`, `asample_n`, `aenumerate`) is used
+to run many sampling jobs concurrently on one event loop.
+An offline fake chat model with artificial latency is used, so no API key is required.
+The LLM calls of concurrent jobs overlap, so 100 job sets take a few times
+as long as one set (not 100 times), where the rest is the CPU time of the jobs.
+"""
+
+import asyncio
+import time
+from langchain_core.pydantic_v1 import BaseModel, Field
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    ChatModelStructureSampler,
+    ChatModelTextSampler,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+
+class Joke(BaseModel):
+    setup: str = Field(description="The setup of the joke")  # type: ignore
+    punchline: str = Field(description="The punchline to the joke")  # type: ignore
+
+
+async def run_jobs(num_job: int, llm: FakeSamplerChatModel) -> float:
+    text_sampler = ChatModelTextSampler(llm=llm)
+    structure_sampler = ChatModelStructureSampler(llm=llm)
+    enumerator = ChatModelChunkedTextEnumerator(llm=llm)
+
+    async def enumerate_job() -> list[tuple[int, str]]:
+        return [
+            item
+            async for item in enumerator.aenumerate(
+                "cat breeds", None, chunk_size=5, num_chunk=2, few_shot_chunked_samples=None
+            )
+        ]
+
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[
+            job
+            for _ in range(num_job)
+            for job in (
+                text_sampler.asample_n("cat breeds", None, None, num_sample=3),
+                structure_sampler.asample_n("joke", None, Joke, None, num_sample=3),
+                enumerate_job(),
+            )
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    assert all(len(result) in (3, 10) for result in results)
+    return elapsed
+
+
+async def main():
+    llm = FakeSamplerChatModel(latency=0.1)
+    elapsed_one = await run_jobs(1, llm)
+    elapsed_many = await run_jobs(100, llm)
+    print(f"1 job set: {elapsed_one:.2f} sec")
+    print(f"100 job sets: {elapsed_many:.2f} sec")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import asyncio
+import time
+import pytest
+from langchain_core.pydantic_v1 import BaseModel, Field
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    ChatModelStructureSampler,
+    ChatModelTextSampler,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+_LATENCY = 0.2
+_NUM_JOB = 10
+# one job makes 3 sequential calls, and the slack covers the overhead of the event loop
+_MAX_SECONDS = 3 * _LATENCY + 1.0
+
+
+class Joke(BaseModel):
+    setup: str = Field(description="The setup of the joke")  # type: ignore
+    punchline: str = Field(description="The punchline to the joke")  # type: ignore
+
+
+async def _text_job(llm: FakeSamplerChatModel) -> list:
+    return await ChatModelTextSampler(llm).asample_n("cat breeds", None, None, 3)
+
+
+async def _structure_job(llm: FakeSamplerChatModel) -> list:
+    return await ChatModelStructureSampler(llm).asample_n("joke", None, Joke, None, 3)
+
+
+async def _enumerate_job(llm: FakeSamplerChatModel) -> list:
+    return [
+        item
+        async for item in ChatModelChunkedTextEnumerator(llm).aenumerate(
+            "cat breeds", None, 1, 3, None
+        )
+    ]
+
+
+@pytest.mark.parametrize("job", [_text_job, _structure_job, _enumerate_job])
+def test_concurrent_jobs_overlap(job) -> None:
+    llm = FakeSamplerChatModel(latency=_LATENCY)
+
+    async def run() -> list[list]:
+        return await asyncio.gather(*[job(llm) for _ in range(_NUM_JOB)])
+
+    start = time.perf_counter()
+    results = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+    assert [len(result) for result in results] == [3] * _NUM_JOB
+    # sequential jobs would take _NUM_JOB * 3 * _LATENCY (6 seconds)
+    assert elapsed < _MAX_SECONDS
@@ -0,0 +1,101 @@
+from typing import Any, Generator
+import pytest
+from langchain_core.pydantic_v1 import BaseModel, Field
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    ChatModelStructureSampler,
+    ChatModelTextSampler,
+    CheckpointStore,
+    JSONLCheckpointStore,
+    SQLiteCheckpointStore,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+
+class Joke(BaseModel):
+    setup: str = Field(description="The setup of the joke")  # type: ignore
+    punchline: str = Field(description="The punchline to the joke")  # type: ignore
+
+
+def _first(generator: Generator[Any, None, None]) -> Any:
+    """takes the first example and stops the job, as a crashing consumer would"""
+    first = next(generator)
+    generator.close()
+    return first
+
+
+def _create_store(tmp_path, kind: str) -> CheckpointStore:
+    if kind == "jsonl":
+        return JSONLCheckpointStore(str(tmp_path / "checkpoint.jsonl"))
+    return SQLiteCheckpointStore(str(tmp_path / "checkpoint.db"))
+
+
+@pytest.mark.parametrize("kind", ["jsonl", "sqlite"])
+def test_enumerator_resume(tmp_path, kind: str) -> None:
+    expected = list(
+        ChatModelChunkedTextEnumerator(FakeSamplerChatModel()).enumerate(
+            "cat breeds", None, 3, 3, None
+        )
+    )
+    store = _create_store(tmp_path, kind)
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeSamplerChatModel(), checkpoint_store=store
+    )
+    generator = enumerator.enumerate("cat breeds", None, 3, 3, None)
+    items = [next(generator) for _ in range(4)]
+    generator.close()
+    checkpoint = store.load()
+    assert checkpoint is not None
+    # the second chunk was interrupted, so only the first one is saved
+    assert checkpoint.next_index == 1
+    resumed = list(enumerator.resume(checkpoint))
+    assert [*items[:3], *resumed] == expected
+
+
+def test_jsonl_load_ignores_broken_last_line(tmp_path) -> None:
+    path = tmp_path / "checkpoint.jsonl"
+    store = JSONLCheckpointStore(str(path))
+    sampler = ChatModelTextSampler(FakeSamplerChatModel(), checkpoint_store=store)
+    samples = sampler.sample_n("cat breeds", None, None, 2)
+    # a crash while writing the next line
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"next_index": 3, "ite')
+    checkpoint = JSONLCheckpointStore(str(path)).load()
+    assert checkpoint is not None
+    assert (checkpoint.items, checkpoint.next_index) == (samples, 2)
+
+
+def test_text_checkpoint_is_saved_before_yield(tmp_path) -> None:
+    store = JSONLCheckpointStore(str(tmp_path / "checkpoint.jsonl"))
+    sampler = ChatModelTextSampler(FakeSamplerChatModel(), checkpoint_store=store)
+    first = _first(sampler.generate("cat breeds", None, None, 3))
+    checkpoint = store.load()
+    assert checkpoint is not None
+    assert checkpoint.items == [first]
+    assert len(list(sampler.resume(checkpoint))) == 2
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2])
+def test_structure_checkpoint_is_saved_before_yield(tmp_path, chunk_size: int) -> None:
+    store = JSONLCheckpointStore(str(tmp_path / "checkpoint.jsonl"))
+    sampler = ChatModelStructureSampler(
+        FakeSamplerChatModel(), checkpoint_store=store, chunk_size=chunk_size
+    )
+    first = _first(sampler.generate("joke", None, Joke, None, 4))
+    checkpoint = store.load()
+    assert checkpoint is not None
+    assert checkpoint.items[0] == first.dict()
+    assert len(checkpoint.items) == chunk_size
+    assert len(list(sampler.resume(checkpoint))) == 4 - chunk_size
+
+
+def test_jsonl_reset_drops_previous_job(tmp_path) -> None:
+    path = str(tmp_path / "checkpoint.jsonl")
+    sampler = ChatModelTextSampler(
+        FakeSamplerChatModel(), checkpoint_store=JSONLCheckpointStore(path)
+    )
+    sampler.sample_n("cat breeds", None, None, 2)
+    # a new job started by another process, which stops before its first checkpoint
+    store = JSONLCheckpointStore(path)
+    store.reset()
+    assert store.load() is None
@@ -0,0 +1,128 @@
+import asyncio
+import time
+import pytest
+from langchain_core.language_models import FakeListChatModel
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    SaturationEstimator,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+_LATENCY = 0.1
+
+# the required indices are 1-5, where 2 is empty, and the extra ones are 6-8
+_EMPTY_LINE_ANSWER = "1. a\n2. \n3. c\n4. d\n5. e\n6. f\n7. g\n8. h"
+# the extra index 6 fills one of the missing 2 and 3
+_TWO_MISSING_ANSWER = "1. a\n2. \n3. \n4. d\n5. e\n6. f"
+
+
+@pytest.mark.parametrize("pipeline_depth", [0, 1])
+def test_overgeneration_fills_missing_indices(pipeline_depth: int) -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeListChatModel(responses=[_EMPTY_LINE_ANSWER]),
+        overgeneration=3,
+        pipeline_depth=pipeline_depth,
+    )
+    assert enumerator.sample_n("x", None, 5, 1, None) == ["a", "c", "d", "e", "f"]
+    assert enumerator.parse_metrics.num_recovery_request == 0
+
+
+@pytest.mark.parametrize("pipeline_depth", [0, 1])
+def test_overgeneration_fills_missing_indices_async(pipeline_depth: int) -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeListChatModel(responses=[_EMPTY_LINE_ANSWER]),
+        overgeneration=3,
+        pipeline_depth=pipeline_depth,
+    )
+    samples = asyncio.run(enumerator.asample_n("x", None, 5, 1, None))
+    assert samples == ["a", "c", "d", "e", "f"]
+
+
+@pytest.mark.parametrize("pipeline_depth", [0, 1])
+def test_overgeneration_recovers_only_shortfall(pipeline_depth: int) -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeListChatModel(responses=[_TWO_MISSING_ANSWER, "2. b", "3. c"]),
+        overgeneration=1,
+        recover_missing_indices=True,
+        pipeline_depth=pipeline_depth,
+    )
+    assert enumerator.sample_n("x", None, 5, 1, None) == ["a", "d", "e", "f", "b"]
+    assert enumerator.parse_metrics.num_recovery_request == 1
+    assert enumerator.parse_metrics.num_recovered_index == 1
+
+
+def test_overgeneration_raises_for_shortfall() -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeListChatModel(responses=[_TWO_MISSING_ANSWER]), overgeneration=1
+    )
+    with pytest.raises(ValueError):
+        enumerator.sample_n("x", None, 5, 1, None)
+
+
+def test_pipelined_overlaps_consumer() -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeSamplerChatModel(latency=_LATENCY), pipeline_depth=1
+    )
+    start = time.perf_counter()
+    seconds_to_first = None
+    samples: list[str] = []
+    for chunk in enumerator.generate_chunk("x", None, 5, 5, None):
+        seconds_to_first = seconds_to_first or time.perf_counter() - start
+        samples += chunk.values()
+        time.sleep(_LATENCY)
+    seconds = time.perf_counter() - start
+    assert samples == [f"example {i}" for i in range(1, 26)]
+    # the first chunk is not delayed by the request of the second one
+    assert seconds_to_first is not None and seconds_to_first < 1.5 * _LATENCY
+    # the requests overlap the consumer, which takes as long as a request
+    assert seconds < 8 * _LATENCY
+
+
+def test_pipelined_recovery_follows_request_in_flight() -> None:
+    # the second chunk is requested before the index 2 of the first one is recovered
+    llm = FakeListChatModel(responses=["1. a", "3. c\n4. d", "2. b"])
+    enumerator = ChatModelChunkedTextEnumerator(
+        llm, recover_missing_indices=True, pipeline_depth=1
+    )
+    assert enumerator.sample_n("x", None, 2, 2, None) == ["a", "b", "c", "d"]
+
+
+@pytest.mark.parametrize("pipeline_depth", [0, 1])
+def test_parse_metrics_count_only_chunks(pipeline_depth: int) -> None:
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeListChatModel(responses=["1. a\n3. c", "2. b"]),
+        recover_missing_indices=True,
+        pipeline_depth=pipeline_depth,
+    )
+    assert enumerator.sample_n("x", None, 3, 1, None) == ["a", "c", "b"]
+    metrics = enumerator.parse_metrics
+    # the answer to the recovery request is not a chunk
+    assert (metrics.num_chunk, metrics.num_local_parse) == (1, 0)
+    assert metrics.num_recovery_request == 1
+
+
+def test_enumerate_many_resets_stop_reason() -> None:
+    # saturated after the first call
+    estimator = SaturationEstimator(window=1, min_novelty=1.1)
+    enumerator = ChatModelChunkedTextEnumerator(
+        FakeSamplerChatModel(), saturation_estimator=estimator
+    )
+    assert len(enumerator.sample_n("x", None, 2, 3, None)) == 2
+    assert enumerator.stop_reason == "saturated"
+    items = list(enumerator.enumerate_many([("x", None), ("y", None)], 2, 2))
+    assert len(items) == 8
+    assert enumerator.stop_reason == "complete"
+    assert estimator.stats.num_call == 0
+
+
+def test_aenumerate_many_sets_stop_reason() -> None:
+    enumerator = ChatModelChunkedTextEnumerator(FakeSamplerChatModel())
+
+    async def run() -> list:
+        return [
+            item
+            async for item in enumerator.aenumerate_many([("x", None)], 2, 2)
+        ]
+
+    assert len(asyncio.run(run())) == 4
+    assert enumerator.stop_reason == "complete"
@@ -0,0 +1,58 @@
+import threading
+import pytest
+from vm_lcsampler.chatmodel_samplers import DedupIndex, normalize_text
+
+
+def test_normalize_text() -> None:
+    assert normalize_text("  Maine　Coon!! ") == "maine coon"
+    assert normalize_text("Ｓｉａｍｅｓｅ") == "siamese"
+
+
+def test_exact_and_normalized_duplicates() -> None:
+    index = DedupIndex()
+    assert index.add("Maine Coon")
+    assert not index.add("Maine Coon")
+    assert not index.add("maine coon.")
+    assert index.add("Siamese")
+    assert len(index) == 2
+    assert (index.stats.num_checked, index.stats.num_duplicate) == (4, 2)
+
+
+def test_without_normalization() -> None:
+    index = DedupIndex(normalize=False)
+    assert index.add("Maine Coon")
+    assert index.add("maine coon")
+
+
+def test_near_duplicates() -> None:
+    index = DedupIndex(near_duplicate_threshold=0.5)
+    assert index.add("a cat sits on the warm mat by the door")
+    assert not index.add("a cat sits on the warm mat by the doors")
+    assert index.add("dogs run in the park every morning")
+    assert len(index) == 2
+
+
+def test_invalid_num_band() -> None:
+    with pytest.raises(ValueError):
+        DedupIndex(num_perm=64, num_band=10)
+
+
+def test_concurrent_adds() -> None:
+    index = DedupIndex()
+    results: list[bool] = []
+    lock = threading.Lock()
+
+    def add_all() -> None:
+        for i in range(200):
+            is_new = index.add(f"example {i}")
+            with lock:
+                results.append(is_new)
+
+    threads = [threading.Thread(target=add_all) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # each example is new for exactly one of the threads
+    assert sum(results) == 200
+    assert len(index) == 200
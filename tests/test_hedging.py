@@ -0,0 +1,97 @@
+import asyncio
+import threading
+import time
+from typing import Any, Callable
+from concurrent.futures import CancelledError
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatResult
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelTextSampler,
+    HedgePolicy,
+    RateLimiter,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+
+class _CountingChatModel(FakeSamplerChatModel):
+    """counts the requests actually sent"""
+
+    num_sent: int = 0
+
+    def _generate(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> ChatResult:
+        self.num_sent += 1
+        return super()._generate(messages, *args, **kwargs)
+
+
+def test_hedge_wins_over_straggler() -> None:
+    with HedgePolicy(delay=0.01) as policy:
+        result = policy.call(
+            lambda: time.sleep(0.5) or "primary", lambda check_cancelled: "hedge"
+        )
+    assert result == "hedge"
+    assert (policy.num_call, policy.num_hedged, policy.num_hedge_won) == (1, 1, 1)
+
+
+def test_decided_hedge_is_not_sent() -> None:
+    gate = threading.Event()
+    sent: list[str] = []
+    errors: list[BaseException] = []
+
+    def hedge(check_cancelled: Callable[[], None]) -> str:
+        # waits as for a rate limiter until the primary has won
+        gate.wait()
+        try:
+            check_cancelled()
+        except CancelledError as e:
+            errors.append(e)
+            raise
+        sent.append("hedge")
+        return "hedge"
+
+    policy = HedgePolicy(delay=0.01)
+    assert policy.call(lambda: time.sleep(0.1) or "primary", hedge) == "primary"
+    gate.set()
+    policy.close()
+    assert sent == []
+    assert len(errors) == 1
+    assert policy.num_hedge_won == 0
+
+
+def test_close_shuts_down_workers() -> None:
+    policy = HedgePolicy(delay=0.0)
+    assert policy.call(lambda: "primary", lambda check_cancelled: "hedge")
+    threads = [t for t in threading.enumerate() if t.name.startswith("hedge")]
+    assert threads
+    policy.close()
+    assert all(not t.is_alive() for t in threads)
+    # a later call starts new workers
+    assert policy.call(lambda: "primary", lambda check_cancelled: "hedge")
+    policy.close()
+
+
+def test_hedge_blocked_in_rate_limiter_is_not_sent() -> None:
+    llm = _CountingChatModel(latency=0.1)
+    # the first request takes the only token, and the duplicate waits for 0.5 seconds
+    limiter = RateLimiter(requests_per_minute=120, burst_seconds=0.5)
+    with HedgePolicy(delay=0.02) as policy:
+        sampler = ChatModelTextSampler(llm, rate_limiter=limiter, hedge_policy=policy)
+        assert len(sampler.sample_n("cat breeds", None, None, 1)) == 1
+    assert policy.num_hedged == 1
+    assert limiter.num_acquired == 2
+    assert llm.num_sent == 1
+
+
+def test_async_hedge_is_cancelled() -> None:
+    policy = HedgePolicy(delay=0.01)
+
+    async def primary() -> str:
+        await asyncio.sleep(0.5)
+        return "primary"
+
+    async def hedge() -> str:
+        return "hedge"
+
+    assert asyncio.run(policy.acall(primary, hedge)) == "hedge"
+    assert policy.num_hedge_won == 1
@@ -0,0 +1,41 @@
+import pytest
+from vm_lcsampler.chatmodel_samplers.json_repair import repair_json
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('```json\n{"a": 1}\n```', {"a": 1}),
+        ('Sure! Here it is: {"a": 1}', {"a": 1}),
+        ('{"a": [1, 2,], "b": "x",}', {"a": [1, 2], "b": "x"}),
+        ('{"a": {"b": "x"}', {"a": {"b": "x"}}),
+        ('{"samples": [{"a": "x"}, {"a": "y"}', {"samples": [{"a": "x"}, {"a": "y"}]}),
+        ('{"a": "x, }", "b": true', {"a": "x, }", "b": True}),
+    ],
+)
+def test_repair_json(text: str, expected: object) -> None:
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        # the cut-off string is dropped, never closed
+        ('{"setup": "abc", "punchline": "It was tw', {"setup": "abc"}),
+        ('{"setup": "a, b", "punchline": "It, was', {"setup": "a, b"}),
+        ('{"samples": [{"a": "x"}, {"a": "y', {"samples": [{"a": "x"}]}),
+        # so is a number which may continue
+        ('{"a": "x", "b": 4', {"a": "x"}),
+        ('{"a": [1, 2,', {"a": [1, 2]}),
+    ],
+)
+def test_repair_json_drops_cut_off_member(text: str, expected: object) -> None:
+    assert repair_json(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text", ["no JSON here", '{"punchline": "It was tw', '{"age": 4', '{"a": "x\\"']
+)
+def test_repair_json_raises(text: str) -> None:
+    with pytest.raises(ValueError):
+        repair_json(text)
@@ -0,0 +1,58 @@
+import pytest
+from vm_lcsampler.chatmodel_samplers import (
+    NumberedListStreamParser,
+    parse_numbered_list,
+)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "1. foo\n2. bar",
+        "1) foo\n2) bar",
+        "1: foo\n2: bar",
+        "- 1. foo\n- 2. bar",
+        "**1.** foo\n**2.** bar",
+        "```\n1. foo\n2. bar\n```",
+        "Here are the examples:\n1. foo\n2. bar",
+    ],
+)
+def test_formats(text: str) -> None:
+    assert parse_numbered_list(text, [1, 2]) == {1: "foo", 2: "bar"}
+
+
+def test_wrapped_lines_and_trailing_remarks() -> None:
+    text = "1. foo\n   continued\n2. bar\n\nI hope these help."
+    assert parse_numbered_list(text, [1, 2]) == {1: "foo continued", 2: "bar"}
+
+
+def test_unexpected_indices_are_continuation() -> None:
+    # 3 is not requested, and the repeated 1 is not a new item
+    text = "2. bar\n3. baz\n1. foo\n1. qux"
+    assert parse_numbered_list(text, [1, 2]) == {1: "foo 1. qux", 2: "bar 3. baz"}
+
+
+def test_missing_and_empty_indices() -> None:
+    assert parse_numbered_list("1. foo\n2.\n4. qux", [1, 2, 3, 4]) == {
+        1: "foo",
+        4: "qux",
+    }
+
+
+def test_stream_matches_whole_text() -> None:
+    text = "Sure!\n1. foo\n   continued\n2. bar\n3. baz\n\nEnjoy."
+    parser = NumberedListStreamParser([1, 2, 3])
+    items = []
+    for i in range(0, len(text), 3):
+        items += parser.feed(text[i : i + 3])
+    items += parser.close()
+    assert dict(items) == parse_numbered_list(text, [1, 2, 3])
+
+
+def test_stream_yields_item_when_complete() -> None:
+    parser = NumberedListStreamParser([1, 2])
+    assert parser.feed("1. foo") == []
+    # the first item is complete when the second one starts
+    assert parser.feed("\n2. b") == []
+    assert parser.feed("ar\n") == [(1, "foo")]
+    assert parser.close() == [(2, "bar")]
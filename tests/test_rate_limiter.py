@@ -0,0 +1,95 @@
+import asyncio
+from typing import Any, AsyncIterator, Iterator
+import pytest
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelChunkedTextEnumerator,
+    RateLimiter,
+    RetryPolicy,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+
+class _RecordingRateLimiter(RateLimiter):
+    """counts the tokens charged to the bucket net of the corrections by `settle`"""
+
+    def __init__(self) -> None:
+        super().__init__(tokens_per_minute=1_000_000)
+        self.charged = 0
+        self.used = 0
+
+    def acquire(self, num_tokens: int = 0, priority: int = 0) -> float:
+        self.charged += num_tokens
+        return super().acquire(num_tokens, priority)
+
+    async def aacquire(self, num_tokens: int = 0, priority: int = 0) -> float:
+        self.charged += num_tokens
+        return await super().aacquire(num_tokens, priority)
+
+    def settle(self, num_estimated_tokens: int, usage: dict[str, Any] | None) -> None:
+        if usage and "total_tokens" in usage:
+            self.charged += usage["total_tokens"] - num_estimated_tokens
+            self.used += usage["total_tokens"]
+        super().settle(num_estimated_tokens, usage)
+
+
+class _FlakyChatModel(FakeSamplerChatModel):
+    """fails the first `num_failure` streams before their first chunk"""
+
+    num_failure: int = 1
+
+    def _fail(self) -> None:
+        if self.num_failure > 0:
+            self.num_failure -= 1
+            raise ConnectionError("flaky")
+
+    def _stream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        self._fail()
+        yield from super()._stream(messages, *args, **kwargs)
+
+    async def _astream(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        self._fail()
+        async for chunk in super()._astream(messages, *args, **kwargs):
+            yield chunk
+
+
+def _create_streaming_enumerator(
+    limiter: RateLimiter,
+) -> ChatModelChunkedTextEnumerator:
+    return ChatModelChunkedTextEnumerator(
+        _FlakyChatModel(num_failure=2),
+        streaming=True,
+        rate_limiter=limiter,
+        retry_policy=RetryPolicy(initial_delay=0.0),
+    )
+
+
+def test_failed_stream_is_not_charged() -> None:
+    limiter = _RecordingRateLimiter()
+    enumerator = _create_streaming_enumerator(limiter)
+    assert len(enumerator.sample_n("x", None, 3, 2, None)) == 6
+    assert limiter.num_acquired == 4
+    assert limiter.used > 0
+    assert limiter.charged == limiter.used
+
+
+def test_failed_stream_is_not_charged_async() -> None:
+    limiter = _RecordingRateLimiter()
+    enumerator = _create_streaming_enumerator(limiter)
+    assert len(asyncio.run(enumerator.asample_n("x", None, 3, 2, None))) == 6
+    assert limiter.num_acquired == 4
+    assert limiter.charged == limiter.used
+
+
+def test_requests_are_spread() -> None:
+    limiter = RateLimiter(requests_per_minute=600, burst_seconds=0.1)
+    for _ in range(5):
+        limiter.acquire()
+    # the burst holds one request, and each of the others waits for 0.1 seconds
+    assert limiter.num_acquired == 5
+    assert limiter.total_wait_seconds == pytest.approx(0.4, abs=0.05)
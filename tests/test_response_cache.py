@@ -0,0 +1,49 @@
+import asyncio
+from typing import Any
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from vm_lcsampler.chatmodel_samplers import (
+    ChatModelStructureSampler,
+    InMemoryResponseCache,
+)
+from vm_lcsampler.fake_chat_model import FakeSamplerChatModel
+
+_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "Joke",
+        "description": "a joke",
+        "parameters": {"type": "object", "properties": {"setup": {"type": "string"}}},
+    },
+}
+
+
+class _NoCallChatModel(FakeSamplerChatModel):
+    """answers the first `num_no_call` requests without calling the tool"""
+
+    num_no_call: int = 1
+
+    def _respond(
+        self, messages: list[BaseMessage], *args: Any, **kwargs: Any
+    ) -> AIMessage:
+        if self.num_no_call > 0:
+            self.num_no_call -= 1
+            return AIMessage("Sorry, I cannot call the tool.")
+        return super()._respond(messages, *args, **kwargs)
+
+
+def test_no_call_is_not_cached() -> None:
+    cache = InMemoryResponseCache()
+    sampler = ChatModelStructureSampler(_NoCallChatModel(), cache=cache)
+    messages = [HumanMessage("a joke")]
+    assert sampler._invoke_json(messages, _TOOL) == {}
+    assert len(cache) == 0
+    assert sampler._invoke_json(messages, _TOOL) == {"setup": "setup 1"}
+    assert len(cache) == 1
+
+
+def test_no_call_is_not_cached_async() -> None:
+    cache = InMemoryResponseCache()
+    sampler = ChatModelStructureSampler(_NoCallChatModel(), cache=cache)
+    messages = [HumanMessage("a joke")]
+    assert asyncio.run(sampler._ainvoke_json(messages, _TOOL)) == {}
+    assert asyncio.run(sampler._ainvoke_json(messages, _TOOL)) == {"setup": "setup 1"}
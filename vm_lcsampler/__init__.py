@@ -1 +1,2 @@
-VERSION = "0.1.0"
\ No newline at end of file
+VERSION = "0.1.0"
+__version__ = VERSION
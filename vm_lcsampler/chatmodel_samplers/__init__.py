@@ -1,9 +1,150 @@
-from .chat_model_text_sampler import ChatModelTextSampler
-from .chat_model_structure_sampler import ChatModelStructureSampler
-from .chat_model_chunked_text_enumerator import ChatModelChunkedTextEnumerator
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from .chat_model_sampler_base import ChatModelSamplerBase
+    from .chat_model_text_sampler import ChatModelTextSampler
+    from .chat_model_structure_sampler import ChatModelStructureSampler
+    from .chat_model_chunked_text_enumerator import (
+        CategorySpec,
+        ChatModelChunkedTextEnumerator,
+        ChunkParseMetrics,
+    )
+    from .chat_model_hierarchical_text_enumerator import (
+        ChatModelHierarchicalTextEnumerator,
+    )
+    from .chunk_size_controller import AdaptiveChunkSizeController, ChunkObservation
+    from .checkpoint import (
+        Checkpoint,
+        CheckpointStore,
+        JSONLCheckpointStore,
+        SQLiteCheckpointStore,
+    )
+    from .dataset_writer import (
+        CSVDatasetWriter,
+        DatasetWriter,
+        JSONLDatasetWriter,
+        ParquetDatasetWriter,
+    )
+    from .dedup import DedupIndex, DedupStats, normalize_text
+    from .hedging import HedgePolicy
+    from .history import HistoryPolicy, SlidingWindowHistoryPolicy, estimate_num_tokens
+    from .instrumentation import (
+        CallbackSink,
+        CallRecord,
+        CounterSink,
+        InstrumentationSink,
+        JSONLTraceSink,
+    )
+    from .json_repair import RepairStats, repair_json
+    from .numbered_list_parser import NumberedListStreamParser, parse_numbered_list
+    from .rate_limiter import RateLimiter
+    from .retry import RetryPolicy, is_transient_error
+    from .saturation import SaturationEstimator, SaturationStats
+    from .response_cache import (
+        InMemoryResponseCache,
+        ResponseCache,
+        SQLiteResponseCache,
+    )
+
+# the submodules are imported on the first access to their attributes,
+# so that importing this package does not import langchain
+_SUBMODULES = {
+    "ChatModelSamplerBase": "chat_model_sampler_base",
+    "ChatModelTextSampler": "chat_model_text_sampler",
+    "ChatModelStructureSampler": "chat_model_structure_sampler",
+    "ChatModelChunkedTextEnumerator": "chat_model_chunked_text_enumerator",
+    "CategorySpec": "chat_model_chunked_text_enumerator",
+    "ChunkParseMetrics": "chat_model_chunked_text_enumerator",
+    "ChatModelHierarchicalTextEnumerator": "chat_model_hierarchical_text_enumerator",
+    "AdaptiveChunkSizeController": "chunk_size_controller",
+    "ChunkObservation": "chunk_size_controller",
+    "Checkpoint": "checkpoint",
+    "CheckpointStore": "checkpoint",
+    "JSONLCheckpointStore": "checkpoint",
+    "SQLiteCheckpointStore": "checkpoint",
+    "DatasetWriter": "dataset_writer",
+    "JSONLDatasetWriter": "dataset_writer",
+    "CSVDatasetWriter": "dataset_writer",
+    "ParquetDatasetWriter": "dataset_writer",
+    "DedupIndex": "dedup",
+    "DedupStats": "dedup",
+    "normalize_text": "dedup",
+    "HedgePolicy": "hedging",
+    "HistoryPolicy": "history",
+    "SlidingWindowHistoryPolicy": "history",
+    "estimate_num_tokens": "history",
+    "CallRecord": "instrumentation",
+    "InstrumentationSink": "instrumentation",
+    "CallbackSink": "instrumentation",
+    "CounterSink": "instrumentation",
+    "JSONLTraceSink": "instrumentation",
+    "RepairStats": "json_repair",
+    "repair_json": "json_repair",
+    "NumberedListStreamParser": "numbered_list_parser",
+    "parse_numbered_list": "numbered_list_parser",
+    "RateLimiter": "rate_limiter",
+    "RetryPolicy": "retry",
+    "is_transient_error": "retry",
+    "SaturationEstimator": "saturation",
+    "SaturationStats": "saturation",
+    "ResponseCache": "response_cache",
+    "InMemoryResponseCache": "response_cache",
+    "SQLiteResponseCache": "response_cache",
+}
 
 __all__=[
+    "ChatModelSamplerBase",
     "ChatModelTextSampler",
     "ChatModelStructureSampler",
     "ChatModelChunkedTextEnumerator",
-]
\ No newline at end of file
+    "CategorySpec",
+    "ChunkParseMetrics",
+    "ChatModelHierarchicalTextEnumerator",
+    "AdaptiveChunkSizeController",
+    "ChunkObservation",
+    "Checkpoint",
+    "CheckpointStore",
+    "JSONLCheckpointStore",
+    "SQLiteCheckpointStore",
+    "DatasetWriter",
+    "JSONLDatasetWriter",
+    "CSVDatasetWriter",
+    "ParquetDatasetWriter",
+    "DedupIndex",
+    "DedupStats",
+    "normalize_text",
+    "HedgePolicy",
+    "HistoryPolicy",
+    "SlidingWindowHistoryPolicy",
+    "estimate_num_tokens",
+    "CallRecord",
+    "InstrumentationSink",
+    "CallbackSink",
+    "CounterSink",
+    "JSONLTraceSink",
+    "RepairStats",
+    "repair_json",
+    "NumberedListStreamParser",
+    "parse_numbered_list",
+    "RateLimiter",
+    "RetryPolicy",
+    "is_transient_error",
+    "SaturationEstimator",
+    "SaturationStats",
+    "ResponseCache",
+    "InMemoryResponseCache",
+    "SQLiteResponseCache",
+]
+
+
+def __getattr__(name: str) -> Any:
+    if name not in _SUBMODULES:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_SUBMODULES[name]}", __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted([*globals(), *__all__])
@@ -1,17 +1,83 @@
+from __future__ import annotations
 import ast
-from typing import Generator
-from langchain.chat_models.base import BaseChatModel
+import asyncio
+import collections
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, AsyncGenerator, Callable, Generator
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .chat_model_sampler_base import ChatModelSamplerBase
+from .checkpoint import Checkpoint, CheckpointStore
+from .chunk_size_controller import AdaptiveChunkSizeController, ChunkObservation
+from .dedup import DedupIndex
+from .hedging import HedgePolicy
+from .history import HistoryPolicy, estimate_num_tokens
+from .instrumentation import CallRecord, InstrumentationSink
+from .numbered_list_parser import (
+    _NUMBERED_LINE_PATTERN,
+    NumberedListStreamParser,
+    parse_numbered_list,
+)
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .retry import RetryPolicy
+from .saturation import SaturationEstimator
 
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
 
 
-class ChatModelChunkedTextEnumerator(object):
+@dataclass
+class ChunkParseMetrics(object):
+    """counters of how the chunks generated by LLM are parsed"""
+
+    num_chunk: int = 0
+    num_local_parse: int = 0
+    num_llm_fallback: int = 0
+    num_recovery_request: int = 0
+    num_recovered_index: int = 0
+    num_extra_index: int = 0
+    num_rejected: int = 0
+
+    @property
+    def llm_fallback_rate(self) -> float:
+        return self.num_llm_fallback / self.num_chunk if self.num_chunk else 0.0
+
+
+@dataclass
+class CategorySpec(object):
+    """a category enumerated by `ChatModelChunkedTextEnumerator.enumerate_many`"""
+
+    category_name: str
+    category_description: str | None = None
+    few_shot_chunked_samples: list[list[str]] | None = None
+
+
+@dataclass
+class _PendingChunk(object):
+    """a chunk requested in the pipelined mode, whose answer is awaited or being parsed"""
+
+    index_list: list[int]
+    num_required: int
+    record: CallRecord | None
+    num_message: int
+    text: str = ""
+    start: float = field(default_factory=time.perf_counter)
+    seconds: float = 0.0
+
+
+class ChatModelChunkedTextEnumerator(ChatModelSamplerBase):
     """
     This class provide generator to enumerate examples.
     The examples are sampled in chunks.
     In this class, each example is sampled with its index number, which appears to improve accuracy of generated examples.
     """
 
+    _FORMAT_EXAMPLE_SIZE = 3
+
     @classmethod
     def _create_system_message(
         cls,
@@ -64,11 +130,120 @@ class ChatModelChunkedTextEnumerator(object):
             f"Please provide {more} {last_index-first_index+1} examples of {category_name} from {first_index} to {last_index}."
         )
 
-    def __init__(self, llm: BaseChatModel) -> None:
-        self._llm = llm
+    @classmethod
+    def _create_missing_human_message(
+        cls, category_name: str, missing_index_list: list[int]
+    ) -> HumanMessage:
+        return HumanMessage(
+            f"Some examples are missing. Please provide examples of {category_name} only for the following numbers: "
+            f"{', '.join(str(i) for i in missing_index_list)}. "
+            "Use the same format `<number>. <example>`."
+        )
+
+    @classmethod
+    def _summarize_ai_message(cls, message: BaseMessage) -> list[str]:
+        items = []
+        for line in str(message.content).splitlines():
+            match = _NUMBERED_LINE_PATTERN.match(line)
+            if match and match.group(2).strip():
+                items.append(match.group(2).strip())
+        return items
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        llm_parse_fallback: bool = False,
+        history_policy: HistoryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        streaming: bool = False,
+        dedup: DedupIndex | None = None,
+        max_duplicate_retries: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        recover_missing_indices: bool = False,
+        checkpoint_store: CheckpointStore | None = None,
+        instrumentation: InstrumentationSink | None = None,
+        chunk_size_controller: AdaptiveChunkSizeController | None = None,
+        rate_limiter: RateLimiter | None = None,
+        priority: int = 0,
+        stable_prefix: bool = False,
+        validators: list[Callable[[str], bool]] | None = None,
+        overgeneration: int = 0,
+        saturation_estimator: SaturationEstimator | None = None,
+        hedge_policy: HedgePolicy | None = None,
+        auxiliary_llm: BaseChatModel | None = None,
+        pipeline_depth: int = 0,
+    ) -> None:
+        """
+        Chunks are parsed locally by `parse_numbered_list`.
+        If `llm_parse_fallback` is True, the LLM is additionally asked to parse a chunk
+        only when the local parser cannot recover every expected index.
+        If `streaming` is True, chunks are requested by `BaseChatModel.stream`,
+        and `generate` / `enumerate` yield each example as soon as its line is complete.
+        If `recover_missing_indices` is True, the indices which cannot be parsed are
+        requested again by a follow-up turn asking only for them, with the backoff and
+        the number of attempts of `retry_policy` (default: `RetryPolicy()`),
+        instead of raising `ValueError` immediately.
+        If `chunk_size_controller` is given, the `chunk_size` of a job is only the size of
+        the first chunk (and `chunk_size * num_chunk` the number of examples),
+        and the following chunks are sized by the controller.
+        The indices stay contiguous.
+        If `stable_prefix` is True, the format example in the system message does not
+        depend on `chunk_size`, so that jobs of any chunk size (without few-shots)
+        share the same prompt prefix for provider-side prompt caching.
+        An example is rejected if any of `validators` returns False for it.
+        If `overgeneration` is positive, each chunk asks for at most that many extra indices
+        (and at most the chunk size), and only the first examples which pass the validators
+        and the dedup check are yielded up to the chunk size,
+        so that rejected examples are replaced without another round-trip.
+        Missing indices are replaced by the extra ones too, and only the shortfall is recovered.
+        The extra indices are optional (never recovered), and the next chunk continues
+        from the last requested index.
+        After the first chunk, the number of extra indices follows the observed rejection rate
+        within that cap.
+        If `pipeline_depth` is positive, the next chunk is requested as soon as the answer
+        of a chunk arrives, while the answer is parsed (including the LLM parse fallback)
+        and validated on a worker and the examples of the chunks before are yielded,
+        with at most `pipeline_depth` chunks requested ahead
+        of the oldest unprocessed one (i.e. `pipeline_depth + 1` chunks in flight).
+        The examples are yielded in the same order, and the duplicate check and the recovery
+        of missing indices stay in order, but the chunk size controller, over-generation and
+        saturation see each chunk only when it is yielded, and a checkpoint does not include
+        the chunks ahead, which `resume` requests again. It cannot be combined with `streaming`.
+        The other arguments are as in `ChatModelSamplerBase`,
+        where extra chunks are requested to top up duplicates.
+        """
+        if streaming and pipeline_depth > 0:
+            raise ValueError("streaming and pipeline_depth cannot be combined.")
+        super().__init__(
+            llm,
+            history_policy=history_policy,
+            cache=cache,
+            dedup=dedup,
+            max_duplicate_retries=max_duplicate_retries,
+            retry_policy=retry_policy,
+            checkpoint_store=checkpoint_store,
+            instrumentation=instrumentation,
+            rate_limiter=rate_limiter,
+            priority=priority,
+            saturation_estimator=saturation_estimator,
+            hedge_policy=hedge_policy,
+            auxiliary_llm=auxiliary_llm,
+        )
+        self._recover_missing_indices = recover_missing_indices
+        self._llm_parse_fallback = llm_parse_fallback
+        self._streaming = streaming
+        self._chunk_size_controller = chunk_size_controller
+        self._stable_prefix = stable_prefix
+        self._validators = validators or []
+        self._overgeneration = overgeneration
+        self._pipeline_depth = pipeline_depth
+        self.parse_metrics = ChunkParseMetrics()
+        # the chunks are parsed on workers in the pipelined mode
+        self._metrics_lock = threading.Lock()
 
-    def _parse_llm_examples(self, text: str, index_list: list[int]) -> dict[int, str]:
-        messages = [
+    @classmethod
+    def _create_parse_messages(cls, text: str) -> list[BaseMessage]:
+        return [
             SystemMessage(
                 "\n".join(
                     [
@@ -84,8 +259,8 @@ class ChatModelChunkedTextEnumerator(object):
             HumanMessage(text),
         ]
 
-        ai_message = self._llm.invoke(messages)
-        ai_json = str(ai_message.content)
+    @classmethod
+    def _load_parsed_json(cls, ai_json: str, index_list: list[int]) -> dict[int, str]:
         while ai_json[: len("\n")] == "\n":
             ai_json = ai_json[len("\n") :]
         while ai_json[-len("\n") :] == "\n":
@@ -100,27 +275,146 @@ class ChatModelChunkedTextEnumerator(object):
         if not isinstance(obj, dict):
             raise TypeError(f"Parse error. `type(obj): {type(obj)}` is not dict.")
 
-        obj = {int(k): str(v) for k, v in obj.items()}
-        if set(obj.keys()) != set(index_list):
+        return {int(k): str(v) for k, v in obj.items() if int(k) in index_list}
+
+    @classmethod
+    def _check_complete(cls, index_list: list[int], missing_index_list: list[int]) -> None:
+        if missing_index_list:
+            keys = set(index_list) - set(missing_index_list)
             raise ValueError(
                 "\n".join(
                     [
                         "set(obj.keys()) != set(index_list)",
-                        f"set(obj.keys()): {set(obj.keys())}",
+                        f"set(obj.keys()): {keys}",
                         f"set(index_list): {set(index_list)}",
                     ]
                 )
             )
-        return obj
 
-    def generate_chunk(
+    @classmethod
+    def _find_missing(
+        cls, index_list: list[int], ai_dict: dict[int, str], num_missing: int | None
+    ) -> list[int]:
+        missing = [i for i in index_list if i not in ai_dict]
+        return missing if num_missing is None else missing[: max(num_missing, 0)]
+
+    def _accept_local_parse(
+        self, obj: dict[int, str], index_list: list[int], is_recovery: bool
+    ) -> bool:
+        """
+        returns False if the LLM fallback should be used.
+        The answers to recovery requests are not counted in `parse_metrics`,
+        which counts the chunks.
+        """
+        if is_recovery:
+            return set(obj.keys()) == set(index_list) or not self._llm_parse_fallback
+        with self._metrics_lock:
+            self.parse_metrics.num_chunk += 1
+            if set(obj.keys()) == set(index_list):
+                self.parse_metrics.num_local_parse += 1
+                return True
+            if not self._llm_parse_fallback:
+                return True
+            self.parse_metrics.num_llm_fallback += 1
+            return False
+
+    @classmethod
+    def _merge_parsed(
+        cls, obj: dict[int, str], ai_json: str, index_list: list[int]
+    ) -> dict[int, str]:
+        try:
+            parsed = cls._load_parsed_json(ai_json, index_list)
+        except (SyntaxError, TypeError, ValueError):
+            return obj
+        return {
+            i: obj[i] if i in obj else parsed[i]
+            for i in index_list
+            if i in obj or i in parsed
+        }
+
+    def _parse_locally(
+        self,
+        text: str,
+        index_list: list[int],
+        obj: dict[int, str] | None,
+        record: CallRecord | None,
+        is_recovery: bool,
+    ) -> tuple[dict[int, str], bool]:
+        start = time.perf_counter()
+        if obj is None:
+            obj = parse_numbered_list(text, index_list)
+        accepted = self._accept_local_parse(obj, index_list, is_recovery)
+        if record is not None:
+            record.parse_seconds += time.perf_counter() - start
+        return obj, accepted
+
+    def _parse_llm_examples(
+        self,
+        text: str,
+        index_list: list[int],
+        obj: dict[int, str] | None = None,
+        record: CallRecord | None = None,
+        is_recovery: bool = False,
+    ) -> dict[int, str]:
+        """
+        Returns the parsed examples, which may lack some indices.
+        `obj` is the result of local parsing if it is already done,
+        and `is_recovery` is True for the answer to a recovery request.
+        """
+        obj, accepted = self._parse_locally(text, index_list, obj, record, is_recovery)
+        if accepted:
+            return obj
+        ai_message = self._invoke(
+            self._create_parse_messages(text), record, auxiliary=True
+        )
+        return self._merge_parsed(obj, str(ai_message.content), index_list)
+
+    async def _aparse_llm_examples(
+        self,
+        text: str,
+        index_list: list[int],
+        obj: dict[int, str] | None = None,
+        record: CallRecord | None = None,
+        is_recovery: bool = False,
+    ) -> dict[int, str]:
+        obj, accepted = self._parse_locally(text, index_list, obj, record, is_recovery)
+        if accepted:
+            return obj
+        ai_message = await self._ainvoke(
+            self._create_parse_messages(text), record, auxiliary=True
+        )
+        return self._merge_parsed(obj, str(ai_message.content), index_list)
+
+    def _create_initial_messages(
         self,
         category_name: str,
         category_description: str | None,
         chunk_size: int,
-        num_chunk: int,
         few_shot_chunked_samples: list[list[str]] | None,
-    ) -> Generator[dict[int, str], None, None]:
+    ) -> list[BaseMessage]:
+        return self._memoized_prefix(
+            (
+                type(self),
+                category_name,
+                category_description,
+                chunk_size,
+                tuple(tuple(chunk) for chunk in few_shot_chunked_samples or []),
+            ),
+            lambda: self._create_prefix_messages(
+                category_name,
+                category_description,
+                chunk_size,
+                few_shot_chunked_samples,
+            ),
+        )
+
+    def _create_prefix_messages(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> list[BaseMessage]:
         if few_shot_chunked_samples is None:
             few_shot_chunked_samples = []
 
@@ -135,62 +429,962 @@ class ChatModelChunkedTextEnumerator(object):
                 category_name,
                 category_description,
                 first_index=1,
-                last_index=chunk_size,
+                last_index=(
+                    self._FORMAT_EXAMPLE_SIZE if self._stable_prefix else chunk_size
+                ),
             ),
         ]
-        for i_chunk in range(len(few_shot_chunked_samples) + num_chunk):
+        for i_chunk, chunked_sample in enumerate(few_shot_chunked_samples):
             first = i_chunk * chunk_size + 1
-            last = (i_chunk + 1) * chunk_size
             messages.append(
                 self._create_human_message(
                     category_name=category_name,
                     first_index=first,
-                    last_index=last,
+                    last_index=first + chunk_size - 1,
                     is_continuous=(i_chunk != 0),
                 )
             )
-            ai_text = ""
-            if i_chunk < len(few_shot_chunked_samples):
-                sample_ai_message: BaseMessage = AIMessage(
+            messages.append(
+                AIMessage(
                     "\n".join(
-                        [
-                            f"{first+i}. {sample}"
-                            for i, sample in enumerate(
-                                few_shot_chunked_samples[i_chunk]
-                            )
-                        ]
+                        [f"{first+i}. {sample}" for i, sample in enumerate(chunked_sample)]
                     )
                 )
-                messages.append(sample_ai_message)
-                ai_text = str(sample_ai_message.content)
-            else:
-                ai_message: BaseMessage = self._llm.invoke(messages)
-                messages.append(ai_message)
-                ai_text = str(ai_message.content)
-                ai_dict = self._parse_llm_examples(
-                    text=ai_text,
-                    index_list=[i for i in range(first, last + 1, 1)],
-                )
-                yield ai_dict
+            )
+        return messages
 
-    def generate(
+    def _request_chunk(
+        self,
+        category_name: str,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        record: CallRecord | None = None,
+    ) -> Generator[tuple[int, str], None, None]:
+        """
+        Requests a chunk for the last human message in `messages`, appends the answer to it,
+        and yields `(index, example)` of the chunk, which may lack some indices
+        (see `_recover_missing`).
+        """
+        history = self._select_history(messages, num_fixed, record)
+        streamed: dict[int, str] = {}
+        if self._streaming:
+            parser = NumberedListStreamParser(index_list)
+            message_chunks = []
+            for message_chunk in self._stream(history, record):
+                message_chunks.append(message_chunk)
+                for index, text in parser.feed(str(message_chunk.content)):
+                    streamed[index] = text
+                    yield (index, text)
+            for index, text in parser.close():
+                streamed[index] = text
+                yield (index, text)
+            ai_message = self._join_message_chunks(message_chunks)
+            messages.append(ai_message)
+            ai_dict = self._parse_llm_examples(
+                str(ai_message.content), index_list, obj=streamed, record=record
+            )
+        else:
+            ai_message = self._invoke(history, record)
+            messages.append(ai_message)
+            ai_dict = self._parse_llm_examples(
+                text=str(ai_message.content),
+                index_list=index_list,
+                record=record,
+            )
+        for index, text in ai_dict.items():
+            if index not in streamed:
+                yield (index, text)
+
+    def _recover_missing(
+        self,
+        category_name: str,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        ai_dict: dict[int, str],
+        record: CallRecord | None,
+        num_missing: int | None = None,
+    ) -> Generator[tuple[int, str], None, None]:
+        """
+        Requests the indices of `index_list` missing in `ai_dict` again
+        if `recover_missing_indices` (or raises `ValueError`),
+        and yields `(index, example)` of the recovered ones.
+        Only the first `num_missing` of them (default: all) are needed,
+        e.g. when the extra indices of over-generation have filled the others.
+        """
+        missing = self._find_missing(index_list, ai_dict, num_missing)
+        retry_policy = self._retry_policy or RetryPolicy()
+        i_retry = 0
+        while (
+            missing
+            and self._recover_missing_indices
+            and i_retry < retry_policy.max_retries
+        ):
+            if i_retry > 0:
+                # the first follow-up is not a retry of a failed request
+                time.sleep(retry_policy.delay(i_retry - 1))
+            i_retry += 1
+            self.parse_metrics.num_recovery_request += 1
+            messages.append(self._create_missing_human_message(category_name, missing))
+            ai_message = self._invoke(
+                self._select_history(messages, num_fixed, record), record
+            )
+            messages.append(ai_message)
+            recovered = self._parse_llm_examples(
+                str(ai_message.content), missing, record=record, is_recovery=True
+            )
+            self.parse_metrics.num_recovered_index += len(recovered)
+            yield from recovered.items()
+            missing = [i for i in missing if i not in recovered]
+        self._check_complete(index_list, missing)
+
+    async def _arequest_chunk(
+        self,
+        category_name: str,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        record: CallRecord | None = None,
+    ) -> AsyncGenerator[tuple[int, str], None]:
+        """async version of `_request_chunk`"""
+        history = self._select_history(messages, num_fixed, record)
+        streamed: dict[int, str] = {}
+        if self._streaming:
+            parser = NumberedListStreamParser(index_list)
+            message_chunks = []
+            async for message_chunk in self._astream(history, record):
+                message_chunks.append(message_chunk)
+                for index, text in parser.feed(str(message_chunk.content)):
+                    streamed[index] = text
+                    yield (index, text)
+            for index, text in parser.close():
+                streamed[index] = text
+                yield (index, text)
+            ai_message = self._join_message_chunks(message_chunks)
+            messages.append(ai_message)
+            ai_dict = await self._aparse_llm_examples(
+                str(ai_message.content), index_list, obj=streamed, record=record
+            )
+        else:
+            ai_message = await self._ainvoke(history, record)
+            messages.append(ai_message)
+            ai_dict = await self._aparse_llm_examples(
+                text=str(ai_message.content),
+                index_list=index_list,
+                record=record,
+            )
+        for index, text in ai_dict.items():
+            if index not in streamed:
+                yield (index, text)
+
+    async def _arecover_missing(
+        self,
+        category_name: str,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        ai_dict: dict[int, str],
+        record: CallRecord | None,
+        num_missing: int | None = None,
+    ) -> AsyncGenerator[tuple[int, str], None]:
+        """async version of `_recover_missing`"""
+        missing = self._find_missing(index_list, ai_dict, num_missing)
+        retry_policy = self._retry_policy or RetryPolicy()
+        i_retry = 0
+        while (
+            missing
+            and self._recover_missing_indices
+            and i_retry < retry_policy.max_retries
+        ):
+            if i_retry > 0:
+                # the first follow-up is not a retry of a failed request
+                await asyncio.sleep(retry_policy.delay(i_retry - 1))
+            i_retry += 1
+            self.parse_metrics.num_recovery_request += 1
+            messages.append(self._create_missing_human_message(category_name, missing))
+            ai_message = await self._ainvoke(
+                self._select_history(messages, num_fixed, record), record
+            )
+            messages.append(ai_message)
+            recovered = await self._aparse_llm_examples(
+                str(ai_message.content), missing, record=record, is_recovery=True
+            )
+            self.parse_metrics.num_recovered_index += len(recovered)
+            for item in recovered.items():
+                yield item
+            missing = [i for i in missing if i not in recovered]
+        self._check_complete(index_list, missing)
+
+    def _start_job(
         self,
         category_name: str,
         category_description: str | None,
         chunk_size: int,
         num_chunk: int,
         few_shot_chunked_samples: list[list[str]] | None,
-    ) -> Generator[str, None, None]:
-        chunk_gen = self.generate_chunk(
+    ) -> Checkpoint:
+        self._start_dedup([s for chunk in few_shot_chunked_samples or [] for s in chunk])
+        self._start_saturation()
+        self._start_checkpoint()
+        state = self._create_state(
             category_name,
             category_description,
             chunk_size,
             num_chunk,
             few_shot_chunked_samples,
         )
-        for chunk in chunk_gen:
-            for text in chunk.values():
-                yield text
+        if self._chunk_size_controller is not None:
+            self._chunk_size_controller.reset()
+            state.extra["chunk_size"] = self._chunk_size_controller.clamp(chunk_size)
+        return state
+
+    def _create_state(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> Checkpoint:
+        messages = self._create_initial_messages(
+            category_name, category_description, chunk_size, few_shot_chunked_samples
+        )
+        return Checkpoint(
+            sampler=type(self).__name__,
+            job={
+                "category_name": category_name,
+                "category_description": category_description,
+                "chunk_size": chunk_size,
+                "num_chunk": num_chunk,
+                "few_shot_chunked_samples": few_shot_chunked_samples,
+            },
+            messages=messages,
+            num_fixed=len(messages),
+            items=[],
+            next_index=len(few_shot_chunked_samples or []),
+        )
+
+    def _start_resume(self, checkpoint: Checkpoint) -> Checkpoint:
+        few_shot_chunked_samples = checkpoint.job["few_shot_chunked_samples"] or []
+        self._start_dedup(
+            [
+                *[s for chunk in few_shot_chunked_samples for s in chunk],
+                *[text for _, text in checkpoint.items],
+            ]
+        )
+        self._start_saturation()
+        return Checkpoint(
+            sampler=checkpoint.sampler,
+            job=checkpoint.job,
+            messages=list(checkpoint.messages),
+            num_fixed=checkpoint.num_fixed,
+            items=list(checkpoint.items),
+            next_index=checkpoint.next_index,
+            extra=dict(checkpoint.extra),
+        )
+
+    def _next_index_list(self, state: Checkpoint) -> list[int]:
+        chunk_size = state.job["chunk_size"]
+        first = state.extra.get("next_first_index", state.next_index * chunk_size + 1)
+        size = state.extra.get("chunk_size", chunk_size)
+        if self._chunk_size_controller is not None:
+            # no more examples than needed are requested
+            num_rest = chunk_size * state.job["num_chunk"] - len(state.items)
+            size = max(min(size, num_rest), 1)
+        return list(range(first, first + size))
+
+    def _num_extra_index(self, state: Checkpoint, size: int) -> int:
+        """
+        the number of extra indices requested in addition to a chunk of `size`,
+        so that the expected number of accepted examples covers `size` with a margin
+        of about one standard deviation at the rejection rate observed so far,
+        capped by `overgeneration` and `size`
+        """
+        if self._overgeneration <= 0:
+            return 0
+        cap = min(self._overgeneration, size)
+        rate = state.extra.get("rejection_rate")
+        if rate is None:
+            return cap
+        rate = min(rate, 0.5)
+        return min(
+            math.ceil((size * rate + math.sqrt(size * rate * (1 - rate))) / (1 - rate)),
+            cap,
+        )
+
+    def _has_next_chunk(self, state: Checkpoint, num_pending: int = 0) -> bool:
+        """`num_pending` is the number of examples expected from the chunks ahead"""
+        chunk_size = state.job["chunk_size"]
+        num_chunk = state.job["num_chunk"]
+        num_few_shot = len(state.job["few_shot_chunked_samples"] or [])
+        if len(state.items) + num_pending >= chunk_size * num_chunk:
+            return False
+        # the extra indices of over-generation do not count as calls
+        first = self._next_index_list(state)[0] - state.extra.get("num_extra_index", 0)
+        return first <= (num_few_shot + self._max_num_call(num_chunk)) * chunk_size
+
+    def _num_shortfall(self, state: Checkpoint, num_required: int, num_item: int) -> int:
+        """the number of the examples which a chunk still lacks after `num_item` accepted"""
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        return min(num_required - num_item, num_target - len(state.items))
+
+    def _is_valid(self, text: str) -> bool:
+        return all(validator(text) for validator in self._validators)
+
+    def _validity(self, ai_dict: dict[int, str]) -> dict[int, bool]:
+        return {index: self._is_valid(text) for index, text in ai_dict.items()}
+
+    def _end_chunk(
+        self,
+        state: Checkpoint,
+        index_list: list[int],
+        num_required: int,
+        seconds: float,
+        texts: dict[int, str],
+        num_checked: int,
+        num_new: int,
+        num_recovered: int,
+        ahead: _PendingChunk | None = None,
+    ) -> None:
+        """
+        updates the state after a chunk, where `texts` are the examples parsed in the chunk,
+        of which `num_checked` were checked by the validators and the dedup check.
+        `ahead` is the oldest chunk already requested in the pipelined mode.
+        """
+        state.next_index += 1
+        # the chunks ahead in the pipelined mode have already moved it
+        state.extra["next_first_index"] = max(
+            state.extra.get("next_first_index", 0), index_list[-1] + 1
+        )
+        num_rejected = num_checked - num_new
+        self.parse_metrics.num_rejected += num_rejected
+        if self._overgeneration > 0:
+            num_extra = len(index_list) - num_required
+            state.extra["num_extra_index"] = (
+                state.extra.get("num_extra_index", 0) + num_extra
+            )
+            self.parse_metrics.num_extra_index += num_extra
+            # the missing indices are not observed if the chunk was filled before them
+            num_missing = (
+                len(index_list) - len(texts) if num_new < num_required else 0
+            )
+            if num_checked + num_missing > 0:
+                rate = (num_rejected + num_missing) / (num_checked + num_missing)
+                last_rate = state.extra.get("rejection_rate")
+                state.extra["rejection_rate"] = (
+                    rate if last_rate is None else 0.5 * last_rate + 0.5 * rate
+                )
+        if self._chunk_size_controller is not None:
+            state.extra["chunk_size"] = self._chunk_size_controller.next_chunk_size(
+                ChunkObservation(
+                    chunk_size=num_required,
+                    seconds=seconds,
+                    num_missing=sum(
+                        i not in texts for i in index_list[:num_required]
+                    )
+                    + num_recovered,
+                    num_duplicate=num_rejected,
+                    num_item=len(texts),
+                    # the same estimation as `estimate_num_tokens`
+                    num_output_tokens=sum(len(text) for text in texts.values()) // 4,
+                ),
+                estimate_num_tokens(self._select_history(state.messages, state.num_fixed)),
+            )
+        messages = state.messages
+        extra = state.extra
+        if ahead is not None:
+            # the chunks ahead are left out, so that `resume` requests them again
+            messages = messages[: ahead.num_message]
+            extra = {**extra, "next_first_index": ahead.index_list[0]}
+        self._save_checkpoint(
+            state.job, messages, state.num_fixed, state.items, state.next_index, extra
+        )
+
+    def _append_chunk_request(
+        self, state: Checkpoint, num_ahead: int = 0
+    ) -> tuple[list[int], int]:
+        """
+        Appends the request of the next chunk to the messages of `state`,
+        and returns its indices (with the extra ones) and the number of the required ones.
+        `num_ahead` is the number of the chunks requested ahead in the pipelined mode.
+        """
+        index_list = self._next_index_list(state)
+        num_required = len(index_list)
+        index_list += [
+            index_list[-1] + 1 + i
+            for i in range(self._num_extra_index(state, num_required))
+        ]
+        state.messages.append(
+            self._create_human_message(
+                category_name=state.job["category_name"],
+                first_index=index_list[0],
+                last_index=index_list[-1],
+                is_continuous=(state.next_index + num_ahead != 0),
+            )
+        )
+        return index_list, num_required
+
+    def _generate_items(
+        self, state: Checkpoint
+    ) -> Generator[tuple[int, str] | None, None, None]:
+        """
+        Continues the job of `state` (updating it),
+        and yields `(index, example)` with the index numbered by LLM,
+        and `None` at the end of each chunk.
+        """
+        if self._pipeline_depth > 0:
+            yield from self._generate_items_pipelined(state)
+            return
+        category_name = state.job["category_name"]
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        messages = state.messages
+        while self._has_next_chunk(state):
+            index_list, num_required = self._append_chunk_request(state)
+            record = self._start_record("chunk")
+            num_item = 0
+            num_checked = 0
+            texts: dict[int, str] = {}
+            num_recovered = self.parse_metrics.num_recovered_index
+            start = time.perf_counter()
+            paused = 0.0
+            # the missing indices are recovered only for the shortfall
+            # left after the parsed examples (including the extra ones)
+            for is_recovery in (False, True):
+                for index, text in (
+                    self._recover_missing(
+                        category_name,
+                        messages,
+                        state.num_fixed,
+                        index_list[:num_required],
+                        texts,
+                        record,
+                        self._num_shortfall(state, num_required, num_item),
+                    )
+                    if is_recovery
+                    else self._request_chunk(
+                        category_name, messages, state.num_fixed, index_list, record
+                    )
+                ):
+                    texts[index] = text
+                    if num_item >= num_required or len(state.items) >= num_target:
+                        continue
+                    num_checked += 1
+                    if self._is_valid(text) and self._is_new(text):
+                        state.items.append([index, text])
+                        num_item += 1
+                        pause = time.perf_counter()
+                        yield (index, text)
+                        paused += time.perf_counter() - pause
+            self._end_chunk(
+                state,
+                index_list,
+                num_required,
+                time.perf_counter() - start - paused,
+                texts,
+                num_checked,
+                num_item,
+                self.parse_metrics.num_recovered_index - num_recovered,
+            )
+            self._finish_record(record, num_item)
+            yield None
+            if self._is_saturated(list(texts.values())):
+                break
+        self._end_job(len(state.items) >= num_target)
+
+    async def _agenerate_items(
+        self, state: Checkpoint
+    ) -> AsyncGenerator[tuple[int, str] | None, None]:
+        """async version of `_generate_items`"""
+        if self._pipeline_depth > 0:
+            async for item in self._agenerate_items_pipelined(state):
+                yield item
+            return
+        category_name = state.job["category_name"]
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        messages = state.messages
+        while self._has_next_chunk(state):
+            index_list, num_required = self._append_chunk_request(state)
+            record = self._start_record("chunk")
+            num_item = 0
+            num_checked = 0
+            texts: dict[int, str] = {}
+            num_recovered = self.parse_metrics.num_recovered_index
+            start = time.perf_counter()
+            paused = 0.0
+            for is_recovery in (False, True):
+                async for index, text in (
+                    self._arecover_missing(
+                        category_name,
+                        messages,
+                        state.num_fixed,
+                        index_list[:num_required],
+                        texts,
+                        record,
+                        self._num_shortfall(state, num_required, num_item),
+                    )
+                    if is_recovery
+                    else self._arequest_chunk(
+                        category_name, messages, state.num_fixed, index_list, record
+                    )
+                ):
+                    texts[index] = text
+                    if num_item >= num_required or len(state.items) >= num_target:
+                        continue
+                    num_checked += 1
+                    if self._is_valid(text) and self._is_new(text):
+                        state.items.append([index, text])
+                        num_item += 1
+                        pause = time.perf_counter()
+                        yield (index, text)
+                        paused += time.perf_counter() - pause
+            self._end_chunk(
+                state,
+                index_list,
+                num_required,
+                time.perf_counter() - start - paused,
+                texts,
+                num_checked,
+                num_item,
+                self.parse_metrics.num_recovered_index - num_recovered,
+            )
+            self._finish_record(record, num_item)
+            yield None
+            if self._is_saturated(list(texts.values())):
+                break
+        self._end_job(len(state.items) >= num_target)
+
+    def _start_chunk_request(
+        self, state: Checkpoint, num_ahead: int
+    ) -> tuple[_PendingChunk, list[BaseMessage]]:
+        """appends the request of the next chunk, and returns it with the history to send"""
+        num_message = len(state.messages)
+        index_list, num_required = self._append_chunk_request(state, num_ahead)
+        record = self._start_record("chunk")
+        # the next chunk is requested before `_end_chunk` of this one
+        state.extra["next_first_index"] = index_list[-1] + 1
+        chunk = _PendingChunk(index_list, num_required, record, num_message)
+        return chunk, self._select_history(state.messages, state.num_fixed, record)
+
+    def _send_chunk(
+        self, state: Checkpoint, chunk: _PendingChunk, history: list[BaseMessage]
+    ) -> _PendingChunk:
+        """sends the request of `chunk` (on a worker) and appends its answer, without parsing it"""
+        ai_message = self._invoke(history, chunk.record)
+        state.messages.append(ai_message)
+        chunk.text = str(ai_message.content)
+        return chunk
+
+    async def _asend_chunk(
+        self, state: Checkpoint, chunk: _PendingChunk, history: list[BaseMessage]
+    ) -> _PendingChunk:
+        ai_message = await self._ainvoke(history, chunk.record)
+        state.messages.append(ai_message)
+        chunk.text = str(ai_message.content)
+        return chunk
+
+    def _parse_chunk(
+        self, chunk: _PendingChunk
+    ) -> tuple[dict[int, str], dict[int, bool]]:
+        """parses and validates `chunk` (on a worker), and returns the examples and their validity"""
+        ai_dict = self._parse_llm_examples(
+            chunk.text, chunk.index_list, record=chunk.record
+        )
+        validity = self._validity(ai_dict)
+        chunk.seconds = time.perf_counter() - chunk.start
+        return ai_dict, validity
+
+    async def _aparse_chunk(
+        self, chunk: _PendingChunk
+    ) -> tuple[dict[int, str], dict[int, bool]]:
+        ai_dict = await self._aparse_llm_examples(
+            chunk.text, chunk.index_list, record=chunk.record
+        )
+        # the validators are blocking, so they are run off the event loop
+        validity = await asyncio.to_thread(self._validity, ai_dict)
+        chunk.seconds = time.perf_counter() - chunk.start
+        return ai_dict, validity
+
+    def _check_items(
+        self,
+        state: Checkpoint,
+        chunk: _PendingChunk,
+        items: list[tuple[int, str]],
+        validity: dict[int, bool],
+        texts: dict[int, str],
+        accepted: list[tuple[int, str]],
+    ) -> int:
+        """
+        checks the parsed (or recovered) examples of `chunk` in order,
+        adds them to `texts` and the accepted ones to `accepted`,
+        and returns the number of the checked ones
+        """
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        num_checked = 0
+        for index, text in items:
+            texts[index] = text
+            if len(accepted) >= chunk.num_required or len(state.items) >= num_target:
+                continue
+            num_checked += 1
+            is_valid = validity[index] if index in validity else self._is_valid(text)
+            if is_valid and self._is_new(text):
+                state.items.append([index, text])
+                accepted.append((index, text))
+        return num_checked
+
+    def _accept_chunk(
+        self,
+        state: Checkpoint,
+        chunk: _PendingChunk,
+        recovered: list[tuple[int, str]],
+        validity: dict[int, bool],
+        texts: dict[int, str],
+        accepted: list[tuple[int, str]],
+        num_checked: int,
+        ahead: _PendingChunk | None,
+    ) -> None:
+        """
+        checks the recovered examples of `chunk` after the `num_checked` parsed ones,
+        and ends the chunk
+        """
+        num_checked += self._check_items(
+            state, chunk, recovered, validity, texts, accepted
+        )
+        self._end_chunk(
+            state,
+            chunk.index_list,
+            chunk.num_required,
+            chunk.seconds,
+            texts,
+            num_checked,
+            len(accepted),
+            len(recovered),
+            ahead,
+        )
+        self._finish_record(chunk.record, len(accepted))
+
+    def _generate_items_pipelined(
+        self, state: Checkpoint
+    ) -> Generator[tuple[int, str] | None, None, None]:
+        """
+        `_generate_items` which sends the next chunk and parses the received ones
+        on worker threads, while the examples of the oldest chunk are checked and yielded
+        """
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        pending: collections.deque[
+            tuple[_PendingChunk, Future[tuple[dict[int, str], dict[int, bool]]]]
+        ] = collections.deque()
+        sending: tuple[_PendingChunk, Future[_PendingChunk]] | None = None
+        executor = ThreadPoolExecutor(
+            max_workers=self._pipeline_depth + 2, thread_name_prefix="pipeline"
+        )
+        try:
+            while True:
+                if sending is not None and (sending[1].done() or not pending):
+                    chunk = sending[1].result()
+                    pending.append((chunk, executor.submit(self._parse_chunk, chunk)))
+                    sending = None
+                    continue
+                # the oldest unprocessed chunk and `pipeline_depth` chunks ahead of it,
+                # of which one is sent at a time since each continues the conversation
+                if (
+                    sending is None
+                    and len(pending) <= self._pipeline_depth
+                    and self._has_next_chunk(
+                        state, sum(chunk.num_required for chunk, _ in pending)
+                    )
+                ):
+                    chunk, history = self._start_chunk_request(state, len(pending))
+                    sending = (
+                        chunk,
+                        executor.submit(self._send_chunk, state, chunk, history),
+                    )
+                    continue
+                if not pending:
+                    break
+                chunk, future = pending.popleft()
+                ai_dict, validity = future.result()
+                texts: dict[int, str] = {}
+                accepted: list[tuple[int, str]] = []
+                num_checked = self._check_items(
+                    state, chunk, list(ai_dict.items()), validity, texts, accepted
+                )
+                required = chunk.index_list[: chunk.num_required]
+                num_shortfall = self._num_shortfall(
+                    state, chunk.num_required, len(accepted)
+                )
+                if sending is not None and self._find_missing(
+                    required, texts, num_shortfall
+                ):
+                    # the recovery turns follow the answer of the request in flight
+                    sending[1].result()
+                recovered = list(
+                    self._recover_missing(
+                        state.job["category_name"],
+                        state.messages,
+                        state.num_fixed,
+                        required,
+                        texts,
+                        chunk.record,
+                        num_shortfall,
+                    )
+                )
+                # the oldest chunk already requested
+                ahead = pending[0][0] if pending else sending[0] if sending else None
+                self._accept_chunk(
+                    state,
+                    chunk,
+                    recovered,
+                    validity,
+                    texts,
+                    accepted,
+                    num_checked,
+                    ahead,
+                )
+                yield from accepted
+                yield None
+                if self._is_saturated(list(texts.values())):
+                    break
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._end_job(len(state.items) >= num_target)
+
+    async def _agenerate_items_pipelined(
+        self, state: Checkpoint
+    ) -> AsyncGenerator[tuple[int, str] | None, None]:
+        """async version of `_generate_items_pipelined`, where the workers are tasks"""
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        pending: collections.deque[
+            tuple[_PendingChunk, asyncio.Task[tuple[dict[int, str], dict[int, bool]]]]
+        ] = collections.deque()
+        sending: tuple[_PendingChunk, asyncio.Task[_PendingChunk]] | None = None
+        try:
+            while True:
+                if sending is not None and (sending[1].done() or not pending):
+                    chunk = await sending[1]
+                    pending.append(
+                        (chunk, asyncio.ensure_future(self._aparse_chunk(chunk)))
+                    )
+                    sending = None
+                    continue
+                if (
+                    sending is None
+                    and len(pending) <= self._pipeline_depth
+                    and self._has_next_chunk(
+                        state, sum(chunk.num_required for chunk, _ in pending)
+                    )
+                ):
+                    chunk, history = self._start_chunk_request(state, len(pending))
+                    sending = (
+                        chunk,
+                        asyncio.ensure_future(self._asend_chunk(state, chunk, history)),
+                    )
+                    continue
+                if not pending:
+                    break
+                chunk, task = pending.popleft()
+                ai_dict, validity = await task
+                texts: dict[int, str] = {}
+                accepted: list[tuple[int, str]] = []
+                num_checked = self._check_items(
+                    state, chunk, list(ai_dict.items()), validity, texts, accepted
+                )
+                required = chunk.index_list[: chunk.num_required]
+                num_shortfall = self._num_shortfall(
+                    state, chunk.num_required, len(accepted)
+                )
+                if sending is not None and self._find_missing(
+                    required, texts, num_shortfall
+                ):
+                    await sending[1]
+                recovered = [
+                    item
+                    async for item in self._arecover_missing(
+                        state.job["category_name"],
+                        state.messages,
+                        state.num_fixed,
+                        required,
+                        texts,
+                        chunk.record,
+                        num_shortfall,
+                    )
+                ]
+                # the oldest chunk already requested
+                ahead = pending[0][0] if pending else sending[0] if sending else None
+                self._accept_chunk(
+                    state,
+                    chunk,
+                    recovered,
+                    validity,
+                    texts,
+                    accepted,
+                    num_checked,
+                    ahead,
+                )
+                for item in accepted:
+                    yield item
+                yield None
+                if self._is_saturated(list(texts.values())):
+                    break
+        finally:
+            for _, task in pending:
+                task.cancel()
+            if sending is not None:
+                sending[1].cancel()
+        self._end_job(len(state.items) >= num_target)
+
+    def _start_many(
+        self,
+        specs: list[CategorySpec | tuple],
+        chunk_size: int,
+        num_chunk: int,
+    ) -> list[Checkpoint]:
+        category_specs: list[CategorySpec] = [
+            spec if isinstance(spec, CategorySpec) else CategorySpec(*spec)
+            for spec in specs
+        ]
+        category_names = [spec.category_name for spec in category_specs]
+        if len(set(category_names)) != len(category_names):
+            raise ValueError(f"category names must be unique: {category_names}")
+        self._start_dedup(
+            [
+                s
+                for spec in category_specs
+                for chunk in spec.few_shot_chunked_samples or []
+                for s in chunk
+            ]
+        )
+        self._start_saturation()
+        return [
+            self._create_state(
+                spec.category_name,
+                spec.category_description,
+                chunk_size,
+                num_chunk,
+                spec.few_shot_chunked_samples,
+            )
+            for spec in category_specs
+        ]
+
+    def _start_round(
+        self, states: list[Checkpoint]
+    ) -> list[tuple[Checkpoint, list[int], CallRecord | None, list[BaseMessage]]]:
+        """
+        Appends the request of the next chunk to each unfinished job of `states`,
+        and returns `(state, index_list, record, history)` of them.
+        """
+        pending = []
+        for state in states:
+            chunk_size = state.job["chunk_size"]
+            num_chunk = state.job["num_chunk"]
+            num_few_shot = len(state.job["few_shot_chunked_samples"] or [])
+            if (
+                len(state.items) >= chunk_size * num_chunk
+                or state.next_index >= num_few_shot + self._max_num_call(num_chunk)
+            ):
+                continue
+            first = state.next_index * chunk_size + 1
+            index_list = list(range(first, first + chunk_size))
+            record = self._start_record("chunk")
+            state.messages.append(
+                self._create_human_message(
+                    category_name=state.job["category_name"],
+                    first_index=index_list[0],
+                    last_index=index_list[-1],
+                    is_continuous=(state.next_index != 0),
+                )
+            )
+            history = self._select_history(state.messages, state.num_fixed, record)
+            pending.append((state, index_list, record, history))
+        return pending
+
+    def _end_many(self, states: list[Checkpoint]) -> None:
+        self._end_job(
+            all(
+                len(state.items) >= state.job["chunk_size"] * state.job["num_chunk"]
+                for state in states
+            )
+        )
+
+    def _add_item(self, state: Checkpoint, index: int, text: str) -> int | None:
+        """returns the number of the example in its category if it is accepted"""
+        num_target = state.job["chunk_size"] * state.job["num_chunk"]
+        if len(state.items) >= num_target:
+            return None
+        if self._is_valid(text) and self._is_new(text):
+            state.items.append([index, text])
+            return len(state.items) - 1
+        self.parse_metrics.num_rejected += 1
+        return None
+
+    def generate_chunk(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> Generator[dict[int, str], None, None]:
+        chunk: dict[int, str] = {}
+        for item in self._generate_items(
+            self._start_job(
+                category_name,
+                category_description,
+                chunk_size,
+                num_chunk,
+                few_shot_chunked_samples,
+            )
+        ):
+            if item is None:
+                yield dict(sorted(chunk.items()))
+                chunk = {}
+            else:
+                chunk[item[0]] = item[1]
+
+    async def agenerate_chunk(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> AsyncGenerator[dict[int, str], None]:
+        """async version of `generate_chunk` using `BaseChatModel.ainvoke`"""
+        chunk: dict[int, str] = {}
+        async for item in self._agenerate_items(
+            self._start_job(
+                category_name,
+                category_description,
+                chunk_size,
+                num_chunk,
+                few_shot_chunked_samples,
+            )
+        ):
+            if item is None:
+                yield dict(sorted(chunk.items()))
+                chunk = {}
+            else:
+                chunk[item[0]] = item[1]
+
+    def generate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> Generator[str, None, None]:
+        for item in self._generate_items(
+            self._start_job(
+                category_name,
+                category_description,
+                chunk_size,
+                num_chunk,
+                few_shot_chunked_samples,
+            )
+        ):
+            if item is not None:
+                yield item[1]
 
     def enumerate(
         self,
@@ -228,3 +1422,178 @@ class ChatModelChunkedTextEnumerator(object):
                 few_shot_chunked_samples,
             )
         ]
+
+    async def agenerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> AsyncGenerator[str, None]:
+        async for item in self._agenerate_items(
+            self._start_job(
+                category_name,
+                category_description,
+                chunk_size,
+                num_chunk,
+                few_shot_chunked_samples,
+            )
+        ):
+            if item is not None:
+                yield item[1]
+
+    async def aenumerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> AsyncGenerator[tuple[int, str], None]:
+        generator = self.agenerate(
+            category_name,
+            category_description,
+            chunk_size,
+            num_chunk,
+            few_shot_chunked_samples,
+        )
+        i = 0
+        async for e in generator:
+            yield (i, e)
+            i += 1
+
+    async def asample_n(
+        self,
+        category_name: str,
+        category_description: str | None,
+        chunk_size: int,
+        num_chunk: int,
+        few_shot_chunked_samples: list[list[str]] | None,
+    ) -> list[str]:
+        return [
+            text
+            async for text in self.agenerate(
+                category_name,
+                category_description,
+                chunk_size,
+                num_chunk,
+                few_shot_chunked_samples,
+            )
+        ]
+
+    def resume(self, checkpoint: Checkpoint) -> Generator[tuple[int, str], None, None]:
+        """
+        continues `enumerate` from `checkpoint` without calling LLM again for the completed chunks.
+        The numbering continues from the examples yielded before the checkpoint.
+        """
+        state = self._start_resume(checkpoint)
+        i = len(state.items)
+        for item in self._generate_items(state):
+            if item is not None:
+                yield (i, item[1])
+                i += 1
+
+    async def aresume(
+        self, checkpoint: Checkpoint
+    ) -> AsyncGenerator[tuple[int, str], None]:
+        """async version of `resume`"""
+        state = self._start_resume(checkpoint)
+        i = len(state.items)
+        async for item in self._agenerate_items(state):
+            if item is not None:
+                yield (i, item[1])
+                i += 1
+
+    def enumerate_many(
+        self,
+        specs: list[CategorySpec | tuple],
+        chunk_size: int,
+        num_chunk: int,
+        max_concurrency: int | None = None,
+    ) -> Generator[tuple[str, int, str], None, None]:
+        """
+        Enumerates the categories of `specs` (`CategorySpec` or tuples of its fields)
+        in lock-step: each round requests the next chunk of every unfinished category
+        by one `batch` call with at most `max_concurrency` requests in flight,
+        and yields `(category_name, index, example)` as the answers complete.
+        `index` is numbered per category as in `enumerate`.
+        The chunk size is fixed (`chunk_size_controller`, `overgeneration`, `streaming`,
+        `saturation_estimator` and `pipeline_depth` are not used),
+        no checkpoint is saved, and `dedup` is shared by all categories.
+        `stop_reason` is "complete" if every category has got its examples.
+        """
+        states = self._start_many(specs, chunk_size, num_chunk)
+        while pending := self._start_round(states):
+            for i, ai_message in self._batch_invoke(
+                [history for _, _, _, history in pending],
+                max_concurrency,
+                [record for _, _, record, _ in pending],
+            ):
+                state, index_list, record, _ = pending[i]
+                category_name = state.job["category_name"]
+                state.messages.append(ai_message)
+                ai_dict = self._parse_llm_examples(
+                    str(ai_message.content), index_list, record=record
+                )
+                num_item = 0
+                for index, text in [
+                    *ai_dict.items(),
+                    *self._recover_missing(
+                        category_name,
+                        state.messages,
+                        state.num_fixed,
+                        index_list,
+                        ai_dict,
+                        record,
+                    ),
+                ]:
+                    number = self._add_item(state, index, text)
+                    if number is not None:
+                        num_item += 1
+                        yield (category_name, number, text)
+                state.next_index += 1
+                self._finish_record(record, num_item)
+        self._end_many(states)
+
+    async def aenumerate_many(
+        self,
+        specs: list[CategorySpec | tuple],
+        chunk_size: int,
+        num_chunk: int,
+        max_concurrency: int | None = None,
+    ) -> AsyncGenerator[tuple[str, int, str], None]:
+        """async version of `enumerate_many`"""
+        states = self._start_many(specs, chunk_size, num_chunk)
+        while pending := self._start_round(states):
+            async for i, ai_message in self._abatch_invoke(
+                [history for _, _, _, history in pending],
+                max_concurrency,
+                [record for _, _, record, _ in pending],
+            ):
+                state, index_list, record, _ = pending[i]
+                category_name = state.job["category_name"]
+                state.messages.append(ai_message)
+                ai_dict = await self._aparse_llm_examples(
+                    str(ai_message.content), index_list, record=record
+                )
+                recovered = [
+                    item
+                    async for item in self._arecover_missing(
+                        category_name,
+                        state.messages,
+                        state.num_fixed,
+                        index_list,
+                        ai_dict,
+                        record,
+                    )
+                ]
+                num_item = 0
+                for index, text in [*ai_dict.items(), *recovered]:
+                    number = self._add_item(state, index, text)
+                    if number is not None:
+                        num_item += 1
+                        yield (category_name, number, text)
+                state.next_index += 1
+                self._finish_record(record, num_item)
+        self._end_many(states)
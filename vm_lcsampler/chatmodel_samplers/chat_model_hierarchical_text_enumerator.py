@@ -0,0 +1,240 @@
+from __future__ import annotations
+import itertools
+from typing import TYPE_CHECKING, AsyncGenerator, Generator
+from .chat_model_chunked_text_enumerator import (
+    CategorySpec,
+    ChatModelChunkedTextEnumerator,
+)
+from .dedup import DedupIndex
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+
+class ChatModelHierarchicalTextEnumerator(object):
+    """
+    Enumerates many examples of a category by stratifying it.
+
+    First, subcategories of the category are enumerated by `subcategory_enumerator`.
+    Then, the examples of each subcategory are enumerated by `leaf_enumerator.enumerate_many`,
+    where the conversations of the subcategories run concurrently in lock-step
+    and each of them stays short.
+    The examples are deduplicated across the subcategories by the `dedup` of `leaf_enumerator`,
+    and numbered continuously.
+    """
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        subcategory_enumerator: ChatModelChunkedTextEnumerator | None = None,
+        leaf_enumerator: ChatModelChunkedTextEnumerator | None = None,
+        max_concurrency: int | None = None,
+    ) -> None:
+        """
+        By default, both enumerators are `ChatModelChunkedTextEnumerator(llm)`
+        with a new `DedupIndex` for each job, and the leaf one also recovers missing indices.
+        `max_concurrency` limits the LLM calls in flight for the subcategories.
+        `subcategories` holds the subcategories of the last job.
+        """
+        self._llm = llm
+        self._subcategory_enumerator = subcategory_enumerator
+        self._leaf_enumerator = leaf_enumerator
+        self._max_concurrency = max_concurrency
+        self.subcategories: list[str] = []
+
+    def _start_job(
+        self,
+    ) -> tuple[ChatModelChunkedTextEnumerator, ChatModelChunkedTextEnumerator]:
+        """returns the enumerators of the subcategories and of the leaves"""
+        return (
+            self._subcategory_enumerator
+            or ChatModelChunkedTextEnumerator(self._llm, dedup=DedupIndex()),
+            self._leaf_enumerator
+            or ChatModelChunkedTextEnumerator(
+                self._llm, dedup=DedupIndex(), recover_missing_indices=True
+            ),
+        )
+
+    @classmethod
+    def _create_subcategory_name(cls, category_name: str) -> str:
+        return f"subcategories of {category_name}"
+
+    @classmethod
+    def _create_subcategory_description(
+        cls, category_name: str, category_description: str | None
+    ) -> str:
+        return "\n".join(
+            [
+                f"Each example is a subcategory (a kind or a group) of `{category_name}`"
+                " which does not overlap with the other subcategories.",
+                "Together, the subcategories should cover as many examples as they can.",
+                *(
+                    [
+                        f"The description of {category_name} is as follows.",
+                        category_description,
+                    ]
+                    if category_description
+                    else []
+                ),
+            ]
+        )
+
+    @classmethod
+    def _create_leaf_spec(
+        cls, category_name: str, category_description: str | None, subcategory: str
+    ) -> CategorySpec:
+        return CategorySpec(
+            category_name=f"{category_name} ({subcategory})",
+            category_description="\n".join(
+                [
+                    f"Every example should be `{category_name}`"
+                    f" and belong to `{subcategory}`.",
+                    *([category_description] if category_description else []),
+                ]
+            ),
+        )
+
+    def _subcategory_args(
+        self, category_name: str, category_description: str | None, num_subcategory: int
+    ) -> tuple[str, str, int, int, None]:
+        if num_subcategory < 1:
+            raise ValueError(
+                f"num_subcategory >= 1 must be satisfied. num_subcategory: {num_subcategory}"
+            )
+        chunk_size = min(num_subcategory, 20)
+        return (
+            self._create_subcategory_name(category_name),
+            self._create_subcategory_description(category_name, category_description),
+            chunk_size,
+            -(-num_subcategory // chunk_size),
+            None,
+        )
+
+    def _start_leaves(
+        self,
+        category_name: str,
+        category_description: str | None,
+        subcategories: list[str],
+    ) -> dict[str, str]:
+        """returns the subcategory of each leaf category name"""
+        self.subcategories = subcategories
+        return {
+            self._create_leaf_spec(
+                category_name, category_description, subcategory
+            ).category_name: subcategory
+            for subcategory in subcategories
+        }
+
+    def enumerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        num_subcategory: int,
+        num_per_subcategory: int,
+        chunk_size: int,
+    ) -> Generator[tuple[str, int, str], None, None]:
+        """
+        yields `(subcategory, index, example)` of at most `num_per_subcategory` examples
+        for each of `num_subcategory` subcategories,
+        where the leaves are enumerated by chunks of `chunk_size`
+        and `index` is numbered continuously across the subcategories.
+        """
+        subcategory_enumerator, leaf_enumerator = self._start_job()
+        subcategories = list(
+            itertools.islice(
+                subcategory_enumerator.generate(
+                    *self._subcategory_args(
+                        category_name, category_description, num_subcategory
+                    )
+                ),
+                num_subcategory,
+            )
+        )
+        leaves = self._start_leaves(category_name, category_description, subcategories)
+        counts = dict.fromkeys(leaves, 0)
+        index = 0
+        for leaf, _, text in leaf_enumerator.enumerate_many(
+            [
+                self._create_leaf_spec(category_name, category_description, subcategory)
+                for subcategory in subcategories
+            ],
+            chunk_size,
+            -(-num_per_subcategory // chunk_size),
+            self._max_concurrency,
+        ):
+            if counts[leaf] >= num_per_subcategory:
+                continue
+            counts[leaf] += 1
+            yield (leaves[leaf], index, text)
+            index += 1
+
+    def generate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        num_subcategory: int,
+        num_per_subcategory: int,
+        chunk_size: int,
+    ) -> Generator[str, None, None]:
+        for _, _, text in self.enumerate(
+            category_name,
+            category_description,
+            num_subcategory,
+            num_per_subcategory,
+            chunk_size,
+        ):
+            yield text
+
+    async def aenumerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        num_subcategory: int,
+        num_per_subcategory: int,
+        chunk_size: int,
+    ) -> AsyncGenerator[tuple[str, int, str], None]:
+        """async version of `enumerate`"""
+        subcategory_enumerator, leaf_enumerator = self._start_job()
+        subcategories: list[str] = []
+        async for subcategory in subcategory_enumerator.agenerate(
+            *self._subcategory_args(
+                category_name, category_description, num_subcategory
+            )
+        ):
+            subcategories.append(subcategory)
+            if len(subcategories) >= num_subcategory:
+                break
+        leaves = self._start_leaves(category_name, category_description, subcategories)
+        counts = dict.fromkeys(leaves, 0)
+        index = 0
+        async for leaf, _, text in leaf_enumerator.aenumerate_many(
+            [
+                self._create_leaf_spec(category_name, category_description, subcategory)
+                for subcategory in subcategories
+            ],
+            chunk_size,
+            -(-num_per_subcategory // chunk_size),
+            self._max_concurrency,
+        ):
+            if counts[leaf] >= num_per_subcategory:
+                continue
+            counts[leaf] += 1
+            yield (leaves[leaf], index, text)
+            index += 1
+
+    async def agenerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        num_subcategory: int,
+        num_per_subcategory: int,
+        chunk_size: int,
+    ) -> AsyncGenerator[str, None]:
+        async for _, _, text in self.aenumerate(
+            category_name,
+            category_description,
+            num_subcategory,
+            num_per_subcategory,
+            chunk_size,
+        ):
+            yield text
@@ -0,0 +1,973 @@
+from __future__ import annotations
+import asyncio
+import json
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Hashable,
+    Iterator,
+    Type,
+    TypeVar,
+)
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import (
+    AIMessage,
+    AIMessageChunk,
+    BaseMessage,
+    BaseMessageChunk,
+    message_chunk_to_message,
+    messages_from_dict,
+    messages_to_dict,
+)
+from langchain_core.pydantic_v1 import BaseModel
+from .checkpoint import Checkpoint, CheckpointStore
+from .dedup import DedupIndex, DedupStats
+from .hedging import HedgePolicy
+from .history import HistoryPolicy, estimate_num_tokens
+from .instrumentation import CallRecord, InstrumentationSink
+from .json_repair import RepairStats, repair_json
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .retry import RetryPolicy
+from .saturation import SaturationEstimator
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.runnables import Runnable
+
+
+_BM = TypeVar("_BM", bound=BaseModel)
+_T = TypeVar("_T")
+
+
+class ChatModelSamplerBase(object):
+    """
+    Common base of the samplers.
+    Every LLM call of the samplers goes through `_invoke` / `_stream` / `_invoke_structured`
+    (and their async versions), where the response cache is applied.
+    """
+
+    _MAX_NUM_PREFIX = 128
+
+    @classmethod
+    def _summarize_ai_message(cls, message: BaseMessage) -> list[str]:
+        return [str(message.content).strip()]
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        history_policy: HistoryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        dedup: DedupIndex | None = None,
+        max_duplicate_retries: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        checkpoint_store: CheckpointStore | None = None,
+        instrumentation: InstrumentationSink | None = None,
+        rate_limiter: RateLimiter | None = None,
+        priority: int = 0,
+        saturation_estimator: SaturationEstimator | None = None,
+        hedge_policy: HedgePolicy | None = None,
+        auxiliary_llm: BaseChatModel | None = None,
+    ) -> None:
+        """
+        `history_policy` selects the messages sent to LLM (default: whole history).
+        If `cache` is given, cached responses are returned without calling LLM.
+        If `dedup` is given, duplicated examples are dropped and LLM is called again
+        until the requested number of unique examples are generated,
+        where at most `max_duplicate_retries` (default: the requested number of calls)
+        extra calls are made per job.
+        `dedup_stats` holds the duplicate rate of the last job.
+        If `retry_policy` is given, LLM calls failed by transient errors are retried.
+        If `checkpoint_store` is given, the state of a job is saved after each chunk (or sample),
+        and the job can be continued by `resume(checkpoint_store.load())`.
+        A store holds one job, so it should not be shared by concurrent jobs.
+        If `instrumentation` is given, a `CallRecord` of each chunk (or sample) is emitted to it.
+        Without it, nothing is measured.
+        If `rate_limiter` is given, every LLM call waits for it with `priority`.
+        If `saturation_estimator` is given, it observes the examples of each call,
+        and the job stops early when it reports that the category is saturated.
+        `stop_reason` tells why the last job stopped: "complete" (the requested number
+        of examples), "saturated" or "max_calls" (the limit of calls was reached).
+        If `hedge_policy` is given, an invoke (not a stream or a batch) which is slower than
+        its delay is duplicated, and the first answer is used.
+        If `auxiliary_llm` is given, auxiliary calls (e.g. the LLM parse fallback)
+        are sent to it instead of `llm`, e.g. to a cheaper and faster model.
+        The system message and few-shot turns of a job are built once per sampler,
+        category (or schema) and few-shot set, so that repeated jobs send
+        a byte-identical prefix which provider-side prompt caching can reuse.
+        `num_prefix_tokens` holds its estimated size for the last job.
+        """
+        self._llm = llm
+        self._history_policy = history_policy or HistoryPolicy()
+        self._cache = cache
+        self._dedup = dedup
+        self._max_duplicate_retries = max_duplicate_retries
+        self._retry_policy = retry_policy
+        self._checkpoint_store = checkpoint_store
+        self._instrumentation = instrumentation
+        self._rate_limiter = rate_limiter
+        self._priority = priority
+        self._saturation_estimator = saturation_estimator
+        self._hedge_policy = hedge_policy
+        self._auxiliary_llm = auxiliary_llm
+        self._structured_llms: dict[Hashable, Runnable] = {}
+        self._prefixes: dict[Hashable, tuple[list[BaseMessage], int]] = {}
+        self.dedup_stats = DedupStats()
+        self.repair_stats = RepairStats()
+        self.num_prefix_tokens = 0
+        self.stop_reason: str | None = None
+
+    def _memoized_prefix(
+        self, key: Hashable, create: Callable[[], list[BaseMessage]]
+    ) -> list[BaseMessage]:
+        """returns a new list of the messages created by `create` once per `key`"""
+        prefix = self._prefixes.get(key)
+        if prefix is None:
+            messages = create()
+            prefix = (messages, estimate_num_tokens(messages))
+            if len(self._prefixes) >= self._MAX_NUM_PREFIX:
+                self._prefixes.pop(next(iter(self._prefixes)), None)
+            self._prefixes[key] = prefix
+        self.num_prefix_tokens = prefix[1]
+        return list(prefix[0])
+
+    def _select_history(
+        self,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        record: CallRecord | None = None,
+    ) -> list[BaseMessage]:
+        if record is None:
+            return self._history_policy.select(
+                messages, num_fixed, self._summarize_ai_message
+            )
+        start = time.perf_counter()
+        history = self._history_policy.select(
+            messages, num_fixed, self._summarize_ai_message
+        )
+        record.prompt_build_seconds += time.perf_counter() - start
+        record.num_history_messages = len(history)
+        record.num_history_tokens = estimate_num_tokens(history)
+        record.num_prefix_tokens = estimate_num_tokens(messages[:num_fixed])
+        return history
+
+    def _start_record(self, kind: str) -> CallRecord | None:
+        if self._instrumentation is None:
+            return None
+        return CallRecord(sampler=type(self).__name__, kind=kind)
+
+    def _record_llm_call(
+        self, record: CallRecord | None, start: float, message: BaseMessage | None
+    ) -> None:
+        if record is None:
+            return
+        record.llm_seconds += time.perf_counter() - start
+        record.num_llm_call += 1
+        record.add_usage(getattr(message, "usage_metadata", None))
+
+    def _finish_record(self, record: CallRecord | None, num_item: int) -> None:
+        if record is None or self._instrumentation is None:
+            return
+        record.num_item = num_item
+        record.total_seconds = time.time() - record.started_at
+        self._instrumentation.emit(record)
+
+    def _start_dedup(self, few_shot_keys: list[str]) -> None:
+        self.dedup_stats = DedupStats()
+        if self._dedup is not None:
+            for key in few_shot_keys:
+                self._dedup.add(key)
+
+    def _is_new(self, key: str) -> bool:
+        if self._dedup is None:
+            return True
+        is_new = self._dedup.add(key)
+        self.dedup_stats.num_checked += 1
+        if not is_new:
+            self.dedup_stats.num_duplicate += 1
+        return is_new
+
+    def _start_saturation(self) -> None:
+        self.stop_reason = None
+        if self._saturation_estimator is not None:
+            self._saturation_estimator.reset()
+
+    def _is_saturated(self, keys: list[str]) -> bool:
+        """observes the examples answered by a call, and returns True if the job should stop"""
+        if self._saturation_estimator is None:
+            return False
+        self._saturation_estimator.observe(keys)
+        if not self._saturation_estimator.is_saturated():
+            return False
+        self.stop_reason = "saturated"
+        return True
+
+    def _end_job(self, is_complete: bool) -> None:
+        if self.stop_reason is None:
+            self.stop_reason = "complete" if is_complete else "max_calls"
+
+    def _max_num_call(self, num_call: int) -> int:
+        if self._dedup is None:
+            return num_call
+        if self._max_duplicate_retries is None:
+            return 2 * num_call
+        return num_call + self._max_duplicate_retries
+
+    def _start_checkpoint(self) -> None:
+        if self._checkpoint_store is not None:
+            self._checkpoint_store.reset()
+
+    def _save_checkpoint(
+        self,
+        job: dict[str, Any],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[Any],
+        next_index: int,
+        extra: dict[str, Any] | None = None,
+    ) -> None:
+        if self._checkpoint_store is not None:
+            self._checkpoint_store.save(
+                Checkpoint(
+                    sampler=type(self).__name__,
+                    job=job,
+                    messages=messages,
+                    num_fixed=num_fixed,
+                    items=items,
+                    next_index=next_index,
+                    extra=extra or {},
+                )
+            )
+
+    def _structured_llm(
+        self, schema: Type[_BM], llm: BaseChatModel | None = None
+    ) -> Runnable:
+        llm = llm or self._llm
+        key = (schema, id(llm))
+        if key not in self._structured_llms:
+            self._structured_llms[key] = llm.with_structured_output(
+                schema, include_raw=True
+            )
+        return self._structured_llms[key]
+
+    def _json_llm(
+        self, tool: dict[str, Any], llm: BaseChatModel | None = None
+    ) -> Runnable:
+        """`tool` is an OpenAI tool definition whose arguments are returned without validation"""
+        llm = llm or self._llm
+        key = (json.dumps(tool, sort_keys=True), id(llm))
+        if key not in self._structured_llms:
+            self._structured_llms[key] = llm.with_structured_output(
+                tool, include_raw=True
+            )
+        return self._structured_llms[key]
+
+    def _cache_key(
+        self,
+        messages: list[BaseMessage],
+        schema: Type[BaseModel] | dict[str, Any] | None = None,
+        llm: BaseChatModel | None = None,
+    ) -> str | None:
+        if self._cache is None:
+            return None
+        if schema is not None and not isinstance(schema, dict):
+            schema = schema.schema()
+        return self._cache.make_key(messages, llm or self._llm, schema)
+
+    def _select_llm(self, auxiliary: bool) -> BaseChatModel:
+        if auxiliary and self._auxiliary_llm is not None:
+            return self._auxiliary_llm
+        return self._llm
+
+    def _hedged(
+        self,
+        llm: BaseChatModel,
+        call: Callable[[BaseChatModel], _T],
+        messages: list[BaseMessage],
+        record: CallRecord | None,
+    ) -> _T:
+        """
+        calls `call(llm)`, hedged by `call` of the hedge model under `hedge_policy`.
+        The caller holds the rate limiter for the first request (on `messages`),
+        and the duplicate request waits for the rate limiter by itself,
+        after which it is not sent (and its tokens are returned) if the call is decided.
+        """
+        if self._hedge_policy is None:
+            return call(llm)
+        hedge_llm = self._hedge_policy.hedge_llm or llm
+
+        def hedge(check_cancelled: Callable[[], None]) -> _T:
+            def send() -> _T:
+                check_cancelled()
+                return call(hedge_llm)
+
+            return self._limited(messages, send, record)
+
+        return self._hedge_policy.call(lambda: call(llm), hedge)
+
+    async def _ahedged(
+        self,
+        llm: BaseChatModel,
+        call: Callable[[BaseChatModel], Awaitable[_T]],
+        messages: list[BaseMessage],
+        record: CallRecord | None,
+    ) -> _T:
+        if self._hedge_policy is None:
+            return await call(llm)
+        hedge_llm = self._hedge_policy.hedge_llm or llm
+        return await self._hedge_policy.acall(
+            lambda: call(llm),
+            lambda: self._alimited(messages, lambda: call(hedge_llm), record),
+        )
+
+    def _lookup_message(self, key: str | None) -> BaseMessage | None:
+        if key is None or self._cache is None:
+            return None
+        value = self._cache.lookup(key)
+        return None if value is None else messages_from_dict([json.loads(value)])[0]
+
+    def _update_message(self, key: str | None, message: BaseMessage) -> None:
+        if key is not None and self._cache is not None:
+            self._cache.update(
+                key, json.dumps(messages_to_dict([message])[0], ensure_ascii=False)
+            )
+
+    def _lookup_structured(self, key: str | None, schema: Type[_BM]) -> _BM | None:
+        if key is None or self._cache is None:
+            return None
+        value = self._cache.lookup(key)
+        return None if value is None else schema.parse_raw(value)
+
+    def _update_structured(self, key: str | None, sample: BaseModel) -> None:
+        if key is not None and self._cache is not None:
+            self._cache.update(key, sample.json(ensure_ascii=False))
+
+    def _lookup_json(self, key: str | None) -> dict[str, Any] | None:
+        if key is None or self._cache is None:
+            return None
+        value = self._cache.lookup(key)
+        return None if value is None else json.loads(value)
+
+    def _update_json(self, key: str | None, obj: dict[str, Any]) -> None:
+        if key is not None and self._cache is not None:
+            self._cache.update(key, json.dumps(obj, ensure_ascii=False))
+
+    @classmethod
+    def _usage_of(cls, output: Any) -> dict[str, Any] | None:
+        if isinstance(output, dict):
+            output = output.get("raw")
+        return getattr(output, "usage_metadata", None)
+
+    def _acquire(self, messages: list[BaseMessage], record: CallRecord | None) -> int:
+        """waits for the rate limiter and returns the estimated number of tokens"""
+        if self._rate_limiter is None:
+            return 0
+        num_tokens = self._rate_limiter.estimate(messages)
+        waited = self._rate_limiter.acquire(num_tokens, self._priority)
+        if record is not None:
+            record.queue_wait_seconds += waited
+        return num_tokens
+
+    async def _aacquire(
+        self, messages: list[BaseMessage], record: CallRecord | None
+    ) -> int:
+        if self._rate_limiter is None:
+            return 0
+        num_tokens = self._rate_limiter.estimate(messages)
+        waited = await self._rate_limiter.aacquire(num_tokens, self._priority)
+        if record is not None:
+            record.queue_wait_seconds += waited
+        return num_tokens
+
+    def _settle(self, num_tokens: int, output: Any) -> None:
+        if self._rate_limiter is not None:
+            self._rate_limiter.settle(num_tokens, self._usage_of(output))
+
+    def _settle_failed(self, num_tokens: int) -> None:
+        """returns the tokens of a failed call, whose retry waits for the rate limiter again"""
+        if self._rate_limiter is not None:
+            self._rate_limiter.settle(num_tokens, {"total_tokens": 0})
+
+    def _limited(
+        self,
+        messages: list[BaseMessage],
+        func: Callable[[], _T],
+        record: CallRecord | None,
+    ) -> _T:
+        """calls `func` (an LLM call on `messages`) under the rate limiter"""
+        if self._rate_limiter is None:
+            return func()
+        num_tokens = self._acquire(messages, record)
+        try:
+            output = func()
+        except Exception:
+            self._settle_failed(num_tokens)
+            raise
+        self._settle(num_tokens, output)
+        return output
+
+    async def _alimited(
+        self,
+        messages: list[BaseMessage],
+        func: Callable[[], Awaitable[_T]],
+        record: CallRecord | None,
+    ) -> _T:
+        if self._rate_limiter is None:
+            return await func()
+        num_tokens = await self._aacquire(messages, record)
+        try:
+            output = await func()
+        except Exception:
+            self._settle_failed(num_tokens)
+            raise
+        self._settle(num_tokens, output)
+        return output
+
+    def _call_with_retry(
+        self, func: Callable[[], _T], record: CallRecord | None = None
+    ) -> _T:
+        if self._retry_policy is None:
+            return func()
+        if record is None:
+            return self._retry_policy.call(func)
+
+        num_attempt = 0
+
+        def attempt() -> _T:
+            nonlocal num_attempt
+            num_attempt += 1
+            return func()
+
+        try:
+            return self._retry_policy.call(attempt)
+        finally:
+            record.num_retry += num_attempt - 1
+
+    async def _acall_with_retry(
+        self, func: Callable[[], Awaitable[_T]], record: CallRecord | None = None
+    ) -> _T:
+        if self._retry_policy is None:
+            return await func()
+        if record is None:
+            return await self._retry_policy.acall(func)
+
+        num_attempt = 0
+
+        def attempt() -> Awaitable[_T]:
+            nonlocal num_attempt
+            num_attempt += 1
+            return func()
+
+        try:
+            return await self._retry_policy.acall(attempt)
+        finally:
+            record.num_retry += num_attempt - 1
+
+    def _invoke(
+        self,
+        messages: list[BaseMessage],
+        record: CallRecord | None = None,
+        auxiliary: bool = False,
+    ) -> BaseMessage:
+        """`auxiliary` calls go to `auxiliary_llm` if it is given"""
+        llm = self._select_llm(auxiliary)
+        key = self._cache_key(messages, llm=llm)
+        ai_message = self._lookup_message(key)
+        if ai_message is None:
+            start = time.perf_counter()
+            ai_message = self._call_with_retry(
+                lambda: self._limited(
+                    messages,
+                    lambda: self._hedged(
+                        llm, lambda m: m.invoke(messages), messages, record
+                    ),
+                    record,
+                ),
+                record,
+            )
+            self._record_llm_call(record, start, ai_message)
+            self._update_message(key, ai_message)
+        elif record is not None:
+            record.num_cached_call += 1
+        return ai_message
+
+    async def _ainvoke(
+        self,
+        messages: list[BaseMessage],
+        record: CallRecord | None = None,
+        auxiliary: bool = False,
+    ) -> BaseMessage:
+        llm = self._select_llm(auxiliary)
+        key = self._cache_key(messages, llm=llm)
+        ai_message = self._lookup_message(key)
+        if ai_message is None:
+            start = time.perf_counter()
+            ai_message = await self._acall_with_retry(
+                lambda: self._alimited(
+                    messages,
+                    lambda: self._ahedged(
+                        llm, lambda m: m.ainvoke(messages), messages, record
+                    ),
+                    record,
+                ),
+                record,
+            )
+            self._record_llm_call(record, start, ai_message)
+            self._update_message(key, ai_message)
+        elif record is not None:
+            record.num_cached_call += 1
+        return ai_message
+
+    def _batch_invoke(
+        self,
+        messages_list: list[list[BaseMessage]],
+        max_concurrency: int | None = None,
+        records: list[CallRecord | None] | None = None,
+    ) -> Iterator[tuple[int, BaseMessage]]:
+        """
+        Calls the LLM on each of `messages_list` by one `batch_as_completed`
+        and yields `(i, message)` as they complete (cache hits first).
+        A failed call is retried by itself under the retry policy.
+        """
+        records = records or [None] * len(messages_list)
+        keys = [self._cache_key(messages) for messages in messages_list]
+        misses: list[int] = []
+        for i, key in enumerate(keys):
+            ai_message = self._lookup_message(key)
+            if ai_message is None:
+                misses.append(i)
+                continue
+            record = records[i]
+            if record is not None:
+                record.num_cached_call += 1
+            yield (i, ai_message)
+        if not misses:
+            return
+
+        num_tokens = [self._acquire(messages_list[i], records[i]) for i in misses]
+        start = time.perf_counter()
+        outputs = self._llm.batch_as_completed(
+            [messages_list[i] for i in misses],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        for j, output in outputs:
+            i = misses[j]
+            record = records[i]
+            if isinstance(output, Exception):
+                self._settle_failed(num_tokens[j])
+                if self._retry_policy is None or not self._retry_policy.should_retry(
+                    output, 0
+                ):
+                    raise output
+                time.sleep(self._retry_policy.delay(0))
+                if record is not None:
+                    record.num_retry += 1
+                yield (i, self._invoke(messages_list[i], record))
+                continue
+            self._settle(num_tokens[j], output)
+            self._record_llm_call(record, start, output)
+            self._update_message(keys[i], output)
+            yield (i, output)
+
+    async def _abatch_invoke(
+        self,
+        messages_list: list[list[BaseMessage]],
+        max_concurrency: int | None = None,
+        records: list[CallRecord | None] | None = None,
+    ) -> AsyncIterator[tuple[int, BaseMessage]]:
+        """async version of `_batch_invoke`"""
+        records = records or [None] * len(messages_list)
+        keys = [self._cache_key(messages) for messages in messages_list]
+        misses: list[int] = []
+        for i, key in enumerate(keys):
+            ai_message = self._lookup_message(key)
+            if ai_message is None:
+                misses.append(i)
+                continue
+            record = records[i]
+            if record is not None:
+                record.num_cached_call += 1
+            yield (i, ai_message)
+        if not misses:
+            return
+
+        num_tokens = [
+            await self._aacquire(messages_list[i], records[i]) for i in misses
+        ]
+        start = time.perf_counter()
+        outputs = self._llm.abatch_as_completed(
+            [messages_list[i] for i in misses],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+        async for j, output in outputs:
+            i = misses[j]
+            record = records[i]
+            if isinstance(output, Exception):
+                self._settle_failed(num_tokens[j])
+                if self._retry_policy is None or not self._retry_policy.should_retry(
+                    output, 0
+                ):
+                    raise output
+                await asyncio.sleep(self._retry_policy.delay(0))
+                if record is not None:
+                    record.num_retry += 1
+                yield (i, await self._ainvoke(messages_list[i], record))
+                continue
+            self._settle(num_tokens[j], output)
+            self._record_llm_call(record, start, output)
+            self._update_message(keys[i], output)
+            yield (i, output)
+
+    @classmethod
+    def _join_message_chunks(cls, message_chunks: list[BaseMessageChunk]) -> BaseMessage:
+        if not message_chunks:
+            return AIMessage("")
+        joined = message_chunks[0]
+        for message_chunk in message_chunks[1:]:
+            joined = joined + message_chunk
+        return message_chunk_to_message(joined)
+
+    def _stream(
+        self, messages: list[BaseMessage], record: CallRecord | None = None
+    ) -> Iterator[BaseMessageChunk]:
+        """A cached message is yielded as a single chunk."""
+        key = self._cache_key(messages)
+        ai_message = self._lookup_message(key)
+        if ai_message is not None:
+            if record is not None:
+                record.num_cached_call += 1
+            yield AIMessageChunk(content=ai_message.content)
+            return
+        start = time.perf_counter()
+        message_chunks = []
+        i_retry = 0
+        while True:
+            num_tokens = self._acquire(messages, record)
+            try:
+                for message_chunk in self._llm.stream(messages):
+                    message_chunks.append(message_chunk)
+                    yield message_chunk
+                break
+            except Exception as e:
+                # the retry waits for the rate limiter again
+                self._settle_failed(num_tokens)
+                # a stream can be retried only until its first chunk is yielded
+                if (
+                    message_chunks
+                    or self._retry_policy is None
+                    or not self._retry_policy.should_retry(e, i_retry)
+                ):
+                    raise
+                if record is not None:
+                    record.num_retry += 1
+                time.sleep(self._retry_policy.delay(i_retry))
+                i_retry += 1
+        ai_message = self._join_message_chunks(message_chunks)
+        self._settle(num_tokens, ai_message)
+        self._record_llm_call(record, start, ai_message)
+        self._update_message(key, ai_message)
+
+    async def _astream(
+        self, messages: list[BaseMessage], record: CallRecord | None = None
+    ) -> AsyncIterator[BaseMessageChunk]:
+        """async version of `_stream`"""
+        key = self._cache_key(messages)
+        ai_message = self._lookup_message(key)
+        if ai_message is not None:
+            if record is not None:
+                record.num_cached_call += 1
+            yield AIMessageChunk(content=ai_message.content)
+            return
+        start = time.perf_counter()
+        message_chunks = []
+        i_retry = 0
+        while True:
+            num_tokens = await self._aacquire(messages, record)
+            try:
+                async for message_chunk in self._llm.astream(messages):
+                    message_chunks.append(message_chunk)
+                    yield message_chunk
+                break
+            except Exception as e:
+                self._settle_failed(num_tokens)
+                if (
+                    message_chunks
+                    or self._retry_policy is None
+                    or not self._retry_policy.should_retry(e, i_retry)
+                ):
+                    raise
+                if record is not None:
+                    record.num_retry += 1
+                await asyncio.sleep(self._retry_policy.delay(i_retry))
+                i_retry += 1
+        ai_message = self._join_message_chunks(message_chunks)
+        self._settle(num_tokens, ai_message)
+        self._record_llm_call(record, start, ai_message)
+        self._update_message(key, ai_message)
+
+    def _check_structured(self, sample: Any, schema: Type[_BM]) -> _BM:
+        if not isinstance(sample, schema):
+            # This scope is never reached, but is written for static type analysis.
+            raise TypeError(
+                f"Unexpected Error. type(new_sample): {type(sample)}, schema: {schema}"
+            )
+        return sample
+
+    @classmethod
+    def _raise_parsing_error(
+        cls, output: dict[str, Any], require_parsed: bool = False
+    ) -> dict[str, Any]:
+        """
+        `output` is the output of `with_structured_output(schema, include_raw=True)`.
+        The parsing error is raised inside the retried call, as without `include_raw`.
+        If `require_parsed`, an output without a valid tool call (e.g. broken JSON) is also an error.
+        """
+        if output.get("parsing_error") is not None:
+            raise output["parsing_error"]
+        if require_parsed and output.get("parsed") is None:
+            raw = output.get("raw")
+            raise OutputParserException(
+                "LLM did not answer a valid structured output.",
+                llm_output=None if raw is None else str(raw.content),
+            )
+        return output
+
+    def _repair_output(
+        self,
+        output: dict[str, Any],
+        parse: Callable[[Any], Any] | None,
+        record: CallRecord | None,
+    ) -> dict[str, Any]:
+        """
+        `output` is the output of `with_structured_output(..., include_raw=True)`.
+        If `parse` is given and LLM answered broken JSON instead of a valid tool call,
+        the JSON is repaired locally and parsed by `parse` without calling LLM again.
+        """
+        raw = output.get("raw")
+        if parse is None or raw is None or getattr(raw, "tool_calls", None):
+            return output
+        invalid_tool_calls = getattr(raw, "invalid_tool_calls", None)
+        text = invalid_tool_calls[0].get("args") if invalid_tool_calls else raw.content
+        if not isinstance(text, str) or not text.strip():
+            return output
+        self.repair_stats.num_attempt += 1
+        try:
+            parsed = parse(repair_json(text))
+        except ValueError:
+            return output
+        self.repair_stats.num_repaired += 1
+        if record is not None:
+            record.num_repaired += 1
+        return {**output, "parsed": parsed, "parsing_error": None, "is_repaired": True}
+
+    @classmethod
+    def _raw_text(cls, output: dict[str, Any], sample: BaseModel) -> str:
+        """the arguments answered by LLM as they are, or `sample` in compact JSON if repaired"""
+        raw = output["raw"]
+        if not output.get("is_repaired"):
+            for tool_call in raw.additional_kwargs.get("tool_calls") or []:
+                arguments = (tool_call.get("function") or {}).get("arguments")
+                if isinstance(arguments, str):
+                    return arguments
+        return sample.json(ensure_ascii=False)
+
+    def _invoke_structured(
+        self,
+        messages: list[BaseMessage],
+        schema: Type[_BM],
+        record: CallRecord | None = None,
+    ) -> _BM:
+        return self._invoke_structured_with_raw(messages, schema, record)[0]
+
+    def _invoke_structured_with_raw(
+        self,
+        messages: list[BaseMessage],
+        schema: Type[_BM],
+        record: CallRecord | None = None,
+        repair: bool = False,
+    ) -> tuple[_BM, str]:
+        """
+        Returns the sample and its JSON text answered by LLM (see `_raw_text`).
+        If `repair`, broken JSON is repaired locally before the call fails.
+        """
+        key = self._cache_key(messages, schema)
+        sample = self._lookup_structured(key, schema)
+        if sample is not None:
+            if record is not None:
+                record.num_cached_call += 1
+            return sample, sample.json(ensure_ascii=False)
+        start = time.perf_counter()
+        parse = schema.parse_obj if repair else None
+        output = self._call_with_retry(
+            lambda: self._raise_parsing_error(
+                self._repair_output(
+                    self._limited(
+                        messages,
+                        lambda: self._hedged(
+                            self._llm,
+                            lambda m: self._structured_llm(schema, m).invoke(messages),
+                            messages,
+                            record,
+                        ),
+                        record,
+                    ),
+                    parse,
+                    record,
+                ),
+                require_parsed=True,
+            ),
+            record,
+        )
+        self._record_llm_call(record, start, output["raw"])
+        sample = self._check_structured(output["parsed"], schema)
+        self._update_structured(key, sample)
+        return sample, self._raw_text(output, sample)
+
+    async def _ainvoke_structured(
+        self,
+        messages: list[BaseMessage],
+        schema: Type[_BM],
+        record: CallRecord | None = None,
+    ) -> _BM:
+        return (await self._ainvoke_structured_with_raw(messages, schema, record))[0]
+
+    async def _ainvoke_structured_with_raw(
+        self,
+        messages: list[BaseMessage],
+        schema: Type[_BM],
+        record: CallRecord | None = None,
+        repair: bool = False,
+    ) -> tuple[_BM, str]:
+        """async version of `_invoke_structured_with_raw`"""
+        key = self._cache_key(messages, schema)
+        sample = self._lookup_structured(key, schema)
+        if sample is not None:
+            if record is not None:
+                record.num_cached_call += 1
+            return sample, sample.json(ensure_ascii=False)
+        start = time.perf_counter()
+        parse = schema.parse_obj if repair else None
+
+        async def call() -> dict[str, Any]:
+            return self._raise_parsing_error(
+                self._repair_output(
+                    await self._alimited(
+                        messages,
+                        lambda: self._ahedged(
+                            self._llm,
+                            lambda m: self._structured_llm(schema, m).ainvoke(messages),
+                            messages,
+                            record,
+                        ),
+                        record,
+                    ),
+                    parse,
+                    record,
+                ),
+                require_parsed=True,
+            )
+
+        output = await self._acall_with_retry(call, record)
+        self._record_llm_call(record, start, output["raw"])
+        sample = self._check_structured(output["parsed"], schema)
+        self._update_structured(key, sample)
+        return sample, self._raw_text(output, sample)
+
+    @classmethod
+    def _parse_json_object(cls, obj: Any) -> dict[str, Any]:
+        if not isinstance(obj, dict):
+            raise ValueError(f"The arguments are not an object. obj: {obj!r}")
+        return obj
+
+    def _invoke_json(
+        self,
+        messages: list[BaseMessage],
+        tool: dict[str, Any],
+        record: CallRecord | None = None,
+        repair: bool = False,
+    ) -> dict[str, Any]:
+        """
+        Returns the arguments of the call of `tool`, or an empty dict if LLM does not call it.
+        The arguments are not validated.
+        If `repair`, broken JSON is repaired locally instead of being regarded as no call.
+        """
+        key = self._cache_key(messages, tool)
+        obj = self._lookup_json(key)
+        if obj is None:
+            start = time.perf_counter()
+            output = self._call_with_retry(
+                lambda: self._raise_parsing_error(
+                    self._repair_output(
+                        self._limited(
+                            messages,
+                            lambda: self._hedged(
+                                self._llm,
+                                lambda m: self._json_llm(tool, m).invoke(messages),
+                                messages,
+                                record,
+                            ),
+                            record,
+                        ),
+                        self._parse_json_object if repair else None,
+                        record,
+                    )
+                ),
+                record,
+            )
+            self._record_llm_call(record, start, output["raw"])
+            if not isinstance(output["parsed"], dict):
+                # no call is not cached, so that the same request is sent again
+                return {}
+            obj = output["parsed"]
+            self._update_json(key, obj)
+        elif record is not None:
+            record.num_cached_call += 1
+        return obj
+
+    async def _ainvoke_json(
+        self,
+        messages: list[BaseMessage],
+        tool: dict[str, Any],
+        record: CallRecord | None = None,
+        repair: bool = False,
+    ) -> dict[str, Any]:
+        """async version of `_invoke_json`"""
+        key = self._cache_key(messages, tool)
+        obj = self._lookup_json(key)
+        if obj is None:
+            start = time.perf_counter()
+
+            async def call() -> dict[str, Any]:
+                return self._raise_parsing_error(
+                    self._repair_output(
+                        await self._alimited(
+                            messages,
+                            lambda: self._ahedged(
+                                self._llm,
+                                lambda m: self._json_llm(tool, m).ainvoke(messages),
+                                messages,
+                                record,
+                            ),
+                            record,
+                        ),
+                        self._parse_json_object if repair else None,
+                        record,
+                    )
+                )
+
+            output = await self._acall_with_retry(call, record)
+            self._record_llm_call(record, start, output["raw"])
+            if not isinstance(output["parsed"], dict):
+                # no call is not cached, so that the same request is sent again
+                return {}
+            obj = output["parsed"]
+            self._update_json(key, obj)
+        elif record is not None:
+            record.num_cached_call += 1
+        return obj
@@ -1,8 +1,31 @@
-from typing import Any, Generator, Type, TypeVar
+from __future__ import annotations
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Generator,
+    Mapping,
+    Type,
+    TypeVar,
+)
 import json
-from langchain.chat_models.base import BaseChatModel
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
-from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.pydantic_v1 import BaseModel, Field, ValidationError, create_model
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from .chat_model_sampler_base import ChatModelSamplerBase
+from .checkpoint import Checkpoint, CheckpointStore, import_object, object_path
+from .dedup import DedupIndex
+from .hedging import HedgePolicy
+from .history import HistoryPolicy
+from .instrumentation import CallRecord, InstrumentationSink
+from .numbered_list_parser import _NUMBERED_LINE_PATTERN
+from .rate_limiter import RateLimiter
+from .response_cache import ResponseCache
+from .retry import RetryPolicy
+from .saturation import SaturationEstimator
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
 
 
 _ModelField = Any  # temporary solution. I don't know how to import `ModelField` from `langchain_core.pydantic_v1`.
@@ -11,10 +34,11 @@ _ModelField = Any  # temporary solution. I don't know how to import `ModelField`
 _BM = TypeVar("_BM", bound=BaseModel)
 
 
-class ChatModelStructureSampler(object):
+class ChatModelStructureSampler(ChatModelSamplerBase):
     """sample structured datas with chat models"""
 
     _HUMAN_COMMAND = "next"
+    _HISTORY_ENCODINGS = ("json", "minified", "table", "key_fields", "raw")
 
     @classmethod
     def _create_system_message(
@@ -22,15 +46,26 @@ class ChatModelStructureSampler(object):
         model_name: str,
         model_description: str | None,
         model_fields: dict[str, _ModelField],
+        chunk_size: int = 1,
     ) -> SystemMessage:
         msg = ""
-        msg += (
-            f"You are a expert algorithm that provides examples of `{model_name}`."
-            f"When a user issues the command `{cls._HUMAN_COMMAND}`, Give one example that is different from any of the existing examples."
-            f"\n"
-            f"**Answer should include only one example whose unit is `{model_name}`**."
-            f"\n"
-        )
+        if chunk_size == 1:
+            msg += (
+                f"You are a expert algorithm that provides examples of `{model_name}`."
+                f"When a user issues the command `{cls._HUMAN_COMMAND}`, Give one example that is different from any of the existing examples."
+                f"\n"
+                f"**Answer should include only one example whose unit is `{model_name}`**."
+                f"\n"
+            )
+        else:
+            msg += (
+                f"You are a expert algorithm that provides examples of `{model_name}`."
+                f"When a user requests examples with numbers, Give the examples that are different from any of the existing examples, "
+                f"where the `index` of each example is its number."
+                f"\n"
+                f"**Each example should be one unit of `{model_name}`**."
+                f"\n"
+            )
         msg += "\n"
 
         if model_description is not None:
@@ -59,11 +94,177 @@ class ChatModelStructureSampler(object):
         return HumanMessage(cls._HUMAN_COMMAND)
 
     @classmethod
-    def _create_sample_ai_message(cls, sample: BaseModel) -> AIMessage:
-        return AIMessage(sample.json(indent=4, ensure_ascii=False))
+    def _create_history_note(cls, field_names: list[str], is_key_fields: bool) -> str:
+        only = "only " if is_key_fields else ""
+        return (
+            f"The past examples in this conversation are shown {only}by the tab-separated values "
+            f"of the fields {', '.join(f'`{name}`' for name in field_names)} in this order."
+        )
+
+    @classmethod
+    def _encode_value(cls, value: Any) -> str:
+        if isinstance(value, str):
+            return " ".join(value.split())
+        return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def _history_fields(self, schema: Type[BaseModel]) -> list[str]:
+        if self._history_encoding == "key_fields":
+            return self._dedup_key_fields or list(schema.__fields__)[:1]
+        return list(schema.__fields__)
+
+    def _encode_sample(self, sample: BaseModel, is_chunk: bool = False) -> str:
+        """the text of `sample` in the history"""
+        if self._history_encoding == "json":
+            if is_chunk:
+                return sample.json(ensure_ascii=False)
+            return sample.json(indent=4, ensure_ascii=False)
+        if self._history_encoding == "minified":
+            return sample.json(ensure_ascii=False, separators=(",", ":"))
+        if self._history_encoding == "raw":
+            return sample.json(ensure_ascii=False)
+        obj = sample.dict()
+        return "\t".join(
+            self._encode_value(obj[name]) for name in self._history_fields(type(sample))
+        )
 
-    def __init__(self, llm: BaseChatModel) -> None:
-        self._llm = llm
+    def _create_sample_ai_message(
+        self, sample: BaseModel, raw_text: str | None = None
+    ) -> AIMessage:
+        """`raw_text` is the JSON text answered by LLM, used as it is by the "raw" encoding"""
+        if self._history_encoding == "raw" and raw_text is not None:
+            return AIMessage(raw_text)
+        return AIMessage(self._encode_sample(sample))
+
+    @classmethod
+    def _create_chunk_human_message(
+        cls, model_name: str, first_index: int, last_index: int
+    ) -> HumanMessage:
+        return HumanMessage(
+            f"Please provide {last_index-first_index+1} examples of {model_name} from {first_index} to {last_index}."
+        )
+
+    @classmethod
+    def _create_invalid_human_message(
+        cls, model_name: str, errors: dict[int, str]
+    ) -> HumanMessage:
+        return HumanMessage(
+            f"Some examples are missing or invalid. Please provide examples of {model_name} only for the following numbers: "
+            f"{', '.join(str(i) for i in errors)}.\n"
+            + "\n".join(f"{i}: {error}" for i, error in errors.items())
+        )
+
+    def _create_chunk_ai_message(
+        self, samples: Mapping[int, BaseModel]
+    ) -> AIMessage:
+        return AIMessage(
+            "\n".join(
+                f"{i}. {self._encode_sample(sample, is_chunk=True)}"
+                for i, sample in samples.items()
+            )
+        )
+
+    @classmethod
+    def _summarize_ai_message(cls, message: BaseMessage) -> list[str]:
+        text = str(message.content)
+        try:
+            return [json.dumps(json.loads(text), ensure_ascii=False)]
+        except json.JSONDecodeError:
+            pass
+        items = []
+        for line in text.splitlines():
+            match = _NUMBERED_LINE_PATTERN.match(line)
+            if match and match.group(2).strip():
+                items.append(match.group(2).strip())
+        return items or [" ".join(text.split())]
+
+    @classmethod
+    def _create_chunk_tool(cls, schema: Type[BaseModel]) -> dict[str, Any]:
+        """
+        OpenAI tool of a generated container of indexed `schema` objects.
+        The arguments are validated element by element, so that valid ones are kept.
+        """
+        indexed = create_model(
+            f"Indexed{schema.__name__}",
+            __base__=schema,
+            index=(int, Field(description="The number of the example")),
+        )
+        container = create_model(
+            f"{schema.__name__}Chunk",
+            __base__=BaseModel,
+            items=(list[indexed], Field(description=f"Examples of {schema.__name__}")),  # type: ignore
+        )
+        return convert_to_openai_tool(container)
+
+    def __init__(
+        self,
+        llm: BaseChatModel,
+        history_policy: HistoryPolicy | None = None,
+        cache: ResponseCache | None = None,
+        dedup: DedupIndex | None = None,
+        max_duplicate_retries: int | None = None,
+        retry_policy: RetryPolicy | None = None,
+        checkpoint_store: CheckpointStore | None = None,
+        dedup_key_fields: list[str] | None = None,
+        instrumentation: InstrumentationSink | None = None,
+        chunk_size: int = 1,
+        rate_limiter: RateLimiter | None = None,
+        priority: int = 0,
+        history_encoding: str = "json",
+        saturation_estimator: SaturationEstimator | None = None,
+        hedge_policy: HedgePolicy | None = None,
+        auxiliary_llm: BaseChatModel | None = None,
+        json_repair: bool = True,
+    ) -> None:
+        """
+        Duplicates are detected on the values of `dedup_key_fields` (default: all fields).
+        If `chunk_size` > 1, `chunk_size` examples are requested per call as a list of
+        indexed objects, and each object is validated on its own.
+        Invalid or missing objects are requested again by a follow-up turn
+        (up to `retry_policy.max_retries` times, default: `RetryPolicy()`),
+        and the valid ones are yielded.
+        `history_encoding` is the format of the past examples in the conversation:
+        "json" (indented JSON, or one-line JSON in chunks), "minified" (compact JSON),
+        "table" (tab-separated values, with the field names once in the system message),
+        "key_fields" (the values of `dedup_key_fields`, default: the first field, only)
+        or "raw" (the JSON text answered by LLM as it is, without re-serialization,
+        or one-line JSON for few-shot samples, repaired answers and chunks).
+        LLM still answers full objects by structured output.
+        If `json_repair`, broken JSON answered instead of a valid structured output
+        (a code fence, trailing commas or a truncated value) is repaired locally
+        before the call fails (or the examples are requested again in chunks).
+        `repair_stats` counts the repairs.
+        The other arguments are as in `ChatModelSamplerBase`.
+        """
+        if history_encoding not in self._HISTORY_ENCODINGS:
+            raise ValueError(
+                f"history_encoding must be one of {self._HISTORY_ENCODINGS}. history_encoding: {history_encoding}"
+            )
+        super().__init__(
+            llm,
+            history_policy=history_policy,
+            cache=cache,
+            dedup=dedup,
+            max_duplicate_retries=max_duplicate_retries,
+            retry_policy=retry_policy,
+            checkpoint_store=checkpoint_store,
+            instrumentation=instrumentation,
+            rate_limiter=rate_limiter,
+            priority=priority,
+            saturation_estimator=saturation_estimator,
+            hedge_policy=hedge_policy,
+            auxiliary_llm=auxiliary_llm,
+        )
+        self._dedup_key_fields = dedup_key_fields
+        self._chunk_size = chunk_size
+        self._history_encoding = history_encoding
+        self._json_repair = json_repair
+        self._chunk_tools: dict[type, dict[str, Any]] = {}
+
+    def _dedup_key(self, sample: BaseModel) -> str:
+        obj = sample.dict()
+        if self._dedup_key_fields is not None:
+            obj = {name: obj[name] for name in self._dedup_key_fields}
+        return json.dumps(obj, ensure_ascii=False, sort_keys=True, default=str)
 
     def sample_n(
         self,
@@ -83,43 +284,461 @@ class ChatModelStructureSampler(object):
             )
         )
 
-    def generate(
+    async def asample_n(
         self,
         model_name: str,
         model_description: str | None,
         schema: Type[_BM],
         few_shot_samples: list[_BM] | None,
         num_sample: int,
-    ) -> Generator[_BM, None, None]:
+    ) -> list[_BM]:
+        return [
+            sample
+            async for sample in self.agenerate(
+                model_name,
+                model_description,
+                schema,
+                few_shot_samples,
+                num_sample,
+            )
+        ]
+
+    def _create_initial_messages(
+        self,
+        model_name: str,
+        model_description: str | None,
+        schema: Type[_BM],
+        few_shot_samples: list[_BM] | None,
+    ) -> list[BaseMessage]:
+        return self._memoized_prefix(
+            (
+                type(self),
+                model_name,
+                model_description,
+                schema,
+                self._chunk_size,
+                self._history_encoding,
+                tuple(self._dedup_key_fields or []),
+                tuple(sample.json() for sample in few_shot_samples or []),
+            ),
+            lambda: self._create_prefix_messages(
+                model_name, model_description, schema, few_shot_samples
+            ),
+        )
+
+    def _create_prefix_messages(
+        self,
+        model_name: str,
+        model_description: str | None,
+        schema: Type[_BM],
+        few_shot_samples: list[_BM] | None,
+    ) -> list[BaseMessage]:
         if few_shot_samples is None:
             few_shot_samples = []
 
         messages: list[BaseMessage] = []
-        messages.append(
-            self._create_system_message(
-                model_name,
-                model_description,
-                schema.__fields__,
-            )
+        system_message = self._create_system_message(
+            model_name,
+            model_description,
+            schema.__fields__,
+            chunk_size=self._chunk_size,
         )
+        if self._history_encoding in ("table", "key_fields"):
+            system_message = SystemMessage(
+                f"{system_message.content}\n"
+                + self._create_history_note(
+                    self._history_fields(schema),
+                    self._history_encoding == "key_fields",
+                )
+            )
+        messages.append(system_message)
+        if self._chunk_size > 1:
+            if few_shot_samples:
+                messages.append(
+                    self._create_chunk_human_message(
+                        model_name, 1, len(few_shot_samples)
+                    )
+                )
+                messages.append(
+                    self._create_chunk_ai_message(
+                        {i + 1: sample for i, sample in enumerate(few_shot_samples)}
+                    )
+                )
+            return messages
         for fs_sample in few_shot_samples:
             messages.append(self._create_human_message())
             messages.append(self._create_sample_ai_message(fs_sample))
+        return messages
+
+    def generate(
+        self,
+        model_name: str,
+        model_description: str | None,
+        schema: Type[_BM],
+        few_shot_samples: list[_BM] | None,
+        num_sample: int,
+    ) -> Generator[_BM, None, None]:
+        messages = self._create_initial_messages(
+            model_name, model_description, schema, few_shot_samples
+        )
+        job = self._create_job(
+            model_name, model_description, schema, few_shot_samples, num_sample
+        )
+        self._start_dedup([self._dedup_key(sample) for sample in few_shot_samples or []])
+        self._start_saturation()
+        self._start_checkpoint()
+        yield from self._continue(job, schema, messages, len(messages), [], 0)
 
-        llm_with_structured_output = self._llm.with_structured_output(
+    def resume(
+        self, checkpoint: Checkpoint, schema: Type[_BM] | None = None
+    ) -> Generator[_BM, None, None]:
+        """
+        continues `generate` from `checkpoint` without calling LLM again for the completed samples.
+        `schema` is imported from the path saved in `checkpoint` if it is None.
+        """
+        schema = self._start_resume(checkpoint, schema)
+        yield from self._continue(
+            checkpoint.job,
             schema,
-            # include_raw=True
+            list(checkpoint.messages),
+            checkpoint.num_fixed,
+            list(checkpoint.items),
+            checkpoint.next_index,
+        )
+
+    def _create_job(
+        self,
+        model_name: str,
+        model_description: str | None,
+        schema: Type[_BM],
+        few_shot_samples: list[_BM] | None,
+        num_sample: int,
+    ) -> dict[str, Any]:
+        return {
+            "model_name": model_name,
+            "model_description": model_description,
+            "schema": object_path(schema),
+            "few_shot_samples": [sample.dict() for sample in few_shot_samples or []],
+            "num_sample": num_sample,
+            "chunk_size": self._chunk_size,
+        }
+
+    def _start_resume(
+        self, checkpoint: Checkpoint, schema: Type[_BM] | None
+    ) -> Type[_BM]:
+        if schema is None:
+            schema = import_object(checkpoint.job["schema"])
+        self._start_dedup(
+            [
+                self._dedup_key(schema.parse_obj(obj))
+                for obj in [*checkpoint.job["few_shot_samples"], *checkpoint.items]
+            ]
+        )
+        self._start_saturation()
+        return schema
+
+    def _continue(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[dict[str, Any]],
+        next_index: int,
+    ) -> Generator[_BM, None, None]:
+        if job.get("chunk_size", 1) > 1:
+            yield from self._continue_chunked(
+                job, schema, messages, num_fixed, items, next_index
+            )
+            return
+        num_sample = job["num_sample"]
+        for i_call in range(next_index, self._max_num_call(num_sample)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("sample")
+            messages.append(self._create_human_message())
+            new_sample, raw_text = self._invoke_structured_with_raw(
+                self._select_history(messages, num_fixed, record),
+                schema,
+                record,
+                repair=self._json_repair,
+            )
+            messages.append(self._create_sample_ai_message(new_sample, raw_text))
+            is_new = self._is_new(self._dedup_key(new_sample))
+            self._finish_record(record, int(is_new))
+            if is_new:
+                items.append(json.loads(new_sample.json()))
+            # saved first, so that no yielded example is missing in the checkpoint
+            self._save_checkpoint(job, messages, num_fixed, items, i_call + 1)
+            if is_new:
+                yield new_sample
+            if self._is_saturated([self._dedup_key(new_sample)]):
+                break
+        self._end_job(len(items) >= num_sample)
+
+    def _chunk_tool(self, schema: Type[BaseModel]) -> dict[str, Any]:
+        if schema not in self._chunk_tools:
+            self._chunk_tools[schema] = self._create_chunk_tool(schema)
+        return self._chunk_tools[schema]
+
+    @classmethod
+    def _validate_chunk(
+        cls, schema: Type[_BM], obj: dict[str, Any], index_list: list[int]
+    ) -> tuple[dict[int, _BM], dict[int, str]]:
+        """Validates each element of the arguments of the chunk tool, and returns the valid samples and the errors."""
+        samples: dict[int, _BM] = {}
+        errors: dict[int, str] = {}
+        elements = obj.get("items")
+        for element in elements if isinstance(elements, list) else []:
+            if not isinstance(element, dict):
+                continue
+            try:
+                index = int(element.get("index"))  # type: ignore
+            except (TypeError, ValueError):
+                continue
+            if index not in index_list or index in samples:
+                continue
+            try:
+                samples[index] = schema.parse_obj(
+                    {key: value for key, value in element.items() if key != "index"}
+                )
+                errors.pop(index, None)
+            except ValidationError as e:
+                errors[index] = " ".join(str(e).split())
+        return (
+            {i: samples[i] for i in index_list if i in samples},
+            {i: errors.get(i, "missing") for i in index_list if i not in samples},
+        )
+
+    @classmethod
+    def _check_valid(cls, errors: dict[int, str]) -> None:
+        if errors:
+            raise ValueError(
+                f"Some examples are still invalid after the retries. errors: {errors}"
+            )
+
+    def _request_chunk(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        record: CallRecord | None,
+    ) -> Generator[tuple[int, _BM], None, None]:
+        """
+        Requests a chunk for the last human message in `messages`, appends the answer
+        (and the follow-up turns requesting the invalid examples again) to it,
+        and yields `(index, sample)` of the valid examples.
+        """
+        tool = self._chunk_tool(schema)
+        retry_policy = self._retry_policy or RetryPolicy()
+        errors = {i: "missing" for i in index_list}
+        for i_retry in range(retry_policy.max_retries + 1):
+            if i_retry > 0:
+                messages.append(
+                    self._create_invalid_human_message(job["model_name"], errors)
+                )
+            obj = self._invoke_json(
+                self._select_history(messages, num_fixed, record),
+                tool,
+                record,
+                repair=self._json_repair,
+            )
+            samples, errors = self._validate_chunk(schema, obj, list(errors))
+            messages.append(self._create_chunk_ai_message(samples))
+            yield from samples.items()
+            if not errors:
+                break
+        self._check_valid(errors)
+
+    def _continue_chunked(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[dict[str, Any]],
+        next_index: int,
+    ) -> Generator[_BM, None, None]:
+        num_sample = job["num_sample"]
+        chunk_size = job["chunk_size"]
+        num_few_shot = len(job["few_shot_samples"])
+        num_chunk = -(-num_sample // chunk_size)
+        for i_chunk in range(next_index, self._max_num_call(num_chunk)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("chunk")
+            first = num_few_shot + i_chunk * chunk_size + 1
+            last = first + chunk_size - 1
+            messages.append(
+                self._create_chunk_human_message(job["model_name"], first, last)
+            )
+            keys = []
+            accepted: list[_BM] = []
+            for _, sample in self._request_chunk(
+                job, schema, messages, num_fixed, list(range(first, last + 1)), record
+            ):
+                keys.append(self._dedup_key(sample))
+                if len(items) < num_sample and self._is_new(keys[-1]):
+                    items.append(json.loads(sample.json()))
+                    accepted.append(sample)
+            # the chunk is saved before its examples are yielded
+            self._save_checkpoint(job, messages, num_fixed, items, i_chunk + 1)
+            self._finish_record(record, len(accepted))
+            for sample in accepted:
+                yield sample
+            if self._is_saturated(keys):
+                break
+        self._end_job(len(items) >= num_sample)
+
+    async def agenerate(
+        self,
+        model_name: str,
+        model_description: str | None,
+        schema: Type[_BM],
+        few_shot_samples: list[_BM] | None,
+        num_sample: int,
+    ) -> AsyncGenerator[_BM, None]:
+        """async version of `generate` using `with_structured_output(...).ainvoke`"""
+        messages = self._create_initial_messages(
+            model_name, model_description, schema, few_shot_samples
+        )
+        job = self._create_job(
+            model_name, model_description, schema, few_shot_samples, num_sample
         )
-        for _ in range(num_sample):
+        self._start_dedup([self._dedup_key(sample) for sample in few_shot_samples or []])
+        self._start_saturation()
+        self._start_checkpoint()
+        async for sample in self._acontinue(job, schema, messages, len(messages), [], 0):
+            yield sample
+
+    async def aresume(
+        self, checkpoint: Checkpoint, schema: Type[_BM] | None = None
+    ) -> AsyncGenerator[_BM, None]:
+        """async version of `resume`"""
+        schema = self._start_resume(checkpoint, schema)
+        async for sample in self._acontinue(
+            checkpoint.job,
+            schema,
+            list(checkpoint.messages),
+            checkpoint.num_fixed,
+            list(checkpoint.items),
+            checkpoint.next_index,
+        ):
+            yield sample
+
+    async def _acontinue(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[dict[str, Any]],
+        next_index: int,
+    ) -> AsyncGenerator[_BM, None]:
+        if job.get("chunk_size", 1) > 1:
+            async for sample in self._acontinue_chunked(
+                job, schema, messages, num_fixed, items, next_index
+            ):
+                yield sample
+            return
+        num_sample = job["num_sample"]
+        for i_call in range(next_index, self._max_num_call(num_sample)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("sample")
             messages.append(self._create_human_message())
-            new_sample = llm_with_structured_output.invoke(messages)
-            if not isinstance(new_sample, schema):
-                # This scope is never reached, but is written for static type analysis.
-                raise TypeError(
-                    f"Unexpected Error. type(new_sample): {type(new_sample)}, schema: {schema}"
+            new_sample, raw_text = await self._ainvoke_structured_with_raw(
+                self._select_history(messages, num_fixed, record),
+                schema,
+                record,
+                repair=self._json_repair,
+            )
+            messages.append(self._create_sample_ai_message(new_sample, raw_text))
+            is_new = self._is_new(self._dedup_key(new_sample))
+            self._finish_record(record, int(is_new))
+            if is_new:
+                items.append(json.loads(new_sample.json()))
+            # saved first, so that no yielded example is missing in the checkpoint
+            self._save_checkpoint(job, messages, num_fixed, items, i_call + 1)
+            if is_new:
+                yield new_sample
+            if self._is_saturated([self._dedup_key(new_sample)]):
+                break
+        self._end_job(len(items) >= num_sample)
+
+    async def _arequest_chunk(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        index_list: list[int],
+        record: CallRecord | None,
+    ) -> AsyncGenerator[tuple[int, _BM], None]:
+        """async version of `_request_chunk`"""
+        tool = self._chunk_tool(schema)
+        retry_policy = self._retry_policy or RetryPolicy()
+        errors = {i: "missing" for i in index_list}
+        for i_retry in range(retry_policy.max_retries + 1):
+            if i_retry > 0:
+                messages.append(
+                    self._create_invalid_human_message(job["model_name"], errors)
                 )
-            messages.append(AIMessage(new_sample.json(ensure_ascii=False, indent=4)))
-            yield new_sample
+            obj = await self._ainvoke_json(
+                self._select_history(messages, num_fixed, record),
+                tool,
+                record,
+                repair=self._json_repair,
+            )
+            samples, errors = self._validate_chunk(schema, obj, list(errors))
+            messages.append(self._create_chunk_ai_message(samples))
+            for item in samples.items():
+                yield item
+            if not errors:
+                break
+        self._check_valid(errors)
+
+    async def _acontinue_chunked(
+        self,
+        job: dict[str, Any],
+        schema: Type[_BM],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[dict[str, Any]],
+        next_index: int,
+    ) -> AsyncGenerator[_BM, None]:
+        num_sample = job["num_sample"]
+        chunk_size = job["chunk_size"]
+        num_few_shot = len(job["few_shot_samples"])
+        num_chunk = -(-num_sample // chunk_size)
+        for i_chunk in range(next_index, self._max_num_call(num_chunk)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("chunk")
+            first = num_few_shot + i_chunk * chunk_size + 1
+            last = first + chunk_size - 1
+            messages.append(
+                self._create_chunk_human_message(job["model_name"], first, last)
+            )
+            keys = []
+            accepted: list[_BM] = []
+            async for _, sample in self._arequest_chunk(
+                job, schema, messages, num_fixed, list(range(first, last + 1)), record
+            ):
+                keys.append(self._dedup_key(sample))
+                if len(items) < num_sample and self._is_new(keys[-1]):
+                    items.append(json.loads(sample.json()))
+                    accepted.append(sample)
+            # the chunk is saved before its examples are yielded
+            self._save_checkpoint(job, messages, num_fixed, items, i_chunk + 1)
+            self._finish_record(record, len(accepted))
+            for sample in accepted:
+                yield sample
+            if self._is_saturated(keys):
+                break
+        self._end_job(len(items) >= num_sample)
 
 
 class ChatModelStructureSamplerJA(ChatModelStructureSampler):
@@ -133,15 +752,26 @@ class ChatModelStructureSamplerJA(ChatModelStructureSampler):
         model_name: str,
         model_description: str | None,
         model_fields: dict[str, _ModelField],
+        chunk_size: int = 1,
     ) -> SystemMessage:
         msg = ""
-        msg += (
-            f"あなたは `{model_name}` の例を例示するエキスパートアルゴリズムです。"
-            f"ユーザーがコマンド `{cls._HUMAN_COMMAND}` を発行した場合に, 既存の例のいずれとも異なる例を1つ例示してください。"
-            f"\n"
-            f"**回答は `{model_name}` を単位として1単位の例のみ示してください**."
-            f"\n"
-        )
+        if chunk_size == 1:
+            msg += (
+                f"あなたは `{model_name}` の例を例示するエキスパートアルゴリズムです。"
+                f"ユーザーがコマンド `{cls._HUMAN_COMMAND}` を発行した場合に, 既存の例のいずれとも異なる例を1つ例示してください。"
+                f"\n"
+                f"**回答は `{model_name}` を単位として1単位の例のみ示してください**."
+                f"\n"
+            )
+        else:
+            msg += (
+                f"あなたは `{model_name}` の例を例示するエキスパートアルゴリズムです。"
+                f"ユーザーが番号を指定して例を求めた場合に, 既存の例のいずれとも異なる例を番号ごとに例示してください。"
+                f"各例の `index` にはその番号を入れてください。"
+                f"\n"
+                f"**各例は `{model_name}` を単位として1単位としてください**."
+                f"\n"
+            )
         msg += "\n"
 
         if model_description is not None:
@@ -164,3 +794,29 @@ class ChatModelStructureSamplerJA(ChatModelStructureSampler):
         msg += "\n"
 
         return SystemMessage(msg)
+
+    @classmethod
+    def _create_history_note(cls, field_names: list[str], is_key_fields: bool) -> str:
+        only = "のみ" if is_key_fields else ""
+        return (
+            f"この会話での過去の例は、フィールド {', '.join(f'`{name}`' for name in field_names)} "
+            f"の値{only}をこの順にタブ区切りで示しています。"
+        )
+
+    @classmethod
+    def _create_chunk_human_message(
+        cls, model_name: str, first_index: int, last_index: int
+    ) -> HumanMessage:
+        return HumanMessage(
+            f"{model_name} の例を {first_index} 番から {last_index} 番まで {last_index-first_index+1} 個挙げてください。"
+        )
+
+    @classmethod
+    def _create_invalid_human_message(
+        cls, model_name: str, errors: dict[int, str]
+    ) -> HumanMessage:
+        return HumanMessage(
+            f"いくつかの例が欠けているか不正です。次の番号の {model_name} の例のみを挙げてください: "
+            f"{', '.join(str(i) for i in errors)}。\n"
+            + "\n".join(f"{i}: {error}" for i, error in errors.items())
+        )
@@ -1,9 +1,10 @@
-from typing import Generator
-from langchain.chat_models.base import BaseChatModel
+from typing import Any, AsyncGenerator, Generator
 from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from .chat_model_sampler_base import ChatModelSamplerBase
+from .checkpoint import Checkpoint
 
 
-class ChatModelTextSampler(object):
+class ChatModelTextSampler(ChatModelSamplerBase):
     """
     sampling texts with chat models.
 
@@ -41,9 +42,6 @@ class ChatModelTextSampler(object):
     def _create_sample_ai_message(cls, sample: str) -> AIMessage:
         return AIMessage(sample)
 
-    def __init__(self, llm: BaseChatModel) -> None:
-        self._llm = llm
-
     def sample_n(
         self,
         category_name: str,
@@ -57,13 +55,44 @@ class ChatModelTextSampler(object):
             )
         )
 
-    def generate(
+    async def asample_n(
         self,
         category_name: str,
         category_description: str | None,
         few_shot_samples: list[str] | None,
         num_sample: int,
-    ) -> Generator[str, None, None]:
+    ) -> list[str]:
+        return [
+            text
+            async for text in self.agenerate(
+                category_name, category_description, few_shot_samples, num_sample
+            )
+        ]
+
+    def _create_initial_messages(
+        self,
+        category_name: str,
+        category_description: str | None,
+        few_shot_samples: list[str] | None,
+    ) -> list[BaseMessage]:
+        return self._memoized_prefix(
+            (
+                type(self),
+                category_name,
+                category_description,
+                tuple(few_shot_samples or []),
+            ),
+            lambda: self._create_prefix_messages(
+                category_name, category_description, few_shot_samples
+            ),
+        )
+
+    def _create_prefix_messages(
+        self,
+        category_name: str,
+        category_description: str | None,
+        few_shot_samples: list[str] | None,
+    ) -> list[BaseMessage]:
         if few_shot_samples is None:
             few_shot_samples = []
         messages: list[BaseMessage] = []
@@ -76,11 +105,138 @@ class ChatModelTextSampler(object):
         for fs_sample in few_shot_samples:
             messages.append(self._create_human_message())
             messages.append(self._create_sample_ai_message(fs_sample))
-        for _ in range(num_sample):
+        return messages
+
+    def generate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        few_shot_samples: list[str] | None,
+        num_sample: int,
+    ) -> Generator[str, None, None]:
+        messages = self._create_initial_messages(
+            category_name, category_description, few_shot_samples
+        )
+        job = {
+            "category_name": category_name,
+            "category_description": category_description,
+            "few_shot_samples": few_shot_samples,
+            "num_sample": num_sample,
+        }
+        self._start_dedup(few_shot_samples or [])
+        self._start_saturation()
+        self._start_checkpoint()
+        yield from self._continue(job, messages, len(messages), [], 0)
+
+    def resume(self, checkpoint: Checkpoint) -> Generator[str, None, None]:
+        """continues `generate` from `checkpoint` without calling LLM again for the completed samples"""
+        self._start_dedup([*(checkpoint.job["few_shot_samples"] or []), *checkpoint.items])
+        self._start_saturation()
+        yield from self._continue(
+            checkpoint.job,
+            list(checkpoint.messages),
+            checkpoint.num_fixed,
+            list(checkpoint.items),
+            checkpoint.next_index,
+        )
+
+    def _continue(
+        self,
+        job: dict[str, Any],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[str],
+        next_index: int,
+    ) -> Generator[str, None, None]:
+        num_sample = job["num_sample"]
+        for i_call in range(next_index, self._max_num_call(num_sample)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("sample")
+            messages.append(self._create_human_message())
+            new_ai_message = self._invoke(
+                self._select_history(messages, num_fixed, record), record
+            )
+            messages.append(new_ai_message)
+            text = str(new_ai_message.content)
+            is_new = self._is_new(text)
+            self._finish_record(record, int(is_new))
+            if is_new:
+                items.append(text)
+            # saved first, so that no yielded example is missing in the checkpoint
+            self._save_checkpoint(job, messages, num_fixed, items, i_call + 1)
+            if is_new:
+                yield text
+            if self._is_saturated([text]):
+                break
+        self._end_job(len(items) >= num_sample)
+
+    async def agenerate(
+        self,
+        category_name: str,
+        category_description: str | None,
+        few_shot_samples: list[str] | None,
+        num_sample: int,
+    ) -> AsyncGenerator[str, None]:
+        """async version of `generate` using `BaseChatModel.ainvoke`"""
+        messages = self._create_initial_messages(
+            category_name, category_description, few_shot_samples
+        )
+        job = {
+            "category_name": category_name,
+            "category_description": category_description,
+            "few_shot_samples": few_shot_samples,
+            "num_sample": num_sample,
+        }
+        self._start_dedup(few_shot_samples or [])
+        self._start_saturation()
+        self._start_checkpoint()
+        async for text in self._acontinue(job, messages, len(messages), [], 0):
+            yield text
+
+    async def aresume(self, checkpoint: Checkpoint) -> AsyncGenerator[str, None]:
+        """async version of `resume`"""
+        self._start_dedup([*(checkpoint.job["few_shot_samples"] or []), *checkpoint.items])
+        self._start_saturation()
+        async for text in self._acontinue(
+            checkpoint.job,
+            list(checkpoint.messages),
+            checkpoint.num_fixed,
+            list(checkpoint.items),
+            checkpoint.next_index,
+        ):
+            yield text
+
+    async def _acontinue(
+        self,
+        job: dict[str, Any],
+        messages: list[BaseMessage],
+        num_fixed: int,
+        items: list[str],
+        next_index: int,
+    ) -> AsyncGenerator[str, None]:
+        num_sample = job["num_sample"]
+        for i_call in range(next_index, self._max_num_call(num_sample)):
+            if len(items) >= num_sample:
+                break
+            record = self._start_record("sample")
             messages.append(self._create_human_message())
-            new_ai_message = self._llm.invoke(messages)
+            new_ai_message = await self._ainvoke(
+                self._select_history(messages, num_fixed, record), record
+            )
             messages.append(new_ai_message)
-            yield str(new_ai_message.content)
+            text = str(new_ai_message.content)
+            is_new = self._is_new(text)
+            self._finish_record(record, int(is_new))
+            if is_new:
+                items.append(text)
+            # saved first, so that no yielded example is missing in the checkpoint
+            self._save_checkpoint(job, messages, num_fixed, items, i_call + 1)
+            if is_new:
+                yield text
+            if self._is_saturated([text]):
+                break
+        self._end_job(len(items) >= num_sample)
 
 
 class ChatModelTextSamplerJA(ChatModelTextSampler):
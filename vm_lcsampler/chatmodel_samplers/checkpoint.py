@@ -0,0 +1,250 @@
+import importlib
+import json
+import os
+import sqlite3
+import threading
+from dataclasses import dataclass, field
+from typing import Any
+from langchain_core.messages import BaseMessage, messages_from_dict, messages_to_dict
+
+
+def object_path(obj: Any) -> str:
+    """`module:qualname` of a class or a function"""
+    return f"{obj.__module__}:{obj.__qualname__}"
+
+
+def import_object(path: str) -> Any:
+    """imports an object from `module:qualname`"""
+    module_name, _, qualname = path.partition(":")
+    if "<locals>" in qualname:
+        raise ValueError(f"A local object cannot be imported. path: {path}")
+    obj: Any = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+
+@dataclass
+class Checkpoint(object):
+    """
+    State of a sampling job.
+
+    `job` holds the arguments of the job, `messages` the whole conversation,
+    `messages[:num_fixed]` the system message and few-shot turns,
+    `items` the yielded examples (JSON-serializable),
+    `next_index` the number of chunks (or samples) requested so far,
+    and `extra` the other state of the sampler (JSON-serializable).
+    """
+
+    sampler: str
+    job: dict[str, Any]
+    messages: list[BaseMessage]
+    num_fixed: int
+    items: list[Any]
+    next_index: int
+    extra: dict[str, Any] = field(default_factory=dict)
+
+
+class CheckpointStore(object):
+    """
+    Base class of stores of a checkpoint of one job.
+    Messages and items are append-only in a job, so only the new ones are written on `save`.
+    """
+
+    def reset(self) -> None:
+        """called when a new job starts"""
+        raise NotImplementedError()
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        raise NotImplementedError()
+
+    def load(self) -> Checkpoint | None:
+        """returns None if nothing is saved"""
+        raise NotImplementedError()
+
+
+class JSONLCheckpointStore(CheckpointStore):
+    """
+    Append-only JSONL file of checkpoints.
+    Each line holds the messages and items added since the previous line,
+    and the first line of a job additionally holds the arguments of the job.
+    """
+
+    def __init__(self, path: str) -> None:
+        self._path = path
+        self._num_saved_messages = 0
+        self._num_saved_items = 0
+        self._lock = threading.Lock()
+
+    def reset(self) -> None:
+        with self._lock:
+            # the lines of the previous job would otherwise be loaded with the new one
+            with open(self._path, "w", encoding="utf-8"):
+                pass
+            self._num_saved_messages = 0
+            self._num_saved_items = 0
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        with self._lock:
+            record: dict[str, Any] = {}
+            if self._num_saved_messages == 0:
+                record["sampler"] = checkpoint.sampler
+                record["job"] = checkpoint.job
+                record["num_fixed"] = checkpoint.num_fixed
+            record["next_index"] = checkpoint.next_index
+            record["extra"] = checkpoint.extra
+            record["messages"] = messages_to_dict(
+                checkpoint.messages[self._num_saved_messages :]
+            )
+            record["items"] = checkpoint.items[self._num_saved_items :]
+            with open(self._path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self._num_saved_messages = len(checkpoint.messages)
+            self._num_saved_items = len(checkpoint.items)
+
+    def load(self) -> Checkpoint | None:
+        if not os.path.exists(self._path):
+            return None
+        checkpoint: Checkpoint | None = None
+        with open(self._path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be broken by a crash while writing
+                    break
+                if "job" in record:
+                    checkpoint = Checkpoint(
+                        sampler=record["sampler"],
+                        job=record["job"],
+                        messages=[],
+                        num_fixed=record["num_fixed"],
+                        items=[],
+                        next_index=0,
+                    )
+                if checkpoint is None:
+                    continue
+                checkpoint.messages.extend(messages_from_dict(record["messages"]))
+                checkpoint.items.extend(record["items"])
+                checkpoint.next_index = record["next_index"]
+                checkpoint.extra = record.get("extra", {})
+        if checkpoint is not None:
+            self._num_saved_messages = len(checkpoint.messages)
+            self._num_saved_items = len(checkpoint.items)
+        return checkpoint
+
+
+class SQLiteCheckpointStore(CheckpointStore):
+    """Checkpoints in a SQLite file, where several jobs can be stored with distinct `job_id`."""
+
+    def __init__(self, path: str, job_id: str = "default") -> None:
+        self._job_id = job_id
+        self._num_saved_messages = 0
+        self._num_saved_items = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoint_jobs ("
+                "job_id TEXT PRIMARY KEY, sampler TEXT NOT NULL, job TEXT NOT NULL, "
+                "num_fixed INTEGER NOT NULL, next_index INTEGER NOT NULL, "
+                "extra TEXT NOT NULL DEFAULT '{}')"
+            )
+            try:
+                # files written before `extra` was added
+                self._connection.execute(
+                    "ALTER TABLE checkpoint_jobs ADD COLUMN extra TEXT NOT NULL DEFAULT '{}'"
+                )
+            except sqlite3.OperationalError:
+                pass
+            for table, column in [
+                ("checkpoint_messages", "message"),
+                ("checkpoint_items", "item"),
+            ]:
+                self._connection.execute(
+                    f"CREATE TABLE IF NOT EXISTS {table} ("
+                    f"job_id TEXT NOT NULL, seq INTEGER NOT NULL, {column} TEXT NOT NULL, "
+                    "PRIMARY KEY (job_id, seq))"
+                )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def reset(self) -> None:
+        with self._lock, self._connection:
+            for table in ["checkpoint_jobs", "checkpoint_messages", "checkpoint_items"]:
+                self._connection.execute(
+                    f"DELETE FROM {table} WHERE job_id = ?", (self._job_id,)
+                )
+            self._num_saved_messages = 0
+            self._num_saved_items = 0
+
+    def save(self, checkpoint: Checkpoint) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoint_jobs "
+                "(job_id, sampler, job, num_fixed, next_index, extra) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self._job_id,
+                    checkpoint.sampler,
+                    json.dumps(checkpoint.job, ensure_ascii=False),
+                    checkpoint.num_fixed,
+                    checkpoint.next_index,
+                    json.dumps(checkpoint.extra, ensure_ascii=False),
+                ),
+            )
+            new_messages = messages_to_dict(checkpoint.messages[self._num_saved_messages :])
+            self._connection.executemany(
+                "INSERT INTO checkpoint_messages VALUES (?, ?, ?)",
+                [
+                    (self._job_id, self._num_saved_messages + i, json.dumps(m, ensure_ascii=False))
+                    for i, m in enumerate(new_messages)
+                ],
+            )
+            self._connection.executemany(
+                "INSERT INTO checkpoint_items VALUES (?, ?, ?)",
+                [
+                    (self._job_id, self._num_saved_items + i, json.dumps(item, ensure_ascii=False))
+                    for i, item in enumerate(checkpoint.items[self._num_saved_items :])
+                ],
+            )
+            self._num_saved_messages = len(checkpoint.messages)
+            self._num_saved_items = len(checkpoint.items)
+
+    def load(self) -> Checkpoint | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sampler, job, num_fixed, next_index, extra FROM checkpoint_jobs WHERE job_id = ?",
+                (self._job_id,),
+            ).fetchone()
+            if row is None:
+                return None
+            messages = messages_from_dict(
+                [
+                    json.loads(m)
+                    for (m,) in self._connection.execute(
+                        "SELECT message FROM checkpoint_messages WHERE job_id = ? ORDER BY seq",
+                        (self._job_id,),
+                    )
+                ]
+            )
+            items = [
+                json.loads(item)
+                for (item,) in self._connection.execute(
+                    "SELECT item FROM checkpoint_items WHERE job_id = ? ORDER BY seq",
+                    (self._job_id,),
+                )
+            ]
+        self._num_saved_messages = len(messages)
+        self._num_saved_items = len(items)
+        return Checkpoint(
+            sampler=row[0],
+            job=json.loads(row[1]),
+            messages=messages,
+            num_fixed=row[2],
+            items=items,
+            next_index=row[3],
+            extra=json.loads(row[4]),
+        )
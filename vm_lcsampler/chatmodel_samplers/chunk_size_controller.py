@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class ChunkObservation(object):
+    """what happened in one chunk of `ChatModelChunkedTextEnumerator`"""
+
+    chunk_size: int
+    seconds: float
+    num_missing: int
+    num_duplicate: int
+    num_item: int
+    num_output_tokens: int
+
+    @property
+    def missing_rate(self) -> float:
+        return self.num_missing / self.chunk_size if self.chunk_size else 0.0
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.num_duplicate / self.num_item if self.num_item else 0.0
+
+
+class AdaptiveChunkSizeController(object):
+    """
+    Chooses the size of the next chunk from the observation of the last chunk.
+
+    The size is multiplied by `shrink` if the rate of indices missing in the first answer
+    exceeds `max_missing_rate` or the duplicate rate exceeds `max_duplicate_rate`.
+    Otherwise it is multiplied by `growth` as long as the latency per item does not get worse
+    than the best one so far by more than `tolerance`, and goes back to the best size if it does.
+    If `context_window_tokens` is given, the size is also limited so that the prompt and
+    the expected answer fit in it.
+    The size is kept within [`min_chunk_size`, `max_chunk_size`].
+    A controller holds the state of one job, so it should not be shared by concurrent jobs.
+    """
+
+    def __init__(
+        self,
+        min_chunk_size: int = 5,
+        max_chunk_size: int = 100,
+        max_missing_rate: float = 0.05,
+        max_duplicate_rate: float = 0.2,
+        growth: float = 1.5,
+        shrink: float = 0.5,
+        tolerance: float = 0.1,
+        context_window_tokens: int | None = None,
+    ) -> None:
+        if not 1 <= min_chunk_size <= max_chunk_size:
+            raise ValueError(
+                f"1 <= min_chunk_size <= max_chunk_size must be satisfied. min_chunk_size: {min_chunk_size}, max_chunk_size: {max_chunk_size}"
+            )
+        self.min_chunk_size = min_chunk_size
+        self.max_chunk_size = max_chunk_size
+        self._max_missing_rate = max_missing_rate
+        self._max_duplicate_rate = max_duplicate_rate
+        self._growth = growth
+        self._shrink = shrink
+        self._tolerance = tolerance
+        self._context_window_tokens = context_window_tokens
+        self.reset()
+
+    def reset(self) -> None:
+        """called when a new job starts"""
+        self._best_seconds_per_item: float | None = None
+        self._best_chunk_size: int | None = None
+        self._tokens_per_item: float | None = None
+        self.history: list[tuple[ChunkObservation, int]] = []
+
+    def clamp(self, chunk_size: int) -> int:
+        return max(self.min_chunk_size, min(self.max_chunk_size, chunk_size))
+
+    def next_chunk_size(
+        self, observation: ChunkObservation, num_prompt_tokens: int
+    ) -> int:
+        """`num_prompt_tokens` is the number of tokens of the prompt of the next chunk"""
+        size = observation.chunk_size
+        if (
+            observation.missing_rate > self._max_missing_rate
+            or observation.duplicate_rate > self._max_duplicate_rate
+        ):
+            next_size = int(size * self._shrink)
+        elif observation.num_item == 0:
+            next_size = size
+        else:
+            seconds_per_item = observation.seconds / observation.num_item
+            if (
+                self._best_seconds_per_item is None
+                or seconds_per_item <= self._best_seconds_per_item * (1 + self._tolerance)
+            ):
+                if (
+                    self._best_seconds_per_item is None
+                    or seconds_per_item < self._best_seconds_per_item
+                ):
+                    self._best_seconds_per_item = seconds_per_item
+                    self._best_chunk_size = size
+                next_size = max(int(size * self._growth), size + 1)
+            else:
+                next_size = self._best_chunk_size or size
+
+        if observation.num_item > 0:
+            tokens_per_item = observation.num_output_tokens / observation.num_item
+            self._tokens_per_item = (
+                tokens_per_item
+                if self._tokens_per_item is None
+                else 0.5 * self._tokens_per_item + 0.5 * tokens_per_item
+            )
+        if self._context_window_tokens is not None and self._tokens_per_item:
+            next_size = min(
+                next_size,
+                int(
+                    (self._context_window_tokens - num_prompt_tokens)
+                    / self._tokens_per_item
+                ),
+            )
+        next_size = self.clamp(next_size)
+        self.history.append((observation, next_size))
+        return next_size
@@ -0,0 +1,231 @@
+import csv
+import json
+import time
+from typing import Any, Iterable
+from .instrumentation import CallRecord, InstrumentationSink
+
+
+class DatasetWriter(InstrumentationSink):
+    """
+    Base class of writers which save the output of a sampler incrementally.
+
+    Items are converted to rows by `to_row`: a pydantic model becomes its fields,
+    a string `{"text": ...}`, and the tuples of `enumerate` / `enumerate_many`
+    get `index` (and `category`) columns.
+    Rows are buffered and written by `buffer_size` rows,
+    so that the memory does not grow with the number of rows.
+    On each flush and on `close`, `<path>.meta.json` is written with `metadata`
+    (e.g. category and model), the number of rows, the range of `index`, the wall-clock time,
+    and the sums of the `CallRecord`s emitted to the writer when it is also passed
+    as `instrumentation` of the sampler.
+    """
+
+    format = ""
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 1000,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        self.path = path
+        self.num_row = 0
+        self._buffer_size = buffer_size
+        self._buffer: list[dict[str, Any]] = []
+        self._metadata = metadata or {}
+        self._started_at = time.time()
+        self._index_range: list[int] | None = None
+        self._steps = {
+            "num_step": 0,
+            "num_llm_call": 0,
+            "llm_seconds": 0.0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+        }
+
+    def __enter__(self) -> "DatasetWriter":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    @classmethod
+    def to_row(cls, item: Any) -> dict[str, Any]:
+        if isinstance(item, tuple) and len(item) == 3:
+            category, index, value = item
+            return {"category": category, "index": index, **cls.to_row(value)}
+        if isinstance(item, tuple) and len(item) == 2:
+            index, value = item
+            return {"index": index, **cls.to_row(value)}
+        if isinstance(item, dict):
+            return item
+        if hasattr(item, "dict"):
+            return item.dict()
+        return {"text": item}
+
+    def write(self, item: Any) -> None:
+        row = self.to_row(item)
+        index = row.get("index")
+        if isinstance(index, int):
+            if self._index_range is None:
+                self._index_range = [index, index]
+            else:
+                self._index_range[0] = min(self._index_range[0], index)
+                self._index_range[1] = max(self._index_range[1], index)
+        self._buffer.append(row)
+        self.num_row += 1
+        if len(self._buffer) >= self._buffer_size:
+            self.flush()
+
+    def write_all(self, items: Iterable[Any]) -> int:
+        """writes the items of a generator of a sampler, and returns the number of them"""
+        num_row = self.num_row
+        for item in items:
+            self.write(item)
+        self.flush()
+        return self.num_row - num_row
+
+    def emit(self, record: CallRecord) -> None:
+        self._steps["num_step"] += 1
+        self._steps["num_llm_call"] += record.num_llm_call
+        self._steps["llm_seconds"] += record.llm_seconds
+        self._steps["prompt_tokens"] += record.prompt_tokens or 0
+        self._steps["completion_tokens"] += record.completion_tokens or 0
+
+    def _write_rows(self, rows: list[dict[str, Any]]) -> None:
+        raise NotImplementedError()
+
+    def flush(self) -> None:
+        if self._buffer:
+            self._write_rows(self._buffer)
+            self._buffer = []
+        self._write_metadata()
+
+    def close(self) -> None:
+        self.flush()
+
+    def _write_metadata(self) -> None:
+        metadata = {
+            **self._metadata,
+            "format": self.format,
+            "num_row": self.num_row,
+            "index_range": self._index_range,
+            "started_at": self._started_at,
+            "seconds": time.time() - self._started_at,
+            **self._steps,
+        }
+        with open(f"{self.path}.meta.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False, indent=2, default=str)
+
+
+class JSONLDatasetWriter(DatasetWriter):
+    """writes one JSON object per line"""
+
+    format = "jsonl"
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 1000,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        super().__init__(path, buffer_size, metadata)
+        self._file = open(path, "w", encoding="utf-8")
+
+    def _write_rows(self, rows: list[dict[str, Any]]) -> None:
+        self._file.write(
+            "".join(
+                json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows
+            )
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        super().close()
+        self._file.close()
+
+
+class CSVDatasetWriter(DatasetWriter):
+    """
+    writes a CSV file whose columns are `columns` (default: the keys of the first row).
+    Nested values are written as JSON.
+    """
+
+    format = "csv"
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 1000,
+        metadata: dict[str, Any] | None = None,
+        columns: list[str] | None = None,
+    ) -> None:
+        super().__init__(path, buffer_size, metadata)
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._columns = columns
+        self._writer: csv.DictWriter | None = None
+
+    def _write_rows(self, rows: list[dict[str, Any]]) -> None:
+        if self._writer is None:
+            self._columns = self._columns or list(rows[0])
+            self._writer = csv.DictWriter(
+                self._file, self._columns, extrasaction="ignore"
+            )
+            self._writer.writeheader()
+        self._writer.writerows(
+            {
+                key: (
+                    json.dumps(value, ensure_ascii=False, default=str)
+                    if isinstance(value, (dict, list))
+                    else value
+                )
+                for key, value in row.items()
+            }
+            for row in rows
+        )
+        self._file.flush()
+
+    def close(self) -> None:
+        super().close()
+        self._file.close()
+
+
+class ParquetDatasetWriter(DatasetWriter):
+    """
+    writes a Parquet file by one row group per flush.
+    The schema is inferred from the first flush.
+    Requires `pyarrow` (the `parquet` extra).
+    """
+
+    format = "parquet"
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 10000,
+        metadata: dict[str, Any] | None = None,
+    ) -> None:
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError as e:
+            raise ImportError(
+                "ParquetDatasetWriter requires pyarrow. Please install it by `pip install pyarrow`."
+            ) from e
+        super().__init__(path, buffer_size, metadata)
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._writer: Any = None
+
+    def _write_rows(self, rows: list[dict[str, Any]]) -> None:
+        if self._writer is None:
+            table = self._pa.Table.from_pylist(rows)
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        else:
+            table = self._pa.Table.from_pylist(rows, schema=self._writer.schema)
+        self._writer.write_table(table)
+
+    def close(self) -> None:
+        super().close()
+        if self._writer is not None:
+            self._writer.close()
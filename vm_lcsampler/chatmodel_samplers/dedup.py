@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import unicodedata
+from dataclasses import dataclass
+
+
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+@dataclass
+class DedupStats(object):
+    """counters of duplicate checks of generated examples"""
+
+    num_checked: int = 0
+    num_duplicate: int = 0
+
+    @property
+    def duplicate_rate(self) -> float:
+        return self.num_duplicate / self.num_checked if self.num_checked else 0.0
+
+
+def normalize_text(text: str) -> str:
+    """NFKC, case folding, removal of punctuations and collapse of whitespaces"""
+    text = unicodedata.normalize("NFKC", text).casefold()
+    text = "".join(
+        " " if unicodedata.category(c).startswith("P") else c for c in text
+    )
+    return " ".join(text.split())
+
+
+class DedupIndex(object):
+    """
+    Index of examples to detect duplicates.
+
+    Duplicates are detected by exact match, and by match after `normalize_text` if `normalize`.
+    If `near_duplicate_threshold` is given, examples whose Jaccard similarity of
+    character `shingle_size`-grams is estimated (by MinHash with LSH) to be at least the threshold
+    are also regarded as duplicates.
+    The index can be shared by several samplers (and threads) in a run.
+    """
+
+    def __init__(
+        self,
+        normalize: bool = True,
+        near_duplicate_threshold: float | None = None,
+        shingle_size: int = 3,
+        num_perm: int = 64,
+        num_band: int = 16,
+    ) -> None:
+        if num_perm % num_band != 0:
+            raise ValueError(
+                f"num_perm % num_band == 0 must be satisfied. num_perm: {num_perm}, num_band: {num_band}"
+            )
+        self._normalize = normalize
+        self._threshold = near_duplicate_threshold
+        self._shingle_size = shingle_size
+        self._num_band = num_band
+        self._rows = num_perm // num_band
+        self._perms = [
+            (
+                int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest()) | 1,
+                int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest()),
+            )
+            for i in range(num_perm)
+        ]
+        self._exact: set[str] = set()
+        self._normalized: set[str] = set()
+        self._bands: list[dict[tuple[int, ...], list[tuple[int, ...]]]] = [
+            {} for _ in range(num_band)
+        ]
+        self._lock = threading.Lock()
+        self.stats = DedupStats()
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def _minhash(self, text: str) -> tuple[int, ...]:
+        k = self._shingle_size
+        shingles = {text[i : i + k] for i in range(max(len(text) - k + 1, 1))}
+        hashes = [
+            int.from_bytes(hashlib.blake2b(s.encode(), digest_size=8).digest())
+            for s in shingles
+        ]
+        return tuple(
+            min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in self._perms
+        )
+
+    def _is_near_duplicate(self, signature: tuple[int, ...]) -> bool:
+        assert self._threshold is not None
+        for i_band, band in enumerate(self._bands):
+            key = signature[i_band * self._rows : (i_band + 1) * self._rows]
+            for candidate in band.get(key, []):
+                similarity = sum(
+                    x == y for x, y in zip(signature, candidate)
+                ) / len(signature)
+                if similarity >= self._threshold:
+                    return True
+        return False
+
+    def add(self, text: str) -> bool:
+        """Adds `text` and returns True if it is new, otherwise returns False without adding."""
+        normalized = normalize_text(text) if self._normalize else text
+        with self._lock:
+            self.stats.num_checked += 1
+            is_duplicate = text in self._exact or normalized in self._normalized
+            signature: tuple[int, ...] = ()
+            if not is_duplicate and self._threshold is not None:
+                signature = self._minhash(normalized)
+                is_duplicate = self._is_near_duplicate(signature)
+            if is_duplicate:
+                self.stats.num_duplicate += 1
+                return False
+            self._exact.add(text)
+            self._normalized.add(normalized)
+            if self._threshold is not None:
+                for i_band, band in enumerate(self._bands):
+                    key = signature[i_band * self._rows : (i_band + 1) * self._rows]
+                    band.setdefault(key, []).append(signature)
+            return True
@@ -0,0 +1,163 @@
+from __future__ import annotations
+import asyncio
+import collections
+import statistics
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    CancelledError,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, TypeVar
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+
+
+_T = TypeVar("_T")
+
+
+class HedgePolicy(object):
+    """
+    Hedged requests against tail latency.
+
+    If an LLM call has not finished in `delay` seconds, a duplicate of it is sent
+    to `hedge_llm` (default: the same model), and whichever finishes first is used.
+    If one of them fails, the other is awaited, and the error of the first call is raised
+    only if both fail.
+    The loser is cancelled if it is still waiting (always in async calls),
+    and otherwise its answer is discarded when it arrives.
+    In sync calls, the duplicate is given a function which raises `CancelledError`
+    once the call is decided, to be checked right before it is sent
+    (e.g. after waiting for a rate limiter).
+    The worker threads of sync calls are shut down by `close` (or at the end of `with`).
+    If `quantile` is given, the delay is the `quantile` of the latencies of the last
+    `window` calls once `min_observations` of them are observed, so that
+    about `1 - quantile` of the calls are hedged.
+    `num_call`, `num_hedged` and `num_hedge_won` count the calls, the hedged ones
+    and those won by the duplicate.
+    """
+
+    def __init__(
+        self,
+        delay: float = 1.0,
+        hedge_llm: BaseChatModel | None = None,
+        quantile: float | None = None,
+        window: int = 100,
+        min_observations: int = 20,
+        max_workers: int | None = None,
+    ) -> None:
+        self.hedge_llm = hedge_llm
+        self._delay = delay
+        self._quantile = quantile
+        self._latencies: collections.deque[float] = collections.deque(maxlen=window)
+        self._min_observations = min_observations
+        self._max_workers = max_workers
+        self._executor: ThreadPoolExecutor | None = None
+        self._lock = threading.Lock()
+        self.num_call = 0
+        self.num_hedged = 0
+        self.num_hedge_won = 0
+
+    def delay(self) -> float:
+        """the seconds to wait before hedging the next call"""
+        with self._lock:
+            if self._quantile is None or len(self._latencies) < self._min_observations:
+                return self._delay
+            cut_points = statistics.quantiles(self._latencies, n=100, method="inclusive")
+            return cut_points[min(max(round(self._quantile * 100) - 1, 0), 98)]
+
+    def _observe(self, start: float, is_hedged: bool, is_hedge_won: bool) -> None:
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+            self.num_call += 1
+            self.num_hedged += int(is_hedged)
+            self.num_hedge_won += int(is_hedge_won)
+
+    def __enter__(self) -> "HedgePolicy":
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """shuts down the worker threads (a later call starts new ones)"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _submit(self, func: Callable[[], _T]) -> Future[_T]:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._max_workers, thread_name_prefix="hedge"
+                )
+            return self._executor.submit(func)
+
+    def call(
+        self,
+        primary: Callable[[], _T],
+        hedge: Callable[[Callable[[], None]], _T],
+    ) -> _T:
+        """`hedge` is called with the function to check that the call is not decided yet"""
+        start = time.perf_counter()
+        first = self._submit(primary)
+        done, _ = wait([first], timeout=self.delay())
+        if done:
+            self._observe(start, False, False)
+            return first.result()
+        is_decided = threading.Event()
+
+        def check_cancelled() -> None:
+            if is_decided.is_set():
+                raise CancelledError("the hedged call has been decided")
+
+        second = self._submit(lambda: hedge(check_cancelled))
+        pending = {first, second}
+        try:
+            while True:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        self._observe(start, True, future is second)
+                        return future.result()
+                if not pending:
+                    self._observe(start, True, False)
+                    return first.result()
+        finally:
+            is_decided.set()
+            for loser in pending:
+                loser.cancel()
+
+    async def acall(
+        self,
+        primary: Callable[[], Awaitable[_T]],
+        hedge: Callable[[], Awaitable[_T]],
+    ) -> _T:
+        start = time.perf_counter()
+        first = asyncio.ensure_future(primary())
+        done, _ = await asyncio.wait([first], timeout=self.delay())
+        if done:
+            self._observe(start, False, False)
+            return first.result()
+        second = asyncio.ensure_future(hedge())
+        pending = {first, second}
+        try:
+            while True:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        self._observe(start, True, task is second)
+                        return task.result()
+                if not pending:
+                    self._observe(start, True, False)
+                    return first.result()
+        finally:
+            for task in pending:
+                task.cancel()
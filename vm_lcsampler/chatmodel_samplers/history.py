@@ -0,0 +1,96 @@
+from typing import Callable
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+
+
+TokenCounter = Callable[[list[BaseMessage]], int]
+MessageSummarizer = Callable[[BaseMessage], list[str]]
+
+
+def estimate_num_tokens(messages: list[BaseMessage]) -> int:
+    """rough token count (4 characters per token) which requires no tokenizer"""
+    return sum(len(str(m.content)) // 4 + 4 for m in messages)
+
+
+class HistoryPolicy(object):
+    """
+    Policy to select the messages sent to LLM from the whole conversation history.
+    This base class sends the whole history as it is.
+    """
+
+    def select(
+        self,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        summarize: MessageSummarizer,
+    ) -> list[BaseMessage]:
+        """
+        `messages[:num_fixed]` are the system message and few-shot turns,
+        and the remaining ones are generated turns followed by the pending human message.
+        `summarize` converts an AI message into the list of produced items.
+        """
+        return messages
+
+
+class SlidingWindowHistoryPolicy(HistoryPolicy):
+    """
+    Keep the system message and few-shot turns fixed,
+    keep recent turns within `max_tokens`,
+    and fold the outputs of older turns into one exclusion message
+    (at most `max_exclusion_tokens`, the most recent outputs first),
+    so that the prompt size is roughly constant for long runs.
+    """
+
+    _EXCLUSION_HEADER = "The following examples were already produced. Do not repeat them:"
+    _EXCLUSION_ACK = "OK. I will not repeat them."
+
+    def __init__(
+        self,
+        max_tokens: int = 2000,
+        max_exclusion_tokens: int = 1000,
+        token_counter: TokenCounter = estimate_num_tokens,
+    ) -> None:
+        self._max_tokens = max_tokens
+        self._max_exclusion_tokens = max_exclusion_tokens
+        self._token_counter = token_counter
+
+    def select(
+        self,
+        messages: list[BaseMessage],
+        num_fixed: int,
+        summarize: MessageSummarizer,
+    ) -> list[BaseMessage]:
+        # The pending human message is always kept,
+        # and older turns are kept as a whole (from a human message) within the budget.
+        cut = len(messages) - 1
+        num_tokens = self._token_counter(messages[cut:])
+        for i in range(len(messages) - 2, num_fixed - 1, -1):
+            num_tokens += self._token_counter([messages[i]])
+            if num_tokens > self._max_tokens:
+                break
+            if isinstance(messages[i], HumanMessage):
+                cut = i
+        if cut <= num_fixed:
+            return messages
+
+        excluded: list[str] = []
+        num_exclusion_tokens = 0
+        for message in reversed(messages[num_fixed:cut]):
+            if not isinstance(message, AIMessage):
+                continue
+            for item in reversed(summarize(message)):
+                num_exclusion_tokens += len(item) // 4 + 1
+                if num_exclusion_tokens > self._max_exclusion_tokens:
+                    break
+                excluded.append(item)
+            if num_exclusion_tokens > self._max_exclusion_tokens:
+                break
+
+        exclusion: list[BaseMessage] = []
+        if excluded:
+            exclusion = [
+                HumanMessage(
+                    "\n".join([self._EXCLUSION_HEADER, "; ".join(reversed(excluded))])
+                ),
+                AIMessage(self._EXCLUSION_ACK),
+            ]
+        return [*messages[:num_fixed], *exclusion, *messages[cut:]]
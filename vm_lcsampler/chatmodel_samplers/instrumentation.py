@@ -0,0 +1,112 @@
+import json
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from typing import Callable
+
+
+@dataclass
+class CallRecord(object):
+    """
+    Measurements of one step of a sampler, i.e. one sample or one chunk.
+    A step may contain several LLM calls (retries, the LLM parse fallback and recovery turns),
+    whose latencies and tokens are summed up.
+    `llm_seconds` includes `queue_wait_seconds` spent waiting for the rate limiter.
+    Token counts are taken from `usage_metadata` and are None if the provider does not report them.
+    `num_prefix_tokens` is the estimated size of the system message and few-shot turns,
+    which every call of a job starts with and a provider-side prompt cache can reuse.
+    `num_repaired` counts the broken JSON answers repaired locally instead of calling LLM again.
+    """
+
+    sampler: str
+    kind: str
+    started_at: float = field(default_factory=time.time)
+    prompt_build_seconds: float = 0.0
+    queue_wait_seconds: float = 0.0
+    llm_seconds: float = 0.0
+    parse_seconds: float = 0.0
+    total_seconds: float = 0.0
+    num_llm_call: int = 0
+    num_cached_call: int = 0
+    num_retry: int = 0
+    num_repaired: int = 0
+    prompt_tokens: int | None = None
+    completion_tokens: int | None = None
+    num_history_messages: int = 0
+    num_history_tokens: int = 0
+    num_prefix_tokens: int = 0
+    num_item: int = 0
+
+    def add_usage(self, usage: dict | None) -> None:
+        if not usage:
+            return
+        self.prompt_tokens = (self.prompt_tokens or 0) + usage.get("input_tokens", 0)
+        self.completion_tokens = (self.completion_tokens or 0) + usage.get(
+            "output_tokens", 0
+        )
+
+
+class InstrumentationSink(object):
+    """Base class of destinations of `CallRecord`s."""
+
+    def emit(self, record: CallRecord) -> None:
+        raise NotImplementedError()
+
+
+class CallbackSink(InstrumentationSink):
+    """passes each record to `callback`"""
+
+    def __init__(self, callback: Callable[[CallRecord], None]) -> None:
+        self._callback = callback
+
+    def emit(self, record: CallRecord) -> None:
+        self._callback(record)
+
+
+class CounterSink(InstrumentationSink):
+    """
+    Prometheus-style counters labeled by sampler,
+    e.g. `counters['vm_lcsampler_llm_seconds_total{sampler="ChatModelTextSampler"}']`.
+    """
+
+    _COUNTERS = {
+        "vm_lcsampler_steps_total": lambda r: 1,
+        "vm_lcsampler_llm_calls_total": lambda r: r.num_llm_call,
+        "vm_lcsampler_cached_calls_total": lambda r: r.num_cached_call,
+        "vm_lcsampler_retries_total": lambda r: r.num_retry,
+        "vm_lcsampler_json_repairs_total": lambda r: r.num_repaired,
+        "vm_lcsampler_items_total": lambda r: r.num_item,
+        "vm_lcsampler_prompt_build_seconds_total": lambda r: r.prompt_build_seconds,
+        "vm_lcsampler_queue_wait_seconds_total": lambda r: r.queue_wait_seconds,
+        "vm_lcsampler_llm_seconds_total": lambda r: r.llm_seconds,
+        "vm_lcsampler_parse_seconds_total": lambda r: r.parse_seconds,
+        "vm_lcsampler_prompt_tokens_total": lambda r: r.prompt_tokens or 0,
+        "vm_lcsampler_completion_tokens_total": lambda r: r.completion_tokens or 0,
+        "vm_lcsampler_history_tokens_total": lambda r: r.num_history_tokens,
+        "vm_lcsampler_prefix_tokens_total": lambda r: r.num_prefix_tokens,
+    }
+
+    def __init__(self) -> None:
+        self.counters: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def emit(self, record: CallRecord) -> None:
+        with self._lock:
+            for name, value in self._COUNTERS.items():
+                key = f'{name}{{sampler="{record.sampler}"}}'
+                self.counters[key] = self.counters.get(key, 0) + value(record)
+
+
+class JSONLTraceSink(InstrumentationSink):
+    """appends each record to a JSONL file"""
+
+    def __init__(self, path: str) -> None:
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def emit(self, record: CallRecord) -> None:
+        with self._lock:
+            self._file.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
@@ -0,0 +1,101 @@
+import json
+import re
+from dataclasses import dataclass
+from typing import Any
+
+
+_FENCE_PATTERN = re.compile(r"```[a-zA-Z]*\s*\n?(.*?)(?:```|$)", re.DOTALL)
+_CLOSERS = {"{": "}", "[": "]"}
+_MAX_TRUNCATION = 8
+
+
+@dataclass
+class RepairStats(object):
+    """counters of the local repairs of broken JSON answered as structured outputs"""
+
+    num_attempt: int = 0
+    num_repaired: int = 0
+
+    @property
+    def repair_rate(self) -> float:
+        return self.num_repaired / self.num_attempt if self.num_attempt else 0.0
+
+
+def _scan(text: str) -> tuple[str, list[str], bool]:
+    """
+    Returns `text` without the commas before closers and after the end of the top-level value,
+    the stack of the unclosed brackets, and whether a string is unclosed.
+    """
+    out: list[str] = []
+    stack: list[str] = []
+    in_string = False
+    is_escaped = False
+    for c in text:
+        if in_string:
+            out.append(c)
+            if is_escaped:
+                is_escaped = False
+            elif c == "\\":
+                is_escaped = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in _CLOSERS:
+            stack.append(_CLOSERS[c])
+        elif c in "}]":
+            while out and (out[-1].isspace() or out[-1] == ","):
+                out.pop()
+            if not stack or stack[-1] != c:
+                break
+            stack.pop()
+            out.append(c)
+            if not stack:
+                break
+            continue
+        out.append(c)
+    return "".join(out), stack, in_string
+
+
+def _close(text: str) -> str | None:
+    """
+    closes the unclosed brackets of a truncated `text`,
+    or returns None if its last value may be cut off (an unclosed string or a number)
+    """
+    text, stack, in_string = _scan(text)
+    text = text.rstrip()
+    if in_string or (stack and text[-1:].isdigit()):
+        return None
+    return text.rstrip(",").rstrip() + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Any:
+    """
+    Parses `text` as JSON after cheap local repairs of common breakages of LLM answers:
+    a code fence or a preamble around the value, trailing commas,
+    and a value truncated before its closing brackets.
+    A trailing member which may be cut off (in a string or a number) is dropped,
+    never completed, so that a truncated answer is not taken as a shorter example.
+    Raises `ValueError` if it cannot be repaired.
+    """
+    match = _FENCE_PATTERN.search(text)
+    if match:
+        text = match.group(1)
+    starts = [i for i in (text.find("{"), text.find("[")) if i >= 0]
+    if not starts:
+        raise ValueError(f"No JSON value is found. text: {text!r}")
+    text = text[min(starts) :]
+    for _ in range(_MAX_TRUNCATION):
+        closed = _close(text)
+        if closed is not None:
+            try:
+                return json.loads(closed)
+            except json.JSONDecodeError:
+                pass
+        # drops the last (incomplete) member of a truncated value
+        i_comma = text.rfind(",")
+        if i_comma < 0:
+            break
+        text = text[:i_comma]
+    raise ValueError(f"JSON cannot be repaired. text: {text!r}")
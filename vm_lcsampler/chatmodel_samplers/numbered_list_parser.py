@@ -0,0 +1,83 @@
+import re
+
+
+_FENCE_PATTERN = re.compile(r"^\s*```")
+_NUMBERED_LINE_PATTERN = re.compile(
+    r"^\s*(?:[-*+]\s+)?(?:\*\*)?(\d+)\s*(?:\*\*)?[.):](?:\*\*)?\s*(.*)$"
+)
+
+
+class NumberedListStreamParser(object):
+    """
+    Incremental parser of a numbered list such as `1. foo\\n2. bar`.
+
+    Text is fed piece by piece (e.g. streamed tokens) by `feed`,
+    and each item is returned as `(index, text)` as soon as it is complete,
+    i.e. when the next item, a blank line or the end of text (`close`) arrives.
+    The rules are those of `parse_numbered_list`.
+    """
+
+    def __init__(self, index_list: list[int]) -> None:
+        self._expected = set(index_list)
+        self._seen: set[int] = set()
+        self._buffer = ""
+        self._current_index: int | None = None
+        self._current_lines: list[str] = []
+
+    def feed(self, text: str) -> list[tuple[int, str]]:
+        self._buffer += text
+        *lines, self._buffer = self._buffer.split("\n")
+        items = []
+        for line in lines:
+            items.extend(self._feed_line(line))
+        return items
+
+    def close(self) -> list[tuple[int, str]]:
+        items = self._feed_line(self._buffer)
+        self._buffer = ""
+        return items + self._flush()
+
+    def _feed_line(self, line: str) -> list[tuple[int, str]]:
+        if _FENCE_PATTERN.match(line):
+            return []
+        match = _NUMBERED_LINE_PATTERN.match(line)
+        if match:
+            index = int(match.group(1))
+            if index in self._expected and index not in self._seen:
+                items = self._flush()
+                self._seen.add(index)
+                self._current_index = index
+                self._current_lines = [match.group(2).strip()]
+                return items
+        stripped = line.strip()
+        if not stripped:
+            # a blank line terminates the wrapped lines of the current item
+            return self._flush()
+        if self._current_index is not None:
+            self._current_lines.append(stripped)
+        return []
+
+    def _flush(self) -> list[tuple[int, str]]:
+        items = []
+        text = " ".join(w for w in self._current_lines if w)
+        if self._current_index is not None and text:
+            items.append((self._current_index, text))
+        self._current_index = None
+        self._current_lines = []
+        return items
+
+
+def parse_numbered_list(text: str, index_list: list[int]) -> dict[int, str]:
+    """
+    Parse a numbered list such as `1. foo\\n2. bar` locally without LLM.
+
+    `1.`, `1)`, `1:`, markdown bullets (`- 1. foo`), bold numbers (`**1.** foo`),
+    wrapped lines and stray code fences are handled.
+    A blank line ends the wrapped lines of an item, so trailing remarks are dropped.
+    Only indices in `index_list` are recognized as items, and other lines are
+    regarded as continuation of the previous item (or preamble before the first item).
+    The result may lack some indices of `index_list`, and its order follows `index_list`.
+    """
+    parser = NumberedListStreamParser(index_list)
+    parsed = dict(parser.feed(text) + parser.close())
+    return {index: parsed[index] for index in index_list if index in parsed}
@@ -0,0 +1,165 @@
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Any, Callable
+from langchain_core.messages import BaseMessage
+from .history import estimate_num_tokens
+
+
+class _TokenBucket(object):
+    """bucket refilled by `per_minute / 60` per second up to `burst_seconds` worth of it"""
+
+    def __init__(self, per_minute: float, burst_seconds: float) -> None:
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        # a request larger than the capacity waits for a full bucket and leaves a debt
+        shortage = min(amount, self.capacity) - self.level
+        return shortage / self.rate if shortage > 0 else 0.0
+
+
+class RateLimiter(object):
+    """
+    Token-bucket scheduler of LLM calls under requests-per-minute and tokens-per-minute limits.
+
+    A limiter can be shared by several samplers, threads and async tasks.
+    Before a call, the number of tokens is estimated by `token_counter` on the messages
+    plus `expected_output_tokens`, and the call waits until both buckets have room for it.
+    After the call, the estimate is corrected by `usage_metadata` if available.
+    The buckets hold at most `burst_seconds` worth of the limits, so that calls are spread
+    evenly instead of bursting at the start of every minute.
+    Waiting calls are served in the order of priority (higher first), then of arrival.
+    `num_acquired`, `total_wait_seconds` and `max_wait_seconds` report the queue-wait time.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        burst_seconds: float = 1.0,
+        expected_output_tokens: int = 0,
+        token_counter: Callable[[list[BaseMessage]], int] = estimate_num_tokens,
+        poll_interval: float = 0.01,
+    ) -> None:
+        self._requests = (
+            None
+            if requests_per_minute is None
+            else _TokenBucket(requests_per_minute, burst_seconds)
+        )
+        self._tokens = (
+            None
+            if tokens_per_minute is None
+            else _TokenBucket(tokens_per_minute, burst_seconds)
+        )
+        self._expected_output_tokens = expected_output_tokens
+        self._token_counter = token_counter
+        self._poll_interval = poll_interval
+        self._condition = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self.num_acquired = 0
+        self.total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    @property
+    def average_wait_seconds(self) -> float:
+        return self.total_wait_seconds / self.num_acquired if self.num_acquired else 0.0
+
+    def estimate(self, messages: list[BaseMessage]) -> int:
+        return self._token_counter(messages) + self._expected_output_tokens
+
+    def _try_take(self, ticket: tuple[int, int], num_tokens: int) -> float | None:
+        """Takes from the buckets if `ticket` is the first in the queue and returns 0, otherwise returns the time to wait (None: unknown)."""
+        if self._queue[0] != ticket:
+            return None
+        now = time.monotonic()
+        wait = 0.0
+        if self._requests is not None:
+            self._requests.refill(now)
+            wait = max(wait, self._requests.wait_time(1))
+        if self._tokens is not None:
+            self._tokens.refill(now)
+            wait = max(wait, self._tokens.wait_time(num_tokens))
+        if wait > 0:
+            return wait
+        if self._requests is not None:
+            self._requests.level -= 1
+        if self._tokens is not None:
+            self._tokens.level -= num_tokens
+        heapq.heappop(self._queue)
+        self._condition.notify_all()
+        return 0.0
+
+    def _enqueue(self, priority: int) -> tuple[int, int]:
+        ticket = (-priority, next(self._sequence))
+        heapq.heappush(self._queue, ticket)
+        return ticket
+
+    def _cancel(self, ticket: tuple[int, int]) -> None:
+        if ticket in self._queue:
+            self._queue.remove(ticket)
+            heapq.heapify(self._queue)
+            self._condition.notify_all()
+
+    def _record_wait(self, seconds: float) -> float:
+        with self._condition:
+            self.num_acquired += 1
+            self.total_wait_seconds += seconds
+            self.max_wait_seconds = max(self.max_wait_seconds, seconds)
+        return seconds
+
+    def acquire(self, num_tokens: int = 0, priority: int = 0) -> float:
+        """Waits until a call of `num_tokens` tokens is allowed, and returns the seconds waited."""
+        start = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(priority)
+            try:
+                while True:
+                    wait = self._try_take(ticket, num_tokens)
+                    if wait == 0:
+                        break
+                    self._condition.wait(timeout=wait)
+            except BaseException:
+                self._cancel(ticket)
+                raise
+        return self._record_wait(time.monotonic() - start)
+
+    async def aacquire(self, num_tokens: int = 0, priority: int = 0) -> float:
+        """async version of `acquire`"""
+        start = time.monotonic()
+        with self._condition:
+            ticket = self._enqueue(priority)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_take(ticket, num_tokens)
+                if wait == 0:
+                    break
+                await asyncio.sleep(
+                    self._poll_interval if wait is None else min(wait, 1.0)
+                )
+        except BaseException:
+            with self._condition:
+                self._cancel(ticket)
+            raise
+        return self._record_wait(time.monotonic() - start)
+
+    def settle(self, num_estimated_tokens: int, usage: dict[str, Any] | None) -> None:
+        """corrects the token bucket by the actual usage of a call"""
+        if self._tokens is None or not usage or "total_tokens" not in usage:
+            return
+        with self._condition:
+            self._tokens.level = min(
+                self._tokens.capacity,
+                self._tokens.level + num_estimated_tokens - usage["total_tokens"],
+            )
+            self._condition.notify_all()
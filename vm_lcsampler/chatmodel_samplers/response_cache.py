@@ -0,0 +1,177 @@
+from __future__ import annotations
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from langchain_core.language_models import BaseChatModel
+    from langchain_core.messages import BaseMessage
+
+
+class ResponseCache(object):
+    """
+    Base class of caches of LLM responses.
+    A key is a stable hash of the message list, the model identity and the
+    structured-output schema, and a value is a serialized response.
+    `hits` and `misses` count the lookups.
+    """
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    @classmethod
+    def make_key(
+        cls,
+        messages: list[BaseMessage],
+        llm: BaseChatModel,
+        schema: dict[str, Any] | None = None,
+    ) -> str:
+        # message ids differ between runs, so only types and contents are used.
+        payload = json.dumps(
+            {
+                "messages": [[m.type, m.content] for m in messages],
+                "llm": llm.dict(),
+                "schema": schema,
+            },
+            ensure_ascii=False,
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: str) -> str | None:
+        value = self._lookup(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def update(self, key: str, value: str) -> None:
+        raise NotImplementedError()
+
+    def _lookup(self, key: str) -> str | None:
+        raise NotImplementedError()
+
+
+class InMemoryResponseCache(ResponseCache):
+    """LRU cache in memory bounded by the number of entries and the total size of values"""
+
+    def __init__(self, max_entries: int | None = 10000, max_bytes: int | None = None) -> None:
+        super().__init__()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._num_bytes = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: str) -> str | None:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def update(self, key: str, value: str) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._num_bytes -= len(self._entries.pop(key))
+            self._entries[key] = value
+            self._num_bytes += len(value)
+            while self._entries and (
+                (self._max_entries is not None and len(self._entries) > self._max_entries)
+                or (self._max_bytes is not None and self._num_bytes > self._max_bytes)
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._num_bytes -= len(evicted)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """LRU cache persisted in a SQLite file bounded by the number of entries and the total size of values"""
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int | None = 100000,
+        max_bytes: int | None = None,
+    ) -> None:
+        super().__init__()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_last_access "
+                "ON response_cache (last_access)"
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM response_cache"
+            ).fetchone()[0]
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def _lookup(self, key: str) -> str | None:
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value FROM response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE response_cache SET last_access = ? WHERE key = ?",
+                (time.time(), key),
+            )
+            return row[0]
+
+    def update(self, key: str, value: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO response_cache VALUES (?, ?, ?, ?)",
+                (key, value, len(value), time.time()),
+            )
+            if self._max_entries is not None:
+                self._connection.execute(
+                    "DELETE FROM response_cache WHERE key IN ("
+                    "SELECT key FROM response_cache ORDER BY last_access DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self._max_entries,),
+                )
+            if self._max_bytes is not None:
+                total = self._connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM response_cache"
+                ).fetchone()[0]
+                rows = self._connection.execute(
+                    "SELECT key, size FROM response_cache ORDER BY last_access"
+                )
+                evicted = []
+                for evicted_key, size in rows:
+                    if total <= self._max_bytes:
+                        break
+                    evicted.append((evicted_key,))
+                    total -= size
+                self._connection.executemany(
+                    "DELETE FROM response_cache WHERE key = ?", evicted
+                )
@@ -0,0 +1,83 @@
+import asyncio
+import time
+from typing import Awaitable, Callable, TypeVar
+
+
+_T = TypeVar("_T")
+
+
+_TRANSIENT_ERROR_NAMES = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "InternalServerError",
+    "RateLimitError",
+    "ServiceUnavailableError",
+    "Timeout",
+}
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """
+    Whether `error` is a transient error of a provider (rate limit, timeout, connection or server error).
+    Errors are identified by their class names, so that no provider SDK is required.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return any(cls.__name__ in _TRANSIENT_ERROR_NAMES for cls in type(error).__mro__)
+
+
+class RetryPolicy(object):
+    """
+    Retry with exponential backoff.
+    The n-th retry (n = 0, 1, ...) waits `min(initial_delay * backoff ** n, max_delay)` seconds,
+    and at most `max_retries` retries are made.
+    `is_retryable` decides which errors are retried (default: `is_transient_error`).
+    `num_retry` counts the retries made.
+    """
+
+    def __init__(
+        self,
+        max_retries: int = 3,
+        initial_delay: float = 1.0,
+        backoff: float = 2.0,
+        max_delay: float = 30.0,
+        is_retryable: Callable[[BaseException], bool] = is_transient_error,
+    ) -> None:
+        self.max_retries = max_retries
+        self._initial_delay = initial_delay
+        self._backoff = backoff
+        self._max_delay = max_delay
+        self._is_retryable = is_retryable
+        self.num_retry = 0
+
+    def delay(self, i_retry: int) -> float:
+        return min(self._initial_delay * self._backoff**i_retry, self._max_delay)
+
+    def should_retry(self, error: BaseException, i_retry: int) -> bool:
+        """Whether the `i_retry`-th retry should be made after `error`. Retries are counted if True."""
+        if i_retry >= self.max_retries or not self._is_retryable(error):
+            return False
+        self.num_retry += 1
+        return True
+
+    def call(self, func: Callable[[], _T]) -> _T:
+        i_retry = 0
+        while True:
+            try:
+                return func()
+            except Exception as e:
+                if not self.should_retry(e, i_retry):
+                    raise
+            time.sleep(self.delay(i_retry))
+            i_retry += 1
+
+    async def acall(self, func: Callable[[], Awaitable[_T]]) -> _T:
+        i_retry = 0
+        while True:
+            try:
+                return await func()
+            except Exception as e:
+                if not self.should_retry(e, i_retry):
+                    raise
+            await asyncio.sleep(self.delay(i_retry))
+            i_retry += 1
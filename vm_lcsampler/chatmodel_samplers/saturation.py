@@ -0,0 +1,93 @@
+from collections import Counter
+from dataclasses import dataclass
+from .dedup import normalize_text
+
+
+@dataclass
+class SaturationStats(object):
+    """what `SaturationEstimator` observed in the last job"""
+
+    num_call: int = 0
+    num_item: int = 0
+    num_unique: int = 0
+    novelty: float | None = None
+    estimated_total: float | None = None
+
+    @property
+    def coverage(self) -> float | None:
+        """the fraction of the estimated total already observed"""
+        if not self.estimated_total:
+            return None
+        return self.num_unique / self.estimated_total
+
+
+class SaturationEstimator(object):
+    """
+    Detects that a category has run out of new examples.
+
+    The examples of each LLM call are observed (after `normalize_text`), and `novelty`
+    is the fraction of new ones among the examples of the last `window` calls.
+    The total number of distinct examples of the category is estimated by Chao1,
+    a capture-recapture estimate from the numbers of examples seen once and twice.
+    The job is saturated when the novelty falls below `min_novelty`,
+    or (if `min_coverage` is given) when the observed examples reach `min_coverage`
+    of the estimated total, but not before `min_calls` (default: `window`) calls.
+    An estimator holds the state of one job, so it should not be shared by concurrent jobs.
+    """
+
+    def __init__(
+        self,
+        window: int = 5,
+        min_novelty: float = 0.1,
+        min_calls: int | None = None,
+        min_coverage: float | None = None,
+    ) -> None:
+        if window < 1:
+            raise ValueError(f"window >= 1 must be satisfied. window: {window}")
+        self._window = window
+        self._min_novelty = min_novelty
+        self._min_calls = window if min_calls is None else min_calls
+        self._min_coverage = min_coverage
+        self.reset()
+
+    def reset(self) -> None:
+        """called when a new job starts"""
+        self._counts: Counter[str] = Counter()
+        self._recent: list[tuple[int, int]] = []
+        self.stats = SaturationStats()
+
+    def observe(self, texts: list[str]) -> None:
+        """observes the examples (including duplicates) answered by one LLM call"""
+        num_new = 0
+        for text in texts:
+            key = normalize_text(text)
+            num_new += int(key not in self._counts)
+            self._counts[key] += 1
+        self._recent = [*self._recent, (num_new, len(texts))][-self._window :]
+        num_item = sum(n for _, n in self._recent)
+        self.stats.num_call += 1
+        self.stats.num_item += len(texts)
+        self.stats.num_unique = len(self._counts)
+        self.stats.novelty = (
+            sum(n for n, _ in self._recent) / num_item if num_item else 0.0
+        )
+        self.stats.estimated_total = self._estimate_total()
+
+    def _estimate_total(self) -> float:
+        frequencies = Counter(self._counts.values())
+        f1 = frequencies[1]
+        f2 = frequencies[2]
+        # bias-corrected Chao1, which stays finite when no example is seen twice
+        return len(self._counts) + f1 * (f1 - 1) / (2 * (f2 + 1))
+
+    def is_saturated(self) -> bool:
+        if self.stats.num_call < self._min_calls or self.stats.novelty is None:
+            return False
+        if self.stats.novelty < self._min_novelty:
+            return True
+        coverage = self.stats.coverage
+        return (
+            self._min_coverage is not None
+            and coverage is not None
+            and coverage >= self._min_coverage
+        )
@@ -0,0 +1,263 @@
+"""
+Runs a sampling job split into shards on a process pool.
+
+    vm-lcsampler job.json --num-shard 8 --num-process 4 --output cats.jsonl
+    vm-lcsampler job.json --fake  # offline, with FakeSamplerChatModel
+
+The job spec is a JSON object:
+
+    {
+        "sampler": "enumerator",  // "enumerator", "text" or "structure"
+        "category_name": "cat breeds",
+        "category_description": null,
+        "schema": "my_module:Person",  // "structure" only
+        "few_shot_file": "few_shots.json",  // JSON list of texts (objects for "structure")
+        "exclude": [],  // examples which must not be generated
+        "num_target": 1000,
+        "chunk_size": 20,  // "enumerator" and "structure"
+        "dedup_key_fields": ["name"],  // "structure" only (default: all fields)
+        "num_shard": 4,
+        "model": {"model": "gpt-4o-mini", "model_provider": "openai", "seed": 0}
+    }
+
+Each shard is an independent conversation with its share of the target, its share
+of the few-shots, and an exclusion list of `exclude` and the few-shots of the other shards.
+`seed` of the model (or `offset` of the fake model) is shifted by the shard.
+The shards are written to `<output>.shard-<i>.jsonl` and merged into `<output>`
+with duplicates across shards removed by the same key as within a shard,
+and `<output>.manifest.json` describes the run.
+"""
+
+import argparse
+import itertools
+import json
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Iterator
+from . import VERSION
+
+
+def _create_llm(model: dict[str, Any], shard: int, offset: int) -> Any:
+    config = dict(model)
+    provider = config.pop("model_provider", None)
+    if provider == "fake":
+        from .fake_chat_model import FakeSamplerChatModel
+
+        return FakeSamplerChatModel(offset=offset, **config)
+
+    from langchain.chat_models import init_chat_model
+
+    if "seed" in config:
+        config["seed"] += shard
+    return init_chat_model(config.pop("model"), model_provider=provider, **config)
+
+
+def _split(num: int, num_shard: int, shard: int) -> int:
+    """the share of `shard` when `num` is split into `num_shard`"""
+    return num // num_shard + int(shard < num % num_shard)
+
+
+def _describe(description: str | None, exclusions: list[str]) -> str | None:
+    if not exclusions:
+        return description
+    return "\n".join(
+        [
+            *([description] if description else []),
+            "Do not give any of the following examples:",
+            *[f"- {exclusion}" for exclusion in exclusions],
+        ]
+    )
+
+
+def _iter_shard(spec: dict[str, Any], shard: int) -> Iterator[Any]:
+    """runs the sampler of `shard` and yields its items"""
+    from .chatmodel_samplers import (
+        ChatModelChunkedTextEnumerator,
+        ChatModelStructureSampler,
+        ChatModelTextSampler,
+        DedupIndex,
+    )
+    from .chatmodel_samplers.checkpoint import import_object
+
+    num_shard = spec["num_shard"]
+    num_target = _split(spec["num_target"], num_shard, shard)
+    sampler_name = spec.get("sampler", "enumerator")
+    chunk_size = spec.get("chunk_size", 20)
+    few_shots: list[Any] = []
+    if spec.get("few_shot_file"):
+        with open(spec["few_shot_file"], encoding="utf-8") as f:
+            few_shots = json.load(f)
+    shard_few_shots = few_shots[shard::num_shard]
+    exclusions = [
+        *spec.get("exclude", []),
+        *[
+            str(few_shot)
+            for i, few_shot in enumerate(few_shots)
+            if i % num_shard != shard
+        ],
+    ]
+    description = _describe(spec.get("category_description"), exclusions)
+    llm = _create_llm(spec["model"], shard, offset=shard * spec["num_target"])
+    dedup = DedupIndex()
+    for exclusion in exclusions:
+        dedup.add(exclusion)
+    kwargs: dict[str, Any] = {
+        "dedup": dedup,
+        "max_duplicate_retries": spec.get("max_duplicate_retries"),
+    }
+
+    if sampler_name == "text":
+        yield from ChatModelTextSampler(llm, **kwargs).generate(
+            spec["category_name"], description, shard_few_shots, num_target
+        )
+    elif sampler_name == "structure":
+        schema = import_object(spec["schema"])
+        yield from ChatModelStructureSampler(
+            llm,
+            chunk_size=chunk_size,
+            dedup_key_fields=spec.get("dedup_key_fields"),
+            **kwargs,
+        ).generate(
+            spec["category_name"],
+            description,
+            schema,
+            [schema.parse_obj(obj) for obj in shard_few_shots],
+            num_target,
+        )
+    elif sampler_name == "enumerator":
+        num_few_shot_chunk = len(shard_few_shots) // chunk_size
+        yield from itertools.islice(
+            ChatModelChunkedTextEnumerator(llm, **kwargs).generate(
+                spec["category_name"],
+                description,
+                chunk_size,
+                -(-num_target // chunk_size),
+                [
+                    shard_few_shots[i * chunk_size : (i + 1) * chunk_size]
+                    for i in range(num_few_shot_chunk)
+                ],
+            ),
+            num_target,
+        )
+    else:
+        raise ValueError(f"Unknown sampler: {sampler_name}")
+
+
+def run_shard(spec: dict[str, Any], shard: int, path: str) -> dict[str, Any]:
+    """runs `shard` of the job and writes its items to `path` (in a worker process)"""
+    from .chatmodel_samplers import JSONLDatasetWriter
+
+    start = time.perf_counter()
+    error = None
+    with JSONLDatasetWriter(
+        path, metadata={"shard": shard, "category": spec["category_name"]}
+    ) as writer:
+        try:
+            writer.write_all(_iter_shard(spec, shard))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return {
+        "shard": shard,
+        "path": path,
+        "num_target": _split(spec["num_target"], spec["num_shard"], shard),
+        "num_row": writer.num_row,
+        "seconds": time.perf_counter() - start,
+        "error": error,
+    }
+
+
+def _dedup_key(row: dict[str, Any], key_fields: list[str] | None) -> str:
+    """the key of `row` as `dedup_key_fields` of `ChatModelStructureSampler`"""
+    if key_fields is None and set(row) == {"text"}:
+        return row["text"]
+    if key_fields is not None:
+        row = {name: row[name] for name in key_fields}
+    return json.dumps(row, ensure_ascii=False, sort_keys=True, default=str)
+
+
+def merge_shards(
+    shard_paths: list[str], output: str, key_fields: list[str] | None = None
+) -> tuple[int, int]:
+    """
+    merges the shards into `output` without duplicates on the values of `key_fields`
+    (default: the text or all fields), and returns the numbers of the rows and the duplicates
+    """
+    from .chatmodel_samplers import DedupIndex, JSONLDatasetWriter
+
+    dedup = DedupIndex()
+    num_duplicate = 0
+    with JSONLDatasetWriter(output) as writer:
+        for path in shard_paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    row = json.loads(line)
+                    if not dedup.add(_dedup_key(row, key_fields)):
+                        num_duplicate += 1
+                        continue
+                    writer.write(row)
+    return writer.num_row, num_duplicate
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="vm-lcsampler", description=(__doc__ or "").strip().partition("\n")[0]
+    )
+    parser.add_argument("job", help="JSON file of the job spec")
+    parser.add_argument("--output", default=None, help="JSONL file (default: spec)")
+    parser.add_argument("--num-shard", type=int, default=None)
+    parser.add_argument("--num-process", type=int, default=None)
+    parser.add_argument(
+        "--fake", action="store_true", help="use FakeSamplerChatModel instead of `model`"
+    )
+    parser.add_argument("--fake-latency", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    with open(args.job, encoding="utf-8") as f:
+        spec = json.load(f)
+    spec["num_shard"] = args.num_shard or spec.get("num_shard", 1)
+    if args.fake:
+        spec["model"] = {"model_provider": "fake", "latency": args.fake_latency}
+    output = args.output or spec.get("output")
+    if output is None:
+        parser.error("--output is required if the spec has no `output`")
+
+    start = time.perf_counter()
+    shard_paths = [f"{output}.shard-{i}.jsonl" for i in range(spec["num_shard"])]
+    with ProcessPoolExecutor(max_workers=args.num_process) as executor:
+        shards = list(
+            executor.map(
+                run_shard,
+                itertools.repeat(spec),
+                range(spec["num_shard"]),
+                shard_paths,
+            )
+        )
+    num_row, num_duplicate = merge_shards(
+        shard_paths,
+        output,
+        spec.get("dedup_key_fields") if spec.get("sampler") == "structure" else None,
+    )
+    manifest = {
+        "version": VERSION,
+        "spec": spec,
+        "output": output,
+        "num_row": num_row,
+        "num_duplicate": num_duplicate,
+        "seconds": time.perf_counter() - start,
+        "shards": shards,
+    }
+    with open(f"{output}.manifest.json", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    for shard in shards:
+        print(
+            f"shard {shard['shard']}: {shard['num_row']}/{shard['num_target']} rows "
+            f"in {shard['seconds']:.1f}s"
+            + (f", error: {shard['error']}" if shard["error"] else "")
+        )
+    print(f"{output}: {num_row} rows ({num_duplicate} duplicates removed)")
+    sys.exit(1 if any(shard["error"] for shard in shards) else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Callable, Iterator, Sequence, Type
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForLLMRun,
+    CallbackManagerForLLMRun,
+)
+from langchain_core.language_models import BaseChatModel, LanguageModelInput
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import BaseModel
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+
+_RANGE_PATTERN = re.compile(r"from (\d+) to (\d+)")
+_MISSING_PATTERN = re.compile(r"following numbers: ([\d, ]+)")
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]|\n\s*")
+_NUMBERED_LINE_PATTERN = re.compile(r"^\s*(\d+)[.)]\s*(.*)$")
+
+
+class FakeSamplerChatModel(BaseChatModel):
+    """
+    Offline chat model which answers the prompts of the samplers in this package.
+
+    The answers are deterministic and unique within a conversation,
+    so that the samplers can be run without any API key (e.g. in examples and benchmarks).
+    `latency` seconds of sleep is added to every call to simulate a network round-trip,
+    and `token_latency` seconds per token (whitespace-separated word) to simulate decoding.
+    Streaming yields the answer token by token.
+    `usage_metadata` counts words, punctuations and line breaks of the prompt and the answer,
+    and is attached to the last chunk in streaming.
+    `offset` is added to the numbers in the texts of the answers (not to the indices),
+    so that models of different offsets give different examples.
+    If `num_distinct` is given, the numbers in the texts of plain answers are taken modulo it,
+    so that the model runs out of new examples as for a closed category.
+    """
+
+    latency: float = 0.0
+    token_latency: float = 0.0
+    offset: int = 0
+    num_distinct: int | None = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-sampler-chat-model"
+
+    def bind_tools(
+        self,
+        tools: Sequence[dict[str, Any] | Type[BaseModel] | Callable | BaseTool],
+        **kwargs: Any,
+    ) -> Runnable[LanguageModelInput, BaseMessage]:
+        kwargs.pop("tool_choice", None)
+        return self.bind(tools=[convert_to_openai_tool(t) for t in tools], **kwargs)
+
+    def _generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._with_usage(messages, self._respond(messages, **kwargs))
+        time.sleep(
+            self._call_latency() + self.token_latency * len(self._tokenize(message))
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        message = self._with_usage(messages, self._respond(messages, **kwargs))
+        await asyncio.sleep(
+            self._call_latency() + self.token_latency * len(self._tokenize(message))
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        message = self._with_usage(messages, self._respond(messages, **kwargs))
+        time.sleep(self._call_latency())
+        for message_chunk in self._to_chunks(message):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=message_chunk)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        message = self._with_usage(messages, self._respond(messages, **kwargs))
+        await asyncio.sleep(self._call_latency())
+        for message_chunk in self._to_chunks(message):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=message_chunk)
+
+    def _call_latency(self) -> float:
+        """the seconds of a call before its first token"""
+        return self.latency
+
+    @classmethod
+    def _tokenize(cls, message: AIMessage) -> list[str]:
+        if message.tool_calls:
+            return json.dumps(message.tool_calls).split(" ")
+        return re.findall(r"\S+\s*|\s+", str(message.content))
+
+    @classmethod
+    def _count_tokens(cls, text: str) -> int:
+        """words, punctuations and line breaks (with indents), roughly as many as BPE tokens"""
+        return len(_TOKEN_PATTERN.findall(text))
+
+    @classmethod
+    def _with_usage(cls, messages: list[BaseMessage], message: AIMessage) -> AIMessage:
+        input_tokens = sum(cls._count_tokens(str(m.content)) for m in messages)
+        output_tokens = cls._count_tokens(
+            json.dumps(message.tool_calls) if message.tool_calls else str(message.content)
+        )
+        message.usage_metadata = {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+        return message
+
+    @classmethod
+    def _to_chunks(cls, message: AIMessage) -> list[AIMessageChunk]:
+        message_chunks = cls._to_content_chunks(message)
+        message_chunks[-1].usage_metadata = message.usage_metadata
+        return message_chunks
+
+    @classmethod
+    def _to_content_chunks(cls, message: AIMessage) -> list[AIMessageChunk]:
+        if message.tool_calls:
+            return [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {
+                            "name": tool_call["name"],
+                            "args": json.dumps(tool_call["args"]),
+                            "id": tool_call["id"],
+                            "index": i,
+                        }
+                        for i, tool_call in enumerate(message.tool_calls)
+                    ],
+                )
+            ]
+        return [AIMessageChunk(content=token) for token in cls._tokenize(message)] or [
+            AIMessageChunk(content="")
+        ]
+
+    def _respond(
+        self,
+        messages: list[BaseMessage],
+        tools: list[dict[str, Any]] | None = None,
+        **kwargs: Any,
+    ) -> AIMessage:
+        number = sum(isinstance(m, AIMessage) for m in messages) + 1
+        last_text = str(messages[-1].content)
+
+        if tools:
+            function = tools[0]["function"]
+            numbers = self._requested_numbers(last_text) or [number]
+            args = {
+                name: self._fake_value(name, prop, number, numbers, self.offset)
+                for name, prop in function["parameters"].get("properties", {}).items()
+            }
+            # the arguments are also given as the raw text, as by OpenAI
+            return AIMessage(
+                "",
+                additional_kwargs={
+                    "tool_calls": [
+                        {
+                            "id": f"call_{number}",
+                            "type": "function",
+                            "function": {
+                                "name": function["name"],
+                                "arguments": json.dumps(args, ensure_ascii=False),
+                            },
+                        }
+                    ]
+                },
+                tool_calls=[
+                    {"name": function["name"], "args": args, "id": f"call_{number}"}
+                ],
+            )
+
+        if isinstance(messages[0], SystemMessage) and "parse a raw text" in str(
+            messages[0].content
+        ):
+            parsed = {}
+            for line in last_text.splitlines():
+                match = _NUMBERED_LINE_PATTERN.match(line)
+                if match:
+                    parsed[match.group(1)] = match.group(2)
+            return AIMessage(json.dumps(parsed, ensure_ascii=False))
+
+        requested = self._requested_numbers(last_text)
+        if requested:
+            return AIMessage(
+                "\n".join([f"{i}. example {self._text_number(i)}" for i in requested])
+            )
+
+        return AIMessage(f"example {self._text_number(number)}")
+
+    def _text_number(self, number: int) -> int:
+        number += self.offset
+        return number if self.num_distinct is None else number % self.num_distinct
+
+    @classmethod
+    def _requested_numbers(cls, text: str) -> list[int] | None:
+        """numbers requested by the enumerator (`from X to Y`) or its recovery turn"""
+        match = _RANGE_PATTERN.search(text)
+        if match:
+            return list(range(int(match.group(1)), int(match.group(2)) + 1))
+        match = _MISSING_PATTERN.search(text)
+        if match:
+            return [int(i) for i in re.findall(r"\d+", match.group(1))]
+        return None
+
+    @classmethod
+    def _fake_value(
+        cls,
+        name: str,
+        prop: dict[str, Any],
+        number: int,
+        numbers: list[int] | None = None,
+        offset: int = 0,
+    ) -> Any:
+        """an array of objects has an element for each of `numbers`"""
+        type_ = prop.get("type")
+        if type_ == "integer":
+            return number
+        if type_ == "number":
+            return float(number)
+        if type_ == "boolean":
+            return number % 2 == 0
+        if type_ == "array":
+            properties = prop.get("items", {}).get("properties")
+            if not properties or not numbers:
+                return []
+            return [
+                {
+                    key: cls._fake_value(key, p, i, offset=offset)
+                    for key, p in properties.items()
+                }
+                for i in numbers
+            ]
+        if type_ == "object":
+            return {}
+        return f"{name} {number + offset}"